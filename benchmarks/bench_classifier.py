@@ -0,0 +1,63 @@
+"""Micro-benchmark for clipboard classification throughput.
+
+Compares the compiled single-pass Classifier with the previous three
+uncompiled re.match calls and prints MB/s for several clip shapes.
+
+    python benchmarks/bench_classifier.py
+"""
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from classifier import Classifier  # noqa: E402
+
+TARGET_BYTES = 20 * 1024 * 1024  # Input processed per measurement
+
+
+def legacy_categorize(content):
+    """The original ClipboardMonitor.categorize_content."""
+    if re.match(r'^[\d\-\+\/\.\,]+$', content):
+        return "Numbers"
+    elif re.match(r'^(http|https)://', content):
+        return "URLs"
+    elif re.match(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$', content):
+        return "Emails"
+    else:
+        return "Text"
+
+
+SAMPLES = {
+    "short text": "Meeting notes for Tuesday",
+    "url": "https://example.com/path?query=1",
+    "email": "someone@example.com",
+    "number 1 KB": "1234567890," * 93,
+    "text 64 KB": "lorem ipsum dolor sit amet " * 2427,
+    "numbers 4 MB": "1234567890." * 381300,
+    "log dump 4 MB": "2024-01-01 12:00:00 INFO something happened\n" * 95325,
+}
+
+
+def measure(function, sample):
+    """Return MB/s of function over TARGET_BYTES of sample."""
+    repeat = max(1, TARGET_BYTES // len(sample))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(sample)
+    elapsed = time.perf_counter() - start
+    return repeat * len(sample) / elapsed / (1024 * 1024)
+
+
+def main():
+    classifier = Classifier()
+    print(f"{'input':<16}{'legacy MB/s':>14}{'classifier MB/s':>18}")
+    for name, sample in SAMPLES.items():
+        legacy = measure(legacy_categorize, sample)
+        compiled = measure(classifier.classify, sample)
+        print(f"{name:<16}{legacy:>14.1f}{compiled:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""Benchmark suite for capture, classification, history updates and UI refresh.
+
+Runs headless on Qt's offscreen platform. A FakeClipboardSource stands in for
+the system clipboard and feeds a real daemon, history store and both
+front-ends, all in a temporary directory. Every history size is measured in
+its own process so large histories do not skew the smaller runs.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json
+
+With --baseline, metrics that got worse by more than --tolerance are reported
+and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from classifier import Classifier  # noqa: E402
+from history_container import ClipboardHistory  # noqa: E402
+from history_model import ENTRY_ROLE  # noqa: E402
+from history_store import HistoryStore, make_entry  # noqa: E402
+from ingest import MIN_NOTIFY_INTERVAL  # noqa: E402
+from near_duplicates import VariantIndex, band_keys, set_variant_key  # noqa: E402
+
+SIZES = [100, 10_000, 100_000]  # Stored history entries
+REPEAT = 20  # Timed calls per measurement
+TOLERANCE = 0.25  # Allowed slowdown against the baseline
+VISIBLE_TIMEOUT = 5  # Seconds to wait for a copied clip to show up
+
+TIMESTAMP = "2024-01-01 12:00:00"
+SEED_TEXTS = [
+    "note {i} about the quarterly report",
+    "https://example.com/items/{i}",
+    "{i}",
+    "user{i}@example.com",
+]
+CATEGORIZE_SAMPLES = [
+    "Meeting notes for Tuesday",
+    "https://example.com/path?query=1",
+    "someone@example.com",
+    "+49 (0) 30 1234567",
+    "1234567890," * 93,
+    "def main():\n    return 0\n",
+    "lorem ipsum dolor sit amet " * 40,
+    "2024-01-01",
+]
+
+
+def metric(value, unit="ms", better="lower", p95=None):
+    result = {"value": round(value, 4), "unit": unit, "better": better}
+    if p95 is not None:
+        result["p95"] = round(p95, 4)
+    return result
+
+
+def timing(durations):
+    """Return the metric for a list of durations in milliseconds."""
+    durations = sorted(durations)
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    return metric(statistics.median(durations), p95=p95)
+
+
+def time_calls(function, repeat=REPEAT):
+    """Return the durations of repeated function() calls in milliseconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def seed_text(i):
+    return SEED_TEXTS[i % len(SEED_TEXTS)].format(i=i)
+
+
+# --- Measurements without Qt ---
+
+def bench_categorize(classifier):
+    clips = CATEGORIZE_SAMPLES * 5000
+    start = time.perf_counter()
+    for clip in clips:
+        classifier.categorize(clip)
+    elapsed = time.perf_counter() - start
+    return {"categorize": metric(len(clips) / elapsed, "clips/s", "higher")}
+
+
+def bench_history_add(size):
+    """ClipboardHistory.add() on a full history of the given size."""
+    history = ClipboardHistory(max_entries=size)
+    for i in range(size):
+        history.add(seed_text(i), "Text", TIMESTAMP)
+    texts = iter(f"new clip {i}" for i in range(REPEAT * 10))
+    durations = time_calls(lambda: history.add(next(texts), "Text", TIMESTAMP), REPEAT * 10)
+    return {f"history_add[{size}]": timing(durations)}
+
+
+def paragraph(words, rng):
+    return " ".join(rng.choice(words) for _ in range(rng.randint(12, 60)))
+
+
+def bench_variant_lookup(directory, size):
+    """Near-duplicate lookup of an edited clip in a store of the given size, past the in-memory cache."""
+    rng = random.Random(size)
+    words = [
+        "".join(rng.choice("etaoinshrdlucmfwypvbg") for _ in range(rng.randint(3, 9))) for _ in range(5000)
+    ]
+    store = HistoryStore(Path(directory) / "variants.db", batch_size=1000)
+    texts = []
+    items = []
+    for _ in range(size):
+        text = paragraph(words, rng)
+        entry = make_entry(text, "Text", TIMESTAMP)
+        signature = set_variant_key(entry, text)
+        texts.append(text)
+        items.append((entry, text, None, (signature, band_keys(signature)) if signature else None))
+    store.add_entries(items)
+    store.flush()
+
+    index = VariantIndex(store)
+    durations = []
+    for text in rng.sample(texts, REPEAT * 5):
+        words_of_text = text.split()
+        words_of_text[rng.randrange(len(words_of_text))] += "s"  # A small edit
+        edited = " ".join(words_of_text)
+        entry = make_entry(edited, "Text", TIMESTAMP)
+        signature = set_variant_key(entry, edited)
+        start = time.perf_counter()
+        index.find(entry, signature)
+        durations.append((time.perf_counter() - start) * 1000)
+    store.close()
+    return {f"variant_lookup[{size}]": timing(durations)}
+
+
+# --- Measurements against the daemon and both front-ends ---
+
+def seed_store(path, size, classifier):
+    store = HistoryStore(path, batch_size=1000)
+    for i in range(size):
+        text = seed_text(i)
+        store.add_entry(make_entry(text, classifier.categorize(text), TIMESTAMP), text)
+    store.close()
+
+
+def wait_until(app, condition, timeout=VISIBLE_TIMEOUT):
+    """Process events until condition() holds; returns False on timeout."""
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        app.processEvents()
+    return True
+
+
+def bench_update_clipboard_history(app, size):
+    """Tray app row update with the given number of listed entries."""
+    app.history_model.set_entries(
+        make_entry(seed_text(i), "Text", TIMESTAMP) for i in range(size)
+    )
+    durations = []
+    for i in range(REPEAT * 5):
+        entry = make_entry(f"new clip {i}", "Text", TIMESTAMP)
+        evicted = [app.history_model.index(size - 1).data(ENTRY_ROLE)["digest"]]
+        start = time.perf_counter()
+        app.update_clipboard_history(entry, None, evicted)
+        durations.append((time.perf_counter() - start) * 1000)
+    return {f"update_clipboard_history[{size}]": timing(durations)}
+
+
+def bench_copy_to_visible(app, window, source):
+    """Time from a clip being copied until both front-ends list it."""
+    tray, history_window = [], []
+    for i in range(REPEAT):
+        text = f"latency probe {i}"
+        start = time.perf_counter()
+        source.set_text(text)
+        if not wait_until(app, lambda: app.history_model.index(0).data() == text):
+            raise RuntimeError("Copied clip did not show up in the tray app")
+        tray.append((time.perf_counter() - start) * 1000)
+        if not wait_until(app, lambda: window.view_stack.currentWidget().model().index(0, 0).data().endswith(text)):
+            raise RuntimeError("Copied clip did not show up in the history window")
+        history_window.append((time.perf_counter() - start) * 1000)
+        time.sleep(MIN_NOTIFY_INTERVAL * 1.5)  # Stay clear of notification coalescing
+    return {"copy_to_visible.tray": timing(tray), "copy_to_visible.window": timing(history_window)}
+
+
+def run_worker(size):
+    """Measure everything that depends on the history size; returns the metrics."""
+    import clipboard_history
+    import clipboard_history_V2
+    from clipboard_daemon import ClipboardDaemon
+    from clipboard_sources import FakeClipboardSource
+    from ipc_client import DaemonClient
+
+    classifier = Classifier()
+    metrics = bench_history_add(size)
+
+    with tempfile.TemporaryDirectory(prefix="clipboard-bench-") as directory:
+        db_path = Path(directory) / "history.db"
+        socket_path = Path(directory) / "daemon.sock"
+        seed_store(db_path, size, classifier)
+        metrics.update(bench_variant_lookup(directory, size))
+
+        source = FakeClipboardSource()
+        daemon = ClipboardDaemon(
+            socket_path, store=HistoryStore(db_path), source=source, classifier=classifier
+        )
+        daemon.start()
+        try:
+            app = clipboard_history_V2.SystemTrayApp("", client=DaemonClient(socket_path))
+            if not wait_until(app, lambda: app.history_ready):
+                raise RuntimeError("Tray app did not load the history")
+            app.ensure_menu_content()
+            window = clipboard_history.ClipboardHistoryApp(client=DaemonClient(socket_path))
+            window.show()
+
+            metrics.update(bench_update_clipboard_history(app, size))
+            metrics[f"update_clipboard_history_ui[{size}]"] = timing(
+                time_calls(app.update_clipboard_history_ui)
+            )
+            app.search_query = "report"
+            metrics[f"search_refresh[{size}]"] = timing(time_calls(app.update_clipboard_history_ui))
+            app.search_query = ""
+
+            categories = ["All"] + classifier.categories
+            durations = []
+            for category in categories * (REPEAT // len(categories) + 1):
+                start = time.perf_counter()
+                window.switch_category(category)
+                app.processEvents()
+                durations.append((time.perf_counter() - start) * 1000)
+            metrics[f"switch_category[{size}]"] = timing(durations)
+            window.switch_category("All")
+
+            for name, value in bench_copy_to_visible(app, window, source).items():
+                metrics[f"{name}[{size}]"] = value
+
+            window.close()
+            app.quit_app()
+        finally:
+            daemon.stop()
+    return metrics
+
+
+# --- Driver ---
+
+def run_sizes(sizes):
+    metrics = {}
+    for size in sizes:
+        print(f"Measuring {size} entries...", file=sys.stderr)
+        process = subprocess.run(
+            [sys.executable, __file__, "--worker", str(size)], capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            sys.stderr.write(process.stderr)
+            raise SystemExit(f"Benchmark for {size} entries failed")
+        metrics.update(json.loads(process.stdout.splitlines()[-1]))
+    return metrics
+
+
+def compare(metrics, baseline, tolerance):
+    """Print the change against baseline; returns the names of regressed metrics."""
+    regressions = []
+    print(f"\n{'metric':<40}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, current in metrics.items():
+        previous = baseline.get(name)
+        if previous is None or not previous["value"] or not current["value"]:
+            continue
+        # Positive means worse, whichever direction is better for the metric
+        if current["better"] == "lower":
+            change = current["value"] / previous["value"] - 1
+        else:
+            change = previous["value"] / current["value"] - 1
+        flag = "  REGRESSION" if change > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<40}{previous['value']:>12.3f}{current['value']:>12.3f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clipboard app benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="history sizes to measure")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed relative slowdown")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_worker(args.worker)))
+        return
+
+    metrics = bench_categorize(Classifier())
+    metrics.update(run_sizes(args.sizes))
+
+    print(f"{'metric':<40}{'value':>12}  unit")
+    for name, value in metrics.items():
+        print(f"{name:<40}{value['value']:>12.3f}  {value['unit']}")
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": args.sizes,
+        "metrics": metrics,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["metrics"]
+        regressions = compare(metrics, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
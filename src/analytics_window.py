@@ -0,0 +1,102 @@
+"""Window showing the copy statistics and storage use of the clipboard history.
+
+Everything shown is read from the rollup tables kept by the daemon (see
+compaction), so the window opens at once whatever the size of the history.
+"""
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QFontDatabase
+from PyQt6.QtWidgets import QHBoxLayout, QPlainTextEdit, QPushButton, QVBoxLayout, QWidget
+
+from ipc_client import DaemonError
+
+BAR_WIDTH = 40  # Characters of the longest bar
+COMPACT_REFRESH_DELAY = 2000  # Milliseconds before showing the figures of a compaction
+
+
+def format_size(size):
+    """Return a byte count in the largest fitting unit."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_bars(rows):
+    """Return lines of labels, bars proportional to the counts and counts for (label, count) rows."""
+    if not rows:
+        return ["  (none)"]
+    width = max(len(label) for label, _ in rows)
+    largest = max(count for _, count in rows) or 1
+    return [
+        f"  {label:<{width}}  {'#' * round(count * BAR_WIDTH / largest):<{BAR_WIDTH}}  {count}"
+        for label, count in rows
+    ]
+
+
+def format_analytics(analytics):
+    """Return the statistics returned by the daemon as text."""
+    lines = [
+        f"Copies recorded: {analytics['copies']} ({format_size(analytics['bytes'])})",
+        f"Entries stored:  {analytics['entries']}",
+        f"Database:        {format_size(analytics['database_bytes'])} "
+        f"(+{format_size(analytics['free_bytes'])} free)",
+        f"Blob files:      {format_size(analytics['blob_bytes'])}",
+        f"Last compaction: {analytics['last_compaction'] or 'never'}",
+        "",
+        "Copies per category",
+    ]
+    lines += format_bars([(row["category"], row["copies"]) for row in analytics["categories"]])
+    lines += ["", f"Copies per day, last {len(analytics['days'])} days"]
+    lines += format_bars([(row["day"], row["copies"]) for row in analytics["days"]])
+    lines += ["", "Copies per hour of the day"]
+    lines += format_bars([(f"{hour:02d}:00", copies) for hour, copies in enumerate(analytics["hours"])])
+    lines += ["", "Most copied link domains"]
+    lines += format_bars([(row["source"], row["copies"]) for row in analytics["sources"]])
+    return "\n".join(lines)
+
+
+class AnalyticsWindow(QWidget):
+    """Plain-text view of the copy statistics, refreshed when shown."""
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.setWindowTitle("Clipboard Analytics")
+        self.resize(700, 700)
+
+        layout = QVBoxLayout(self)
+        self.text_view = QPlainTextEdit()
+        self.text_view.setReadOnly(True)
+        self.text_view.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        layout.addWidget(self.text_view)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        self.compact_button = QPushButton("Compact Now")
+        self.compact_button.setToolTip("Apply the retention limits and reclaim space now")
+        self.compact_button.clicked.connect(self.compact)
+        buttons.addWidget(self.compact_button)
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.refresh)
+        buttons.addWidget(refresh_button)
+        layout.addLayout(buttons)
+
+    def showEvent(self, event):
+        self.refresh()
+        super().showEvent(event)
+
+    def refresh(self):
+        try:
+            text = format_analytics(self.client.analytics())
+        except DaemonError as e:
+            text = f"Clipboard analytics unavailable: {e}"
+        self.text_view.setPlainText(text)
+
+    def compact(self):
+        """Have the daemon compact the history, then show the new figures."""
+        try:
+            self.client.compact()
+        except DaemonError as e:
+            self.text_view.setPlainText(f"Could not compact the clipboard history: {e}")
+            return
+        QTimer.singleShot(COMPACT_REFRESH_DELAY, self.refresh)
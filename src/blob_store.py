@@ -0,0 +1,125 @@
+"""Content-addressed storage for large clipboard payloads.
+
+Each payload is stored once, zlib-compressed, in a file named after its
+digest. History entries only keep the digest and a short preview; the payload
+is read back, through a memory map, when it is actually needed.
+
+With a cipher (see history_crypto), files are named after keyed digests and
+the compressed stream is written as a sequence of sealed frames, each
+prefixed with its length. The last frame is sealed as such, so a truncated
+blob fails to open instead of returning partial data.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+_FRAME_LENGTH = struct.Struct(">I")
+
+
+class BlobStore:
+    """Directory of compressed blobs keyed by content digest."""
+
+    def __init__(self, root, cipher=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cipher = cipher
+
+    def _name(self, digest):
+        return self.cipher.index_digest(digest) if self.cipher is not None else digest
+
+    def _path(self, digest):
+        name = self._name(digest)
+        return self.root / name[:2] / name[2:]
+
+    @staticmethod
+    def _frame_id(name, index, last):
+        """Associated data binding a frame to its blob and position."""
+        return f"{name}:{index}{':last' if last else ''}".encode("ascii")
+
+    def _frame(self, name, index, data, last):
+        record = self.cipher.seal(data, self._frame_id(name, index, last), compress=False)
+        return _FRAME_LENGTH.pack(len(record)) + record
+
+    def __contains__(self, digest):
+        return self._path(digest).exists()
+
+    def put(self, digest, data):
+        """Store data under digest unless it is already present."""
+        path = self._path(digest)
+        if path.exists():
+            return
+        path.parent.mkdir(exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial blob
+        compressor = zlib.compressobj()
+        view = memoryview(data)
+        name = self._name(digest)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                index = 0
+                for start in range(0, len(view), CHUNK_SIZE):
+                    chunk = compressor.compress(view[start : start + CHUNK_SIZE])
+                    if self.cipher is None:
+                        file.write(chunk)
+                    elif chunk:
+                        file.write(self._frame(name, index, chunk, last=False))
+                        index += 1
+                chunk = compressor.flush()
+                if self.cipher is None:
+                    file.write(chunk)
+                else:
+                    file.write(self._frame(name, index, chunk, last=True))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def get(self, digest):
+        """Return the data stored under digest; raises FileNotFoundError if missing."""
+        with open(self._path(digest), "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if self.cipher is None:
+                    return zlib.decompress(mapped)
+                return self._open_frames(self._name(digest), mapped)
+
+    def _open_frames(self, name, mapped):
+        decompressor = zlib.decompressobj()
+        parts = []
+        offset = index = 0
+        while offset < len(mapped):
+            (length,) = _FRAME_LENGTH.unpack_from(mapped, offset)
+            offset += _FRAME_LENGTH.size
+            record = mapped[offset : offset + length]
+            offset += length
+            frame_id = self._frame_id(name, index, last=offset >= len(mapped))
+            parts.append(decompressor.decompress(self.cipher.open(record, frame_id)))
+            index += 1
+        if index == 0:
+            raise ValueError("Empty encrypted blob")
+        return b"".join(parts)
+
+    def files(self):
+        """Yield (name, path) of every file, where name is what the file of a blob is named after."""
+        for directory in self.root.iterdir():
+            if directory.is_dir() and len(directory.name) == 2:
+                for path in directory.iterdir():
+                    yield directory.name + path.name, path
+
+    def delete_file(self, name):
+        """Remove the file named after name, as yielded by files()."""
+        try:
+            (self.root / name[:2] / name[2:]).unlink()
+        except FileNotFoundError:
+            pass
+
+    def delete(self, digest):
+        """Remove the blob stored under digest, if any."""
+        try:
+            self._path(digest).unlink()
+        except FileNotFoundError:
+            pass
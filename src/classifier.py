@@ -0,0 +1,103 @@
+"""Clipboard content classification.
+
+All rules are compiled into a single pattern of optional lookaheads anchored at
+the start of the clip, so one regex call reports every matching category.
+Rules that must match the whole clip are skipped for clips longer than
+MAX_CLASSIFY_LENGTH; the remaining prefix rules only look at the start.
+
+User-defined categories are read from a JSON file such as:
+
+    {"categories": [{"name": "Tickets", "pattern": "[A-Z]+-\\\\d+"},
+                     {"name": "GitHub", "pattern": "https://github\\\\.com/",
+                      "whole": false}]}
+"""
+import json
+import logging
+import re
+from pathlib import Path
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = Path.home() / ".clipboard_app" / "categories.json"
+DEFAULT_CATEGORY = "Text"
+# Categories of non-text clips, assigned by the kind of clip rather than by rules
+MEDIA_CATEGORIES = {"image": "Images", "files": "Files"}
+MAX_CLASSIFY_LENGTH = 64 * 1024  # Characters
+
+BUILTIN_RULES = [
+    # (name, pattern, whole): whole rules must match the entire clip
+    ("Numbers", r"[\d\-\+\/\.\,]+", True),  # Majority numbers and separators
+    ("URLs", r"(http|https)://", False),
+    ("Emails", r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+", True),
+]
+
+
+def load_rules(config_path=DEFAULT_CONFIG_PATH):
+    """Return the user-defined rules from config_path followed by the built-in rules."""
+    rules = []
+    try:
+        with open(config_path, encoding="utf-8") as file:
+            config = json.load(file)
+    except FileNotFoundError:
+        config = {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read categories from {config_path}: {e}")
+        config = {}
+
+    for category in config.get("categories", []):
+        try:
+            name, pattern = category["name"], category["pattern"]
+            re.compile(pattern)
+        except (KeyError, TypeError, re.error) as e:
+            logger.warning(f"Skipping invalid category {category!r}: {e}")
+            continue
+        rules.append((name, pattern, category.get("whole", True)))
+
+    return rules + BUILTIN_RULES
+
+
+class Classifier:
+    """Single-pass, multi-label clip classifier."""
+
+    def __init__(self, rules=BUILTIN_RULES, max_length=MAX_CLASSIFY_LENGTH):
+        self.rules = list(rules)
+        self.max_length = max_length
+        self.categories = list(dict.fromkeys(
+            [DEFAULT_CATEGORY] + [name for name, _, _ in self.rules] + list(MEDIA_CATEGORIES.values())
+        ))
+
+        # One pattern for regular clips and one with only the prefix rules for huge ones
+        self._matcher, self._groups = self._compile(self.rules)
+        self._prefix_matcher, self._prefix_groups = self._compile(
+            [rule for rule in self.rules if not rule[2]]
+        )
+
+    @staticmethod
+    def _compile(rules):
+        parts = []
+        for index, (_, pattern, whole) in enumerate(rules):
+            end = "$" if whole else ""
+            parts.append(f"(?=(?P<r{index}>(?:{pattern}){end}))?")
+        matcher = re.compile("".join(parts))
+        # (group number, category) pairs; user patterns may add their own groups
+        groups = [(matcher.groupindex[f"r{index}"], rule[0]) for index, rule in enumerate(rules)]
+        return matcher, groups
+
+    def classify(self, content):
+        """Return the matching categories, most specific first; never empty."""
+        if len(content) > self.max_length:
+            matcher, groups = self._prefix_matcher, self._prefix_groups
+            content = content[: self.max_length]
+        else:
+            matcher, groups = self._matcher, self._groups
+
+        match = matcher.match(content)
+        labels = [name for number, name in groups if match.start(number) >= 0]
+        return list(dict.fromkeys(labels)) or [DEFAULT_CATEGORY]
+
+    @timed("categorize")
+    def categorize(self, content):
+        """Return the primary category of content."""
+        return self.classify(content)[0]
@@ -0,0 +1,691 @@
+"""Headless clipboard daemon.
+
+The daemon owns clipboard capture and the history store; the Qt front-ends
+are thin clients that talk to it over a Unix domain socket (see ipc_client).
+Requests and responses are JSON objects, one per line:
+
+    {"op": "recent"}                                   -> {"ok": true, "entries": [...]}
+    {"op": "query", "category": "URLs", "before_id": 120, "limit": 200}
+    {"op": "search", "query": "foo", "category": null, "prefix": false, "limit": 50}
+    {"op": "categories"}                               -> {"ok": true, "categories": [...]}
+    {"op": "paste", "digest": "...", "insert": false}  -> {"ok": true}
+    {"op": "copy", "text": "...", "secret": true}      -> {"ok": true}
+    {"op": "pick", "query": "foo", "limit": 50}        -> {"ok": true, "entries": [...], "complete": true}
+    {"op": "versions", "digest": "..."}                -> {"ok": true, "entries": [...]}
+    {"op": "text", "digest": "...", "limit": 2000}     -> {"ok": true, "text": "...", "truncated": false}
+    {"op": "metrics"}                                  -> {"ok": true, "metrics": {...}}
+    {"op": "thumbnail", "digest": "..."}               -> {"ok": true, "thumbnail": "<base64 PNG>"}
+    {"op": "export", "path": "...", "format": "jsonl"} -> {"ok": true, "count": 1200}
+    {"op": "import", "path": "..."}                    -> {"ok": true, "imported": 1100,
+                                                           "duplicates": 100, "skipped": 0}
+    {"op": "snippets", "query": "sig", "folder": null, "tag": null, "limit": 50}
+                                                       -> {"ok": true, "snippets": [...]}
+    {"op": "snippet_folders"}                          -> {"ok": true, "folders": [...], "tags": [...]}
+    {"op": "snippet", "key": "..."}                    -> {"ok": true, "snippet": {...}}
+    {"op": "save_snippet", "snippet": {...}}           -> {"ok": true, "snippet": {...}}
+    {"op": "delete_snippet", "key": "..."}             -> {"ok": true}
+    {"op": "pin", "digest": "...", "folder": null}     -> {"ok": true, "snippet": {...}}
+    {"op": "paste_snippet", "key": "...", "insert": false} -> {"ok": true}
+    {"op": "analytics", "days": 14}                    -> {"ok": true, "analytics": {...}}
+    {"op": "compact"}                                  -> {"ok": true}
+    {"op": "subscribe"}                                -> {"ok": true}, followed by
+        {"event": "updates", "updates": [{"entry": {...}, "replaced": {...} | null,
+                                          "evicted": ["digest", ...]}]}
+        for every batch of new entries and
+        {"event": "expired", "expired": [{"digest": "...", "masked": {...} | null}]}
+        when sensitive entries are purged (masked is null) or masked, or
+        entries are removed by the compaction job, until the client disconnects.
+
+"pick" ranks the whole history for the quick-paste picker by frecency and
+fuzzy match (see frecency); while complete is false, asking again with the
+same query improves the results. Pasting a clip counts as a visit for the
+ranking; the clipboard is written in the background (see paste_back) and,
+with insert, the clip is pasted into the focused window as well. "copy"
+puts text on the clipboard without recording it, as the password generator
+does. "versions" lists the stored versions of a clip whose near-duplicates
+were grouped under one entry (see near_duplicates), newest first. "export"
+and "import" read and write the file at an absolute path themselves (see
+history_io).
+
+Snippets (see snippets) are looked up by keyword, name or content with
+"snippets"; like entries, the listed ones only hold a preview of their body
+and "snippet" returns one in full. "save_snippet" creates a snippet, or
+updates the one with the key it names. "pin" turns a text clip of the history
+into a snippet. "paste_snippet" fills in the placeholders of a snippet, with
+the newest clip for {clipboard}, and writes the result like "copy" without
+recording it.
+
+A compaction job (see compaction) bounds the stored history by the retention
+settings in ~/.clipboard_app/retention.json and keeps the statistics that
+"analytics" returns for the last days; "compact" runs it right away instead
+of at the next interval.
+
+Started with --sync HOST:PORT (or CLIPBOARD_APP_SYNC_SERVER set), the daemon
+also replicates the history with other devices through a sync server (see
+history_sync).
+
+"query" and "search" do not wait for the store's writer: the first page and
+the search results include the clips it has not committed yet.
+
+Entries sent to clients only hold a preview of PREVIEW_LENGTH characters of
+their text, plus the one-line label shown in lists; "clipped" is true when
+the text is longer, which "text" returns in full (or up to limit characters).
+
+Failed requests are answered with {"ok": false, "error": "..."}.
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+
+import compaction
+import metrics
+from classifier import Classifier, load_rules
+from clipboard_sources import PollingClipboardSource, create_clipboard_source
+from expiry import ExpiryScheduler
+from frecency import PICK_LIMIT, FrecencyIndex, entry_frecency, visit_score
+from history_container import ClipboardHistory
+from history_crypto import KEY_PATH, PASSPHRASE_ENV, UnlockError, unlock
+from history_io import export_history, import_history, import_records
+from history_store import PREVIEW_LENGTH, SEARCH_LIMIT, HistoryStore
+from history_sync import HistorySync
+from ingest import IngestPipeline
+from ipc_client import DEFAULT_SOCKET_PATH, PAGE_SIZE, encode_message
+from near_duplicates import VariantIndex
+from paste_back import PasteBack
+from sensitive import SensitiveDetector, load_settings, masked_entry
+from snippets import SNIPPET_LIMIT, SnippetLibrary
+from sync_client import parse_address
+
+logger = logging.getLogger(__name__)
+
+RANKING_BATCH = 1000  # Stored entries added to the quick-paste ranking at a time
+SYNC_SERVER_ENV = "CLIPBOARD_APP_SYNC_SERVER"  # Default sync server, also for spawned daemons
+ACTIVITY_OPS = {"paste", "copy", "paste_snippet"}  # Requests after which the clipboard is polled quickly
+
+
+def client_entry(entry):
+    """Return entry as sent to clients, with a preview of its text."""
+    text = entry["text"]
+    return {**entry, "text": text[:PREVIEW_LENGTH], "clipped": entry["in_blob"] or len(text) > PREVIEW_LENGTH}
+
+
+def client_entries(entries):
+    return [client_entry(entry) for entry in entries]
+
+
+def merge_entries(newer, older, limit):
+    """Return the entries of newer, then those of older with other digests, up to limit."""
+    digests = {entry["digest"] for entry in newer}
+    return (newer + [entry for entry in older if entry["digest"] not in digests])[:limit]
+
+
+def client_snippet(snippet):
+    """Return snippet as listed to clients, with a preview of its body."""
+    body = snippet["body"]
+    return {**snippet, "body": body[:PREVIEW_LENGTH], "clipped": len(body) > PREVIEW_LENGTH}
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        super().server_bind()
+        os.chmod(self.server_address, 0o600)  # Clipboard history is private
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.clipboard_daemon
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self.wfile.write(encode_message({"ok": False, "error": "Invalid JSON"}))
+                continue
+
+            if request.get("op") == "subscribe":
+                daemon.add_subscriber(self.wfile)
+                # Keep the connection until the client hangs up
+                for _ in self.rfile:
+                    pass
+                daemon.remove_subscriber(self.wfile)
+                return
+
+            self.wfile.write(encode_message(daemon.handle_request(request)))
+
+
+class ClipboardDaemon:
+    """Captures the clipboard and serves the history to clients."""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, store=None, source=None, classifier=None,
+                 sensitive_settings=None, sync_address=None, retention_settings=None):
+        self.socket_path = Path(socket_path)
+        self.store = store if store is not None else HistoryStore()
+        self.thumbnails = self.store.thumbnails
+        self.classifier = classifier if classifier is not None else Classifier(load_rules())
+
+        # Sensitive clips are purged or masked once their TTL has passed
+        settings = sensitive_settings if sensitive_settings is not None else load_settings()
+        self.detector = SensitiveDetector(settings["patterns"])
+        self.expiry_action = settings["action"]
+        self.expiry = ExpiryScheduler(self._expire, span=settings["ttl"])
+
+        # Ranking of the whole history for the quick-paste picker, loaded in the background
+        self.ranking = FrecencyIndex()
+        self._ranking_loader = None
+        self._stopping = False
+
+        history = ClipboardHistory()
+        history.load(self.store.load_page())
+        self.pipeline = IngestPipeline(
+            self.store, history, self.classifier, self._broadcast_updates,
+            detector=self.detector, expiry=self.expiry, ttl=settings["ttl"], ranking=self.ranking,
+            variants=VariantIndex(self.store),
+        )
+
+        self.source = source if source is not None else create_clipboard_source()
+        self.source.subscribe(self.pipeline.submit)
+        self.paste_back = PasteBack(self.source, self.store)
+        self.snippets = SnippetLibrary(self.store)
+        self.compaction = compaction.CompactionJob(self.store, self._forget, retention_settings)
+
+        # Replication with other devices, when a sync server is given as (host, port)
+        self.sync = HistorySync(self.store, sync_address, self._apply_remote) if sync_address else None
+
+        self._subscribers = {}  # wfile -> lock serializing writes to it
+        self._subscribers_lock = threading.Lock()
+        self._server = None
+        self._register_gauges()
+
+    def _register_gauges(self):
+        pipeline = self.pipeline
+        metrics.REGISTRY.gauge("clips.captured", lambda: pipeline.captured)
+        metrics.REGISTRY.gauge("clips.deduplicated", lambda: pipeline.deduplicated)
+        metrics.REGISTRY.gauge("clips.dropped", lambda: pipeline.dropped)
+        metrics.REGISTRY.gauge("clips.sensitive", lambda: pipeline.sensitive)
+        metrics.REGISTRY.gauge("clips.near_duplicates", lambda: pipeline.near_duplicates)
+        metrics.REGISTRY.gauge("expiry.pending", lambda: len(self.expiry))
+        metrics.REGISTRY.gauge("ranking.entries", lambda: len(self.ranking))
+        metrics.REGISTRY.gauge("ingest.backlog", pipeline.backlog)
+        metrics.REGISTRY.gauge("history.entries", lambda: len(pipeline.history))
+        metrics.REGISTRY.gauge("history.text_bytes", lambda: pipeline.history.total_bytes)
+        metrics.REGISTRY.gauge("store.failed_writes", lambda: self.store.failed_writes)
+        metrics.REGISTRY.gauge("subscribers", lambda: len(self._subscribers))
+        metrics.REGISTRY.gauge("paste.written", lambda: self.paste_back.written)
+        metrics.REGISTRY.gauge("paste.coalesced", lambda: self.paste_back.coalesced)
+        metrics.REGISTRY.gauge("paste.inserted", lambda: self.paste_back.inserted)
+        metrics.REGISTRY.gauge("snippets", lambda: len(self.snippets))
+        metrics.REGISTRY.gauge("compaction.runs", lambda: self.compaction.runs)
+        metrics.REGISTRY.gauge("compaction.removed", lambda: self.compaction.removed)
+        metrics.REGISTRY.gauge("compaction.merged", lambda: self.compaction.merged)
+        metrics.REGISTRY.gauge("compaction.blobs_removed", lambda: self.compaction.blobs_removed)
+        metrics.REGISTRY.gauge("compaction.last_ms", lambda: round(self.compaction.last_duration, 1))
+        if isinstance(self.source, PollingClipboardSource):
+            metrics.REGISTRY.gauge("poll.rate", lambda: round(self.source.poll_rate(), 3))
+            metrics.REGISTRY.gauge("poll.interval", lambda: self.source.interval)
+        if self.sync is not None:
+            sync = self.sync
+            metrics.REGISTRY.gauge("sync.connected", lambda: int(sync.connected))
+            metrics.REGISTRY.gauge("sync.pending", lambda: sync.pending)
+            metrics.REGISTRY.gauge("sync.pushed", lambda: sync.pushed)
+            metrics.REGISTRY.gauge("sync.pulled", lambda: sync.pulled)
+            metrics.REGISTRY.gauge("sync.bytes_sent", lambda: sync.client.bytes_sent)
+            metrics.REGISTRY.gauge("sync.bytes_received", lambda: sync.client.bytes_received)
+
+    def start(self):
+        """Start capturing and serving; raises RuntimeError if another daemon is running."""
+        self._remove_stale_socket()
+
+        newest = next(iter(self.pipeline.snapshot()), None)
+        self.source.last_text = self.store.full_text(newest) if newest else ""
+        # Entries that expired while the daemon was not running go on the first tick
+        for entry in self.store.expiring_entries():
+            self.expiry.schedule(entry["digest"], entry["expires_at"])
+        self.expiry.start()
+        self.pipeline.start()
+        self.source.start()
+        self.paste_back.start()
+        self._load_ranking()
+        threading.Thread(target=self.snippets.load, name="snippet-loader", daemon=True).start()
+        self.compaction.start()
+        if self.sync is not None:
+            self.sync.start()
+
+        self._server = _Server(str(self.socket_path), _RequestHandler)
+        self._server.clipboard_daemon = self
+        threading.Thread(target=self._server.serve_forever, name="daemon-server", daemon=True).start()
+        logger.info(f"Clipboard daemon listening on {self.socket_path}")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+        self.paste_back.stop()
+        self.compaction.stop()
+        self.source.stop()
+        self.pipeline.stop()
+        self.expiry.stop()
+        if self.sync is not None:
+            self.sync.stop()
+        self._stopping = True
+        if self._ranking_loader is not None:
+            self._ranking_loader.join()
+        self.store.close()
+
+    def _remove_stale_socket(self):
+        if not self.socket_path.exists():
+            self.socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except OSError:
+            self.socket_path.unlink()  # Left behind by a daemon that did not shut down
+        else:
+            raise RuntimeError(f"Clipboard daemon already running at {self.socket_path}")
+        finally:
+            probe.close()
+
+    def handle_request(self, request):
+        """Answer a single request dict."""
+        op = request.get("op")
+        if op in ACTIVITY_OPS:
+            # Someone is working with the clipboard, so a copy is likely to follow
+            self.source.notify_activity()
+        try:
+            if op == "recent":
+                return {"ok": True, "entries": client_entries(self.pipeline.snapshot())}
+            if op == "query":
+                entries = self._load_page(
+                    request.get("category"), request.get("before_id"), request.get("limit") or PAGE_SIZE
+                )
+                return {"ok": True, "entries": client_entries(entries)}
+            if op == "search":
+                entries = self._search(
+                    request["query"], request.get("category"), bool(request.get("prefix")),
+                    request.get("limit") or SEARCH_LIMIT,
+                )
+                return {"ok": True, "entries": client_entries(entries)}
+            if op == "categories":
+                return {"ok": True, "categories": self.classifier.categories}
+            if op == "metrics":
+                return {"ok": True, "metrics": metrics.REGISTRY.snapshot()}
+            if op == "paste":
+                entry = self._find_entry(request["digest"])
+                if entry is None:
+                    return {"ok": False, "error": "Unknown entry"}
+                self.paste_back.paste(entry, bool(request.get("insert")))
+                self._record_paste(entry)
+                return {"ok": True}
+            if op == "copy":
+                self.paste_back.copy_text(request["text"], bool(request.get("secret")))
+                return {"ok": True}
+            if op == "pick":
+                digests, complete = self.ranking.rank(
+                    request.get("query") or "", request.get("limit") or PICK_LIMIT
+                )
+                entries = [entry for entry in map(self._find_entry, digests) if entry is not None]
+                return {"ok": True, "entries": client_entries(entries), "complete": complete}
+            if op == "versions":
+                entry = self._find_entry(request["digest"])
+                if entry is None:
+                    return {"ok": False, "error": "Unknown entry"}
+                self.store.flush()
+                return {"ok": True, "entries": client_entries(self.store.versions(entry))}
+            if op == "text":
+                entry = self._find_entry(request["digest"])
+                if entry is None:
+                    return {"ok": False, "error": "Unknown entry"}
+                text = self.store.full_text(entry)
+                limit = request.get("limit")
+                truncated = limit is not None and len(text) > limit
+                return {"ok": True, "text": text[:limit] if truncated else text, "truncated": truncated}
+            if op == "thumbnail":
+                entry = self._find_entry(request["digest"])
+                if entry is None or not (entry.get("mime") or "").startswith("image/"):
+                    return {"ok": False, "error": "No image entry"}
+                return {"ok": True, "thumbnail": self._thumbnail(entry)}
+            if op == "export":
+                try:
+                    count = export_history(self.store, request["path"], request.get("format"))
+                except (OSError, ValueError) as e:
+                    return {"ok": False, "error": f"Export failed: {e}"}
+                return {"ok": True, "count": count}
+            if op == "import":
+                try:
+                    counts = import_history(self.store, request["path"], self.classifier, self.detector)
+                except (OSError, ValueError) as e:
+                    return {"ok": False, "error": f"Import failed: {e}"}
+                # Imported entries are the newest rows now
+                with self.pipeline.history_lock:
+                    self.pipeline.history.load(self.store.load_page())
+                self._load_ranking()
+                return {"ok": True, **counts}
+            if op == "snippets":
+                snippets = self.snippets.lookup(
+                    request.get("query") or "", request.get("folder"), request.get("tag"),
+                    request.get("limit") or SNIPPET_LIMIT,
+                )
+                return {"ok": True, "snippets": [client_snippet(snippet) for snippet in snippets]}
+            if op == "snippet_folders":
+                return {"ok": True, "folders": self.snippets.folders(), "tags": self.snippets.tags()}
+            if op == "snippet":
+                snippet = self.snippets.get(request["key"])
+                if snippet is None:
+                    return {"ok": False, "error": "Unknown snippet"}
+                return {"ok": True, "snippet": snippet}
+            if op == "save_snippet":
+                try:
+                    snippet = self.snippets.save(request["snippet"])
+                except ValueError as e:
+                    return {"ok": False, "error": str(e)}
+                return {"ok": True, "snippet": snippet}
+            if op == "delete_snippet":
+                if not self.snippets.delete(request["key"]):
+                    return {"ok": False, "error": "Unknown snippet"}
+                return {"ok": True}
+            if op == "pin":
+                entry = self._find_entry(request["digest"])
+                if entry is None:
+                    return {"ok": False, "error": "Unknown entry"}
+                if entry["expires_at"] is not None or (entry.get("mime") or "").startswith("image/"):
+                    return {"ok": False, "error": "Only text clips that are not sensitive can be pinned"}
+                snippet = self.snippets.pin(self.store.full_text(entry), folder=request.get("folder"))
+                return {"ok": True, "snippet": snippet}
+            if op == "paste_snippet":
+                with self.pipeline.history_lock:
+                    newest = next(iter(self.pipeline.history), None)
+                text = self.snippets.expand(request["key"], self.store.full_text(newest) if newest else "")
+                if text is None:
+                    return {"ok": False, "error": "Unknown snippet"}
+                self.paste_back.copy_text(text, insert=bool(request.get("insert")))
+                return {"ok": True}
+            if op == "analytics":
+                self.store.flush()  # Count the clips that are not committed yet
+                days = request.get("days") or compaction.ANALYTICS_DAYS
+                return {"ok": True, "analytics": compaction.analytics(self.store, days)}
+            if op == "compact":
+                self.compaction.run_now()
+                return {"ok": True}
+        except (KeyError, TypeError) as e:
+            return {"ok": False, "error": f"Invalid request: {e}"}
+        except Exception as e:
+            logger.exception(f"Could not handle {op} request")
+            return {"ok": False, "error": str(e)}
+        return {"ok": False, "error": f"Unknown operation: {op}"}
+
+    def _queued_entries(self, category, matches=None):
+        """Return the entries the store has not committed yet, newest first, that matches(text) accepts."""
+        return [
+            entry for entry, text in self.store.queued_entries()
+            if (category is None or entry["category"] == category) and (matches is None or matches(text))
+        ]
+
+    def _load_page(self, category, before_id, limit):
+        """Return a page of stored entries; the first one includes the clips not committed yet."""
+        entries = self.store.load_page(category, before_id, limit)
+        if before_id is not None:
+            return entries
+        entries = merge_entries(self._queued_entries(category), entries, limit)
+        if entries and "id" not in entries[-1]:
+            # Pages end with a stored entry, which the next one starts from
+            self.store.flush()
+            return self.store.load_page(category, None, limit)
+        return entries
+
+    def _search(self, query, category, prefix, limit):
+        """Return the entries containing query, those not committed yet included; see HistoryStore.search()."""
+        if not query:
+            return []
+        needle = query.casefold()
+        queued = self._queued_entries(
+            category, lambda text: text.casefold().startswith(needle) if prefix else needle in text.casefold()
+        )
+        return merge_entries(queued, self.store.search(query, category, prefix, limit), limit)
+
+    def _find_entry(self, digest):
+        with self.pipeline.history_lock:
+            entry = self.pipeline.history.get(digest)
+        return entry if entry is not None else self.store.get_entry(digest)
+
+    def _record_paste(self, entry):
+        """Count a paste as a visit of the clip in the quick-paste ranking."""
+        if entry.get("superseded"):
+            return  # Earlier versions of a clip are not ranked
+        previous = self.ranking.score(entry["digest"])
+        frecency = visit_score(time.time(), previous if previous is not None else entry_frecency(entry))
+        with self.pipeline.history_lock:
+            held = self.pipeline.history.get(entry["digest"])
+            if held is not None:
+                held["frecency"] = frecency
+        entry = {**entry, "frecency": frecency}
+        self.ranking.add(entry)
+        self.store.set_frecency(entry)
+
+    def _load_ranking(self):
+        """Add the stored entries missing from the quick-paste ranking, in a background thread."""
+        if self._ranking_loader is not None:
+            self._ranking_loader.join()  # Loaded again after an import
+        self._ranking_loader = threading.Thread(
+            target=self._run_ranking_loader, name="ranking-loader", daemon=True
+        )
+        self._ranking_loader.start()
+
+    def _run_ranking_loader(self):
+        start = time.perf_counter()
+        batch = []
+        for entry in self.store.iter_entries(RANKING_BATCH):
+            if self._stopping:
+                return
+            if entry["superseded"]:
+                continue
+            batch.append(entry)
+            if len(batch) >= RANKING_BATCH:
+                self.ranking.add_entries(batch)
+                batch = []
+        self.ranking.add_entries(batch)
+        elapsed = (time.perf_counter() - start) * 1000
+        logger.info(f"Ranked {len(self.ranking)} clipboard entries in {elapsed:.0f} ms")
+
+    def _thumbnail(self, entry):
+        """Return the encoded thumbnail of an image entry, making it on first use."""
+        from thumbnails import make_thumbnail
+
+        key = entry["payload"]
+        if key in self.thumbnails:
+            data = self.thumbnails.get(key)
+        else:
+            data = make_thumbnail(self.store.payload(entry))
+            self.thumbnails.put(key, data)
+        return base64.b64encode(data).decode("ascii")
+
+    def _expire(self, digests):
+        """Purge or mask sensitive entries whose TTL has passed (expiry thread)."""
+        expired = []
+        for digest in digests:
+            masked = None
+            with self.pipeline.history_lock:
+                entry = self.pipeline.history.get(digest)
+                if entry is not None and (entry["expires_at"] or 0) > time.time():
+                    continue  # Copied again meanwhile and rescheduled
+                if entry is not None:
+                    if self.expiry_action == "mask":
+                        masked = masked_entry(entry)
+                        self.pipeline.history.replace(digest, masked)
+                    else:
+                        self.pipeline.history.remove(digest)
+            if entry is None:
+                entry = self.store.get_entry(digest)  # No longer held in memory
+                if entry is None:
+                    continue
+                if self.expiry_action == "mask":
+                    masked = masked_entry(entry)
+
+            if masked is not None:
+                self.store.mask_entry(entry, masked)
+            else:
+                self.store.remove_entry(entry)
+            self.ranking.remove(digest)
+            expired.append({"digest": digest, "masked": client_entry(masked) if masked is not None else None})
+
+        if expired:
+            logger.info(f"Expired {len(expired)} sensitive clipboard entries")
+            self._broadcast(encode_message({"event": "expired", "expired": expired}))
+
+    def _forget(self, entries):
+        """Drop the entries removed by the compaction job from memory and the clients (compaction thread)."""
+        removed = []
+        for entry in entries:
+            if entry["superseded"] or self.store.get_entry(entry["digest"]) is not None:
+                continue  # Not listed, or a newer copy of the clip is still stored
+            with self.pipeline.history_lock:
+                self.pipeline.history.remove(entry["digest"])
+            self.ranking.remove(entry["digest"])
+            removed.append({"digest": entry["digest"], "masked": None})
+        if removed:
+            logger.info(f"Removed {len(removed)} clipboard entries past the retention limits")
+            self._broadcast(encode_message({"event": "expired", "expired": removed}))
+
+    def add_subscriber(self, wfile):
+        lock = threading.Lock()
+        with lock:
+            with self._subscribers_lock:
+                self._subscribers[wfile] = lock
+            wfile.write(encode_message({"ok": True}))
+
+    def remove_subscriber(self, wfile):
+        with self._subscribers_lock:
+            self._subscribers.pop(wfile, None)
+
+    def _apply_remote(self, records):
+        """Add the clips pulled from other devices (sync thread)."""
+        self.store.flush()  # Clips captured meanwhile are not added twice
+        counts = import_records(self.store, records, self.classifier, self.detector, self._add_remote_batch)
+        if counts["imported"]:
+            logger.info(f"Added {counts['imported']} clipboard entries from other devices")
+
+    def _add_remote_batch(self, entries):
+        """Show a committed batch of pulled clips in memory, the ranking and the clients (sync thread)."""
+        with self.pipeline.history_lock:
+            updates = [self.pipeline.history.add_entry(entry) for entry in entries]
+        self.ranking.add_entries(entries)
+        self._broadcast(self._updates_message(updates))
+
+    def _broadcast_updates(self):
+        updates = self.pipeline.take_updates()
+        if not updates:
+            return
+        if self.sync is not None:
+            # New clips only; a clip copied again is already on the other devices
+            self.sync.record([
+                entry["digest"] for entry, replaced, _ in updates
+                if entry["expires_at"] is None and (replaced is None or replaced["digest"] != entry["digest"])
+            ])
+        self._broadcast(self._updates_message(updates))
+
+    def _updates_message(self, updates):
+        return encode_message({
+            "event": "updates",
+            "updates": [
+                {
+                    "entry": client_entry(entry),
+                    "replaced": client_entry(replaced) if replaced is not None else None,
+                    "evicted": [old_entry["digest"] for old_entry in evicted],
+                }
+                for entry, replaced, evicted in updates
+            ],
+        })
+
+    def _broadcast(self, message):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers.items())
+        for wfile, lock in subscribers:
+            try:
+                with lock:
+                    wfile.write(message)
+            except OSError:
+                self.remove_subscriber(wfile)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clipboard history daemon")
+    parser.add_argument("--socket", default=str(DEFAULT_SOCKET_PATH), help="Unix socket path")
+    parser.add_argument(
+        "--encrypt", action="store_true",
+        help=f"encrypt the history at rest with the passphrase in {PASSPHRASE_ENV} (the key is kept once created)",
+    )
+    parser.add_argument(
+        "--sync", metavar="HOST:PORT", default=os.environ.get(SYNC_SERVER_ENV),
+        help=f"replicate the history with other devices through this sync server (default: ${SYNC_SERVER_ENV})",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    # A windowless Qt application gives access to clipboard change events
+    try:
+        from PyQt6.QtCore import QSocketNotifier
+        from PyQt6.QtGui import QGuiApplication
+        app = QGuiApplication(sys.argv)
+    except ImportError:
+        app = None
+
+    metrics.dump_at_exit("daemon")
+    cipher = None
+    try:
+        if args.encrypt or KEY_PATH.exists():
+            start = time.perf_counter()
+            cipher = unlock(create=args.encrypt)
+            logger.info(f"Unlocked the clipboard history in {(time.perf_counter() - start) * 1000:.0f} ms")
+        store = HistoryStore(cipher=cipher)
+    except UnlockError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    sync_address = parse_address(args.sync) if args.sync else None
+    daemon = ClipboardDaemon(args.socket, store=store, sync_address=sync_address)
+    try:
+        daemon.start()
+    except RuntimeError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    stopped = threading.Event()
+
+    def request_stop(*_):
+        stopped.set()
+        if app is not None:
+            app.quit()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    if app is not None:
+        # Qt's event loop only gives Python handlers a chance to run when an
+        # event arrives, so signals are forwarded through a socket it watches
+        wakeup_reader, wakeup_writer = socket.socketpair()
+        wakeup_writer.setblocking(False)
+        signal.set_wakeup_fd(wakeup_writer.fileno())
+        notifier = QSocketNotifier(wakeup_reader.fileno(), QSocketNotifier.Type.Read)
+        notifier.activated.connect(lambda: wakeup_reader.recv(64))
+        app.exec()
+    else:
+        stopped.wait()
+
+    daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,58 @@
 import sys
-import time
-import pyperclip
-import re
 import random
 import string
-from datetime import datetime
 from PyQt6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QListWidget, QLabel, QMessageBox, QListWidgetItem, QFrame, QSlider, QDialog
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QListView, QLabel, QMessageBox, QFrame, QSlider, QDialog,
+    QLineEdit, QStackedWidget, QMenu
 )
-from PyQt6.QtCore import QThread, pyqtSignal, Qt
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal, Qt
+
+import metrics
+from analytics_window import AnalyticsWindow
+from history_model import (
+    ENTRY_ROLE,
+    SEARCH_DELAY,
+    SEARCH_TOOLTIP,
+    TOOLTIP_LENGTH,
+    ClipboardHistoryModel,
+)
+from history_transfer import HistoryTransfer
+from ipc_client import PAGE_SIZE, RELOAD_THRESHOLD, DaemonClient, DaemonError
+from metrics_window import MetricsWindow
+from snippet_editor import SnippetEditor
+from thumbnails import ThumbnailLoader
+
+VERSION_PREVIEW_LENGTH = 60  # Characters of a version shown in the versions menu
 
 
-class ClipboardMonitor(QThread):
-    """Thread that monitors the clipboard."""
-    new_clipboard_entry = pyqtSignal(str, str)  # Signal sends entry text and category
+class ClipboardMonitor(QObject):
+    """Receives new clipboard entries from the clipboard daemon."""
+    entries_available = pyqtSignal()  # Coalesced signal, collect entries with take_updates()
 
-    def __init__(self):
+    def __init__(self, client):
         super().__init__()
-        self.running = False
-        self.last_text = ""
-
-    def run(self):
-        self.running = True
-        while self.running:
-            current_text = pyperclip.paste()
-            if current_text != self.last_text and current_text:
-                self.last_text = current_text
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                category = self.categorize_content(current_text)
-                self.new_clipboard_entry.emit(f"{timestamp} - {current_text}", category)
-
-                clipboard_history["All"].append({"text": current_text, "timestamp": timestamp})
-                clipboard_history[category].append({"text": current_text, "timestamp": timestamp})
-            
-            time.sleep(0.5)
+        self.client = client
+
+    def start(self):
+        self.client.subscribe(self.entries_available.emit)
 
     def stop(self):
-        self.running = False
-        self.wait()
-
-    def categorize_content(self, content):
-        """Categorize the clipboard content into categories like 'Numbers', 'URLs', 'Emails', and 'Text'."""
-        if re.match(r'^[\d\-\+\/\.\,]+$', content):  # Majority numbers and separators
-            return "Numbers"
-        elif re.match(r'^(http|https)://', content):
-            return "URLs"
-        elif re.match(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$', content):
-            return "Emails"
-        else:
-            return "Text"
+        self.client.close()
+
+    def take_updates(self):
+        """Return the (entry, replaced, evicted digests) updates since the last call."""
+        return self.client.take_updates()
+
+    def take_expired(self):
+        """Return the (digest, masked entry or None) of sensitive entries expired since the last call."""
+        return self.client.take_expired()
 
 
 class PasswordGeneratorDialog(QDialog):
     """Dialog window for generating passwords."""
-    def __init__(self):
+    def __init__(self, client):
         super().__init__()
+        self.client = client
         self.setWindowTitle("Password Generator")
         self.setGeometry(200, 200, 300, 200)
 
@@ -108,9 +106,14 @@ class PasswordGeneratorDialog(QDialog):
         self.password_label.setText(f"Generated Password:\n {self.password}")
 
     def copy_password_to_clipboard(self):
-        """Copy the currently shown password to the clipboard"""
+        """Copy the currently shown password to the clipboard, marked as secret"""
         if hasattr(self, 'password'):
-            pyperclip.copy(self.password)
+            # The daemon writes it as its own copy, so it is not recorded in the history
+            try:
+                self.client.copy_text(self.password, secret=True)
+            except DaemonError as e:
+                QMessageBox.warning(self, "Not Copied", f"Could not copy the password: {e}")
+                return
             QMessageBox.information(self, "Copied", "Password copied to clipboard!")
         else:
             QMessageBox.warning(self, "No Password", "No password generated yet!")
@@ -124,14 +127,24 @@ class PasswordGeneratorDialog(QDialog):
 
 class ClipboardHistoryApp(QWidget):
     """Main application class."""
-    def __init__(self):
+    def __init__(self, client=None):
         super().__init__()
         self.setWindowTitle("Clipboard History")
         self.setGeometry(200, 200, 600, 500)
 
-        # Initialize clipboard history
-        global clipboard_history
-        clipboard_history = {"All": [], "Text": [], "Numbers": [], "URLs": [], "Emails": []}
+        # The clipboard daemon captures and stores the history (started if needed);
+        # every category is loaded from there page by page into a model of its own
+        self.client = client if client is not None else DaemonClient.connect()
+        self.current_category = "All"
+        self.search_query = ""
+        self.thumbnails = ThumbnailLoader(self.client, self)
+        self.history_model = self.create_history_model()  # The "All" category
+        self.search_model = self.create_history_model()
+        self.category_views = {}  # Category -> view, created when first shown
+        self.paging = {}  # Category -> (id of the oldest loaded entry, whether all are loaded)
+        self.transfer = HistoryTransfer(self.client, self)
+        self.transfer.finished.connect(self.on_transfer_finished)
+        self.snippet_editor = None  # Created on first use
 
         # Initialize the main layout
         main_layout = QHBoxLayout(self)
@@ -147,12 +160,31 @@ class ClipboardHistoryApp(QWidget):
         main_layout.addWidget(sidebar_frame)
 
         # --- Main content area ---
-        self.history_list = QListWidget()
-        main_layout.addWidget(self.history_list)
-
-        # Clipboard monitoring thread
-        self.monitor = ClipboardMonitor()
-        self.monitor.new_clipboard_entry.connect(self.add_clipboard_entry)
+        content_layout = QVBoxLayout()
+
+        self.search_field = QLineEdit()
+        self.search_field.setPlaceholderText("Search clipboard history...")
+        self.search_field.setToolTip(SEARCH_TOOLTIP)
+        self.search_field.textChanged.connect(self.on_search_text_changed)
+        content_layout.addWidget(self.search_field)
+        # Searches go to the daemon once typing pauses, not on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(lambda: self.search_history(self.search_field.text()))
+
+        # One view per category and one for search results; switching only
+        # changes the visible page
+        self.view_stack = QStackedWidget()
+        self.search_view = self.create_history_view(self.search_model)
+        content_layout.addWidget(self.view_stack)
+        metrics.REGISTRY.gauge("window.rows", self.history_model.rowCount)
+        main_layout.addLayout(content_layout)
+        self.switch_category("All")
+
+        # New entries are streamed from the daemon
+        self.monitor = ClipboardMonitor(self.client)
+        self.monitor.entries_available.connect(self.add_clipboard_entries)
         self.monitor.start()
 
         # Show startup message
@@ -165,8 +197,32 @@ class ClipboardHistoryApp(QWidget):
         password_button.clicked.connect(self.open_password_generator)
         self.sidebar_layout.addWidget(password_button)
 
+        # --- Snippet library ---
+        snippets_button = QPushButton("Snippets")
+        snippets_button.clicked.connect(lambda: self.open_snippet_editor())
+        self.sidebar_layout.addWidget(snippets_button)
+
+        # --- Bulk export and import of the history ---
+        export_button = QPushButton("Export History")
+        export_button.clicked.connect(lambda: self.transfer.export_history(self))
+        self.sidebar_layout.addWidget(export_button)
+        import_button = QPushButton("Import History")
+        import_button.clicked.connect(lambda: self.transfer.import_history(self))
+        self.sidebar_layout.addWidget(import_button)
+
+        # --- Copy statistics and storage use ---
+        analytics_button = QPushButton("Analytics")
+        analytics_button.clicked.connect(self.open_analytics_window)
+        self.sidebar_layout.addWidget(analytics_button)
+
+        # --- Metrics debug window, when instrumentation is enabled ---
+        if metrics.ENABLED:
+            metrics_button = QPushButton("Metrics")
+            metrics_button.clicked.connect(self.open_metrics_window)
+            self.sidebar_layout.addWidget(metrics_button)
+
         # Create the remaining clipboard category buttons
-        categories = ["All", "Text", "Numbers", "URLs", "Emails"]
+        categories = ["All"] + self.client.categories()
 
         # Add buttons in a vertical stack with spacing
         for category in categories:
@@ -179,23 +235,228 @@ class ClipboardHistoryApp(QWidget):
 
     def open_password_generator(self):
         """Open the password generator dialog."""
-        self.password_dialog = PasswordGeneratorDialog()
+        self.password_dialog = PasswordGeneratorDialog(self.client)
         self.password_dialog.exec()
 
+    def open_metrics_window(self):
+        """Open the metrics debug window."""
+        self.metrics_window = MetricsWindow(self.client, "History window")
+        self.metrics_window.show()
+
+    def open_analytics_window(self):
+        """Open the window with the copy statistics of the history."""
+        self.analytics_window = AnalyticsWindow(self.client)
+        self.analytics_window.show()
+
+    def create_history_model(self):
+        """Create an empty model of history entries."""
+        return ClipboardHistoryModel(
+            None, show_timestamp=True, thumbnails=self.thumbnails, text_loader=self.load_tooltip
+        )
+
+    def history_models(self):
+        """Return the models of all created views."""
+        return [view.model() for view in self.category_views.values()] + [self.search_model]
+
+    def create_history_view(self, model):
+        """Create a list view for model and add it to the view stack."""
+        view = QListView()
+        view.setModel(model)
+        view.setUniformItemSizes(True)
+        view.setEditTriggers(QListView.EditTrigger.NoEditTriggers)
+        view.verticalScrollBar().valueChanged.connect(self.on_history_scrolled)
+        view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        view.customContextMenuRequested.connect(lambda pos, view=view: self.show_context_menu(view, pos))
+        self.view_stack.addWidget(view)
+        return view
+
+    def show_context_menu(self, view, pos):
+        """Offer to pin the clicked clip and list its earlier versions; choosing one copies it."""
+        index = view.indexAt(pos)
+        if not index.isValid():
+            return
+        entry = index.data(ENTRY_ROLE)
+        menu = QMenu(self)
+        pin_action = menu.addAction("Pin as Snippet")
+        pin_action.triggered.connect(lambda: self.pin_entry(entry))
+        versions_menu = menu.addMenu("Versions")
+        versions_menu.setToolTipsVisible(True)
+        if entry.get("group_key") is None:
+            versions_menu.setEnabled(False)  # Never copied with changes
+        else:
+            try:
+                versions = self.client.versions(entry["digest"])
+            except DaemonError as e:
+                QMessageBox.warning(self, "Versions", f"Could not load the versions: {e}")
+                return
+            for version in versions:
+                text = version["label"]
+                if len(text) > VERSION_PREVIEW_LENGTH:
+                    text = text[:VERSION_PREVIEW_LENGTH] + "..."
+                action = versions_menu.addAction(f"{version['timestamp']} - {text}")
+                action.setToolTip(version["text"])  # Versions often differ past the preview
+                action.triggered.connect(lambda checked, digest=version["digest"]: self.paste_version(digest))
+        menu.exec(view.viewport().mapToGlobal(pos))
+
+    def paste_version(self, digest):
+        """Copy a version of a clip back to the clipboard through the daemon."""
+        try:
+            self.client.paste(digest)
+        except DaemonError as e:
+            QMessageBox.warning(self, "Versions", f"Could not copy the version: {e}")
+
+    def pin_entry(self, entry):
+        """Turn a clip into a snippet and show it in the snippet editor."""
+        try:
+            snippet = self.client.pin(entry["digest"])
+        except DaemonError as e:
+            QMessageBox.warning(self, "Snippets", f"Could not pin the clip: {e}")
+            return
+        self.open_snippet_editor(snippet["key"])
+
+    def open_snippet_editor(self, key=None):
+        """Open the snippet editor, showing the snippet with the given key if any."""
+        if self.snippet_editor is None:
+            self.snippet_editor = SnippetEditor(self.client)
+            self.snippet_editor.paste_requested.connect(self.paste_snippet)
+        if key is None:
+            self.snippet_editor.show()
+            self.snippet_editor.raise_()
+        else:
+            self.snippet_editor.show_snippet(key)
+
+    def paste_snippet(self, key):
+        """Copy a snippet with its placeholders filled in."""
+        try:
+            self.client.paste_snippet(key)
+        except DaemonError as e:
+            QMessageBox.warning(self, "Snippets", f"Could not paste the snippet: {e}")
+
+    def load_tooltip(self, digest):
+        """Return the start of the full text of a clipped entry, for its tooltip."""
+        try:
+            return self.client.text(digest, TOOLTIP_LENGTH)
+        except DaemonError:
+            return None
+
+    def category_view(self, category):
+        """Return the view of a category, creating it on first use."""
+        view = self.category_views.get(category)
+        if view is None:
+            if category == "All":
+                model = self.history_model
+            else:
+                model = self.create_history_model()
+            view = self.category_views[category] = self.create_history_view(model)
+        return view
+
+    @metrics.timed("window.switch_category")
     def switch_category(self, category):
         """Switch between clipboard categories."""
-        self.history_list.clear()
-        for entry in clipboard_history[category]:
-            self.history_list.addItem(f"{entry['timestamp']} - {entry['text']}")
-
-    def add_clipboard_entry(self, entry, category):
-        """Add a new clipboard entry to the history list and update the current category."""
-        clipboard_history["All"].append({"text": entry.split(" - ", 1)[1], "timestamp": entry.split(" - ", 1)[0]})
-        clipboard_history[category].append({"text": entry.split(" - ", 1)[1], "timestamp": entry.split(" - ", 1)[0]})
-
-        # If in the current category view, show the new entry
-        if category == "All" or category == self.history_list.currentItem():
-            self.history_list.addItem(entry)
+        self.current_category = category
+        if self.search_query:
+            self.load_search_results()
+            return
+        view = self.category_view(category)
+        self.view_stack.setCurrentWidget(view)
+        if category not in self.paging:
+            self.load_next_page()  # Entries loaded later by scrolling
+
+    def load_next_page(self):
+        """Load the next page of older entries of the current category from the daemon."""
+        if self.search_query:
+            return  # Search results are not paged
+        category = self.current_category
+        oldest_id, all_loaded = self.paging.get(category, (None, False))
+        if all_loaded:
+            return
+        entries = self.client.query(None if category == "All" else category, oldest_id)
+        if entries:
+            oldest_id = entries[-1]["id"]
+            self.category_view(category).model().append_entries(entries)
+        self.paging[category] = (oldest_id, len(entries) < PAGE_SIZE)
+
+    def load_search_results(self):
+        """Show the stored entries of the current category containing the search query."""
+        category = None if self.current_category == "All" else self.current_category
+        entries = {}
+        for entry in self.client.search(self.search_query, category):
+            entries.setdefault(entry["digest"], entry)
+        self.search_model.set_entries(entries.values())
+        self.view_stack.setCurrentWidget(self.search_view)
+
+    def on_search_text_changed(self, query):
+        """Search once typing pauses; clearing the field shows the category at once."""
+        if query:
+            self.search_timer.start()
+        else:
+            self.search_timer.stop()
+            self.search_history("")
+
+    def search_history(self, query):
+        """Filter the current category to entries containing the query."""
+        self.search_query = query
+        self.switch_category(self.current_category)
+
+    def on_history_scrolled(self, value):
+        """Load older entries once the list is scrolled to the bottom."""
+        scroll_bar = self.view_stack.currentWidget().verticalScrollBar()
+        if value == scroll_bar.maximum():
+            self.load_next_page()
+
+    @metrics.timed("window.add_clipboard_entries")
+    def add_clipboard_entries(self):
+        """Show the entries captured since the last update."""
+        # Expired secrets disappear (or are masked) in every view
+        for digest, masked in self.monitor.take_expired():
+            for model in self.history_models():
+                if masked is None:
+                    model.remove(digest)
+                else:
+                    model.replace(digest, masked)
+
+        updates = self.monitor.take_updates()
+        if len(updates) > RELOAD_THRESHOLD:
+            self.reload_history()  # Cheaper than an insert per clip
+            return
+        for entry, replaced, _ in updates:
+            self.add_clipboard_entry(entry, replaced)
+
+    def reload_history(self):
+        """Drop the loaded entries and load the current category again."""
+        for view in self.category_views.values():
+            view.model().set_entries([])
+        self.paging.clear()
+        self.switch_category(self.current_category)
+
+    def on_transfer_finished(self, action, ok, message):
+        """Report the result of a history export or import."""
+        if ok:
+            QMessageBox.information(self, f"History {action}", message)
+            if action == "import":
+                self.reload_history()
+        else:
+            QMessageBox.warning(self, f"History {action}", message)
+
+    def add_clipboard_entry(self, entry, replaced=None):
+        """Add a new clipboard entry on top of the "All" view and the view of its category."""
+        # A new version of a clip (see near_duplicates) takes the place of the earlier one
+        if replaced is not None and replaced["digest"] != entry["digest"]:
+            for model in self.history_models():
+                model.remove(replaced["digest"])
+        # A clip copied again moves to the top instead of being listed twice
+        self.history_model.add_to_top(entry)
+        view = self.category_views.get(entry["category"])
+        if view is not None:
+            view.model().add_to_top(entry)
+
+        # Keep the search results up to date as well
+        if (
+            self.search_query
+            and self.current_category in ("All", entry["category"])
+            and self.search_query.lower() in entry["text"].lower()
+        ):
+            self.search_model.add_to_top(entry)
 
     def show_startup_message(self):
         """Display a message when the program starts."""
@@ -203,12 +464,15 @@ class ClipboardHistoryApp(QWidget):
 
     def closeEvent(self, event):
         """Handle application close event to ensure thread stops."""
+        self.thumbnails.close()
         self.monitor.stop()
         event.accept()
 
 
 # Main application setup
-app = QApplication(sys.argv)
-window = ClipboardHistoryApp()
-window.show()
-sys.exit(app.exec())
+if __name__ == "__main__":
+    metrics.dump_at_exit("window")
+    app = QApplication(sys.argv)
+    window = ClipboardHistoryApp()
+    window.show()
+    sys.exit(app.exec())
@@ -1,92 +1,220 @@
+import time
+
+_PROCESS_START = time.perf_counter()  # Reference point for --profile-startup
+
+import argparse
+import logging
 import sys
-from PyQt6.QtGui import *
-from PyQt6.QtWidgets import *
-from PyQt6.QtCore import QTimer, Qt
-import pyperclip
-from functools import partial
+import threading
 from pathlib import Path
-import sys
-import logging
+
+from PyQt6.QtCore import QTimer, Qt, pyqtSignal
+from PyQt6.QtGui import QAction, QIcon
+from PyQt6.QtWidgets import (
+    QAbstractItemView,
+    QApplication,
+    QLabel,
+    QLineEdit,
+    QListView,
+    QMenu,
+    QSystemTrayIcon,
+    QVBoxLayout,
+    QWidget,
+    QWidgetAction,
+)
+
+import metrics
+from history_model import (
+    ENTRY_ROLE,
+    SEARCH_DELAY,
+    SEARCH_TOOLTIP,
+    TOOLTIP_LENGTH,
+    ClipboardHistoryModel,
+    HistoryItemDelegate,
+)
+from ipc_client import RELOAD_THRESHOLD, DaemonClient, DaemonError
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+# Dark theme, applied to the menu when it is first built
+MENU_STYLESHEET = """
+    QMenu {
+        background-color: #2d2d2d;
+        color: #ffffff;
+        border: 1px solid #444;
+        padding: 5px;
+    }
+    QMenu::item {
+        padding: 8px 20px;
+        background-color: transparent;
+    }
+    QMenu::item:selected {
+        background-color: transparent;
+    }
+    QLabel {
+        color: #ffffff;
+        padding: 5px;
+    }
+    QLineEdit {
+        background-color: #3d3d3d;
+        color: #ffffff;
+        border: 1px solid #555;
+        padding: 5px;
+        border-radius: 4px;
+    }
+    QScrollArea {
+        background-color: transparent;
+        border: none;
+    }
+    QWidgetAction {
+        background-color: transparent;
+    }
+"""
+
+
+class StartupProfiler:
+    """Records how long each startup phase took, for --profile-startup"""
+
+    def __init__(self, start=_PROCESS_START):
+        self.start = start
+        self.marks = []
+
+    def mark(self, phase):
+        self.marks.append((phase, time.perf_counter()))
+
+    def report(self):
+        lines = ["Startup profile (ms):"]
+        previous = self.start
+        for phase, timestamp in self.marks:
+            lines.append(
+                f"  {phase:<20} {(timestamp - previous) * 1000:8.1f}"
+                f"  (total {(timestamp - self.start) * 1000:8.1f})"
+            )
+            previous = timestamp
+        return "\n".join(lines)
+
 
 class SystemTrayApp(QApplication):
-    def __init__(self, icon_path):
+    history_updated = pyqtSignal()  # Coalesced notification from the clipboard daemon
+    history_loaded = pyqtSignal(object)  # Initial history (None if unavailable), fetched in the background
+
+    def __init__(self, icon_path, client=None, profiler=None):
         super().__init__(sys.argv)
+        self.profiler = profiler
+        self.mark("QApplication")
         self.setQuitOnLastWindowClosed(False)
 
-        # Set dark theme stylesheet
-        self.setStyleSheet(
-            """
-            QMenu {
-                background-color: #2d2d2d;
-                color: #ffffff;
-                border: 1px solid #444;
-                padding: 5px;
-            }
-            QMenu::item {
-                padding: 8px 20px;
-                background-color: transparent;
-            }
-            QMenu::item:selected {
-                background-color: transparent;
-            }
-            QLabel {
-                color: #ffffff;
-                padding: 5px;
-            }
-            QLineEdit {
-                background-color: #3d3d3d;
-                color: #ffffff;
-                border: 1px solid #555;
-                padding: 5px;
-                border-radius: 4px;
-            }
-            QScrollArea {
-                background-color: transparent;
-                border: none;
-            }
-            QWidgetAction {
-                background-color: transparent;
-            }
-        """
-        )
-
+        # Show the icon first, everything else is deferred
         self.icon = QIcon(icon_path)
         self.tray = QSystemTrayIcon()
         self.tray.setIcon(self.icon)
         self.tray.setVisible(True)
+        self.tray.activated.connect(self.on_tray_activated)
+        self.mark("tray visible")
 
+        # The menu content is built when the menu is first opened
         self.menu = QMenu()
-        self.clipboard_history = []
-        self.max_display_length = 40  # Max characters for display
-
-        self.last_clipboard_text = pyperclip.paste()
-
-        # Timer to check clipboard changes
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.check_clipboard)
-        self.timer.start(1000)  # Check every second
-
-        self.create_menu_content()
+        self.menu.addAction("Loading clipboard history...").setEnabled(False)
+        self.menu.aboutToShow.connect(self.ensure_menu_content)
         self.tray.setContextMenu(self.menu)
+        self.menu_built = False
+        self.search_field = None
+        self.history_view = None
+
+        self.search_query = ""
+        # Searches go to the daemon once typing pauses, not on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(lambda: self.search_history(self.search_field.text()))
+        self.auto_insert = False  # Chosen clips are pasted into the active window too
+        # Labels are elided to the width of the list by the delegate
+        self.history_model = ClipboardHistoryModel(None, text_loader=self.load_tooltip)
+        self.history_delegate = HistoryItemDelegate()
+        # Windows are created, and their modules imported, on first use to keep startup short
+        self.metrics_window = None
+        self.analytics_window = None  # AnalyticsWindow, created on first use
+        self.transfer = None  # HistoryTransfer, created on first use
+        self.picker = None  # QuickPastePicker, created on first use
+        self.snippet_editor = None  # SnippetEditor, created on first use
+        self.snippet_menu = None
+        metrics.REGISTRY.gauge("tray.rows", self.history_model.rowCount)
+
+        # Connecting to (or starting) the clipboard daemon happens off the GUI thread
+        self.client = client
+        self.history_ready = False
+        self.history_loaded.connect(self.on_history_loaded)
+        self.history_updated.connect(self.check_clipboard)
+        threading.Thread(target=self.load_history, name="history-loader", daemon=True).start()
+
+    def mark(self, phase):
+        """Records a startup phase when profiling"""
+        if self.profiler is not None:
+            self.profiler.mark(phase)
+
+    def load_history(self):
+        """Connects to the daemon and fetches the recent history (worker thread)"""
+        try:
+            if self.client is None:
+                self.client = DaemonClient.connect()
+            entries = self.client.recent()
+        except DaemonError as e:
+            logging.error(f"Could not load clipboard history: {e}")
+            entries = None
+        self.history_loaded.emit(entries)
+
+    def on_history_loaded(self, entries):
+        """Shows the initial history and starts streaming new entries"""
+        if entries is None:
+            self.mark("history unavailable")  # The daemon could not be reached
+        else:
+            self.client.subscribe(self.history_updated.emit)
+            self.history_ready = True
+            if self.snippet_menu is not None:
+                self.snippet_menu.client = self.client
+            if self.search_query:
+                self.update_clipboard_history_ui()  # Typed before the history arrived
+            else:
+                self.history_model.set_entries(entries)
+            self.mark("history loaded")
+
+        if self.profiler is not None:
+            self.ensure_menu_content()
+            print(self.profiler.report())
+            self.quit_app()
+
+    def ensure_menu_content(self):
+        """Builds the menu content on first use"""
+        if self.menu_built:
+            return
+        self.menu.setStyleSheet(MENU_STYLESHEET)
+        self.create_menu_content()
+        self.menu_built = True
+        self.mark("menu built")
 
     def create_menu_content(self):
         """Creates the menu content"""
+        from paste_back import can_send_paste_shortcut
+        from snippet_editor import SnippetMenu
+
         self.menu.clear()
 
         # Search bar
         search_widget = QWidget()
-        search_layout = QHBoxLayout()
+        search_layout = QVBoxLayout()
         search_widget.setLayout(search_layout)
 
         search_label = QLabel("Select clip from clipboard to copy again")
         search_layout.addWidget(search_label)
 
+        self.search_field = QLineEdit()
+        self.search_field.setPlaceholderText("Search clipboard history...")
+        self.search_field.setToolTip(SEARCH_TOOLTIP)
+        self.search_field.textChanged.connect(self.on_search_text_changed)
+        search_layout.addWidget(self.search_field)
 
         search_layout.setContentsMargins(5, 5, 10, 5)
         search_widget.setFixedHeight(search_widget.sizeHint().height())
@@ -97,9 +225,40 @@ class SystemTrayApp(QApplication):
 
         self.menu.addSeparator()
 
-        # Editor Button
-        self.menu_item = QAction("Editor", self.menu)
-        self.menu.addAction(self.menu_item)
+        # Keyboard-driven search of the whole history
+        quick_paste_action = QAction("Quick Paste...", self.menu)
+        quick_paste_action.triggered.connect(self.show_quick_paste)
+        self.menu.addAction(quick_paste_action)
+
+        # Snippets, looked up by keyword while typing
+        self.snippet_menu = SnippetMenu(self.client if self.history_ready else None, "Snippets", self.menu)
+        self.snippet_menu.picked.connect(self.paste_snippet)
+        self.snippet_menu.edit_requested.connect(self.show_snippet_editor)
+        self.menu.addMenu(self.snippet_menu)
+
+        # Editor of the snippet library
+        editor_action = QAction("Snippet Editor...", self.menu)
+        editor_action.triggered.connect(lambda: self.show_snippet_editor())
+        self.menu.addAction(editor_action)
+
+        # Bulk export and import of the history
+        export_action = QAction("Export History...", self.menu)
+        export_action.triggered.connect(lambda: self.transfer_history("export"))
+        self.menu.addAction(export_action)
+        import_action = QAction("Import History...", self.menu)
+        import_action.triggered.connect(lambda: self.transfer_history("import"))
+        self.menu.addAction(import_action)
+
+        # Copy statistics and storage use
+        analytics_action = QAction("Analytics", self.menu)
+        analytics_action.triggered.connect(self.show_analytics)
+        self.menu.addAction(analytics_action)
+
+        # Debug window, only offered when instrumentation is enabled
+        if metrics.ENABLED:
+            metrics_action = QAction("Metrics", self.menu)
+            metrics_action.triggered.connect(self.show_metrics)
+            self.menu.addAction(metrics_action)
 
         self.menu.addSeparator()
 
@@ -115,31 +274,33 @@ class SystemTrayApp(QApplication):
         history_action.setDefaultWidget(history_widget)
         self.menu.addAction(history_action)
 
-        # Scrollable Clipboard History Area
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setFixedSize(250, 200)  # Fixed size for consistent UI
-        self.scroll_area.setStyleSheet("background: transparent; border: none;")
-
-        self.history_container = QWidget()
-        self.history_container.setAttribute(Qt.WidgetAttribute.WA_AlwaysShowToolTips)
-
-        self.history_layout = QVBoxLayout(self.history_container)
-        self.history_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        self.history_layout.setSpacing(0)  # Remove spacing between history items
-
-        self.scroll_area.setWidget(self.history_container)
-
-        scroll_action = QWidgetAction(self.menu)
-        scroll_action.setDefaultWidget(self.scroll_area)
-        self.menu.addAction(scroll_action)
+        # Scrollable Clipboard History List (only visible rows are painted)
+        self.history_view = QListView()
+        self.history_view.setFixedSize(250, 200)  # Fixed size for consistent UI
+        self.history_view.setStyleSheet("background: transparent; border: none; color: #ffffff;")
+        self.history_view.setAttribute(Qt.WidgetAttribute.WA_AlwaysShowToolTips)
+        self.history_view.viewport().setAttribute(Qt.WidgetAttribute.WA_Hover)
+        self.history_view.setUniformItemSizes(True)
+        self.history_view.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.history_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.history_view.setModel(self.history_model)
+        self.history_view.setItemDelegate(self.history_delegate)
+        self.history_view.clicked.connect(self.on_history_clicked)
+        self.history_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.history_view.customContextMenuRequested.connect(self.show_history_context_menu)
+
+        history_list_action = QWidgetAction(self.menu)
+        history_list_action.setDefaultWidget(self.history_view)
+        self.menu.addAction(history_list_action)
 
         self.menu.addSeparator()
 
-        # Auto-insert toggle
-        self.auto_insert_action = QAction("Enable Disabled Button", self.menu)
+        # Auto-insert toggle: chosen clips are also pasted into the active window
+        self.auto_insert_action = QAction("Paste into Active Window", self.menu)
         self.auto_insert_action.setCheckable(True)
-        self.auto_insert_action.setChecked(False)
+        self.auto_insert_action.setChecked(self.auto_insert)
+        self.auto_insert_action.setEnabled(can_send_paste_shortcut())
+        self.auto_insert_action.toggled.connect(self.set_auto_insert)
         self.menu.addAction(self.auto_insert_action)
 
         self.menu.addSeparator()
@@ -149,74 +310,211 @@ class SystemTrayApp(QApplication):
         self.quit_action.triggered.connect(self.quit_app)
         self.menu.addAction(self.quit_action)
 
+    @metrics.timed("tray.check_clipboard")
     def check_clipboard(self):
-        """Checks for new clipboard content and updates history"""
-        current_clipboard_text = pyperclip.paste()
-        if (
-            current_clipboard_text
-            and current_clipboard_text != self.last_clipboard_text
-        ):
-            self.last_clipboard_text = current_clipboard_text
-            self.update_clipboard_history(current_clipboard_text)
-
-    def update_clipboard_history(self, text):
-        """Adds new clipboard entry to history and updates the UI"""
-        if text.strip():
-            if text in self.clipboard_history:
-                self.clipboard_history.remove(text)  # Move to top if already in history
-            self.clipboard_history.insert(0, text)
-
-            self.update_clipboard_history_ui()
-
+        """Applies the clips the daemon captured since the last check"""
+        for digest, masked in self.client.take_expired():
+            if masked is None:
+                self.history_model.remove(digest)
+            else:
+                self.history_model.replace(digest, masked)
+
+        updates = self.client.take_updates()
+        if len(updates) > RELOAD_THRESHOLD:
+            self.update_clipboard_history_ui()  # Cheaper than a row update per clip
+            return
+        for entry, replaced, evicted in updates:
+            self.update_clipboard_history(entry, replaced, evicted)
+
+    def update_clipboard_history(self, entry, replaced, evicted):
+        """Shows a new history entry, moved to the top if already listed or in place of its earlier version"""
+        if replaced is not None and replaced["digest"] != entry["digest"]:
+            self.history_model.remove(replaced["digest"])
+        if not self.search_query:
+            for digest in evicted:
+                self.history_model.remove(digest)
+
+        # Only the affected row changes, an active search is kept up to date
+        if not self.search_query or self.search_query.lower() in entry["text"].lower():
+            self.history_model.add_to_top(entry)
+            if self.history_view is not None:
+                self.history_view.scrollToTop()
+
+    def on_search_text_changed(self, query):
+        """Searches once typing pauses, clearing the field shows the history at once"""
+        if query:
+            self.search_timer.start()
+        else:
+            self.search_timer.stop()
+            self.search_history("")
+
+    def search_history(self, query):
+        """Shows only clips containing the query, newest first"""
+        self.search_query = query
+        self.update_clipboard_history_ui()
+
+    @metrics.timed("tray.update_clipboard_history_ui")
     def update_clipboard_history_ui(self):
-        """Updates the UI to show the clipboard history inside the scroll area"""
-        # Clear old entries
-        for i in reversed(range(self.history_layout.count())):
-            widget = self.history_layout.itemAt(i).widget()
-            if widget is not None:
-                widget.deleteLater()
-
-        # Add updated history
-        for item in self.clipboard_history:
-            display_text = (
-                item
-                if len(item) <= self.max_display_length
-                else item[: self.max_display_length] + "..."
-            )
-            button = QPushButton(display_text)
-            button.setStyleSheet(
-                """
-                QPushButton {
-                    text-align: left;
-                    padding: 8px;
-                    border: none;
-                    border-radius: 4px;
-                    background-color: transparent;
-                }
-                QPushButton:hover {
-                    background-color: #555;
-                }
-            """
-            )
-            button.clicked.connect(partial(self.copy_to_clipboard, item))
-            self.history_layout.addWidget(button)
-
-        # Ensure scrollbar appears when needed
-        self.scroll_area.verticalScrollBar().setValue(0)
-
-    def copy_to_clipboard(self, text):
-        """Copies selected item back to the clipboard"""
-        pyperclip.copy(text)
-        self.last_clipboard_text = text
+        """Reloads the history list, or the search results while searching"""
+        if not self.history_ready:
+            return  # The initial load shows the history once the daemon answers
+        if self.search_query:
+            entries = {}
+            for entry in self.client.search(self.search_query):
+                entries.setdefault(entry["digest"], entry)
+            entries = entries.values()
+        else:
+            entries = self.client.recent()
+        self.history_model.set_entries(entries)
+        if self.history_view is not None:
+            self.history_view.scrollToTop()
+
+    def load_tooltip(self, digest):
+        """Fetches the start of the full text of a clipped entry for its tooltip"""
+        try:
+            return self.client.text(digest, TOOLTIP_LENGTH)
+        except DaemonError:
+            return None
+
+    def show_metrics(self):
+        """Opens the metrics debug window"""
+        if not self.history_ready:
+            return
+        if self.metrics_window is None:
+            from metrics_window import MetricsWindow
+
+            self.metrics_window = MetricsWindow(self.client, "Tray app")
+        self.metrics_window.show()
+        self.metrics_window.raise_()
+
+    def show_analytics(self):
+        """Opens the window with the copy statistics of the history"""
+        if not self.history_ready:
+            return
+        if self.analytics_window is None:
+            from analytics_window import AnalyticsWindow
+
+            self.analytics_window = AnalyticsWindow(self.client)
+        self.analytics_window.show()
+        self.analytics_window.raise_()
+
+    def on_tray_activated(self, reason):
+        """Opens the quick-paste picker on a click of the tray icon"""
+        # On macOS a click opens the menu, which offers the picker
+        if reason == QSystemTrayIcon.ActivationReason.Trigger and sys.platform != "darwin":
+            self.show_quick_paste()
+
+    def show_quick_paste(self):
+        """Opens the quick-paste picker, ranked by frecency and fuzzy match"""
+        if not self.history_ready:
+            return
+        if self.picker is None:
+            from quick_paste import QuickPastePicker
+
+            self.picker = QuickPastePicker(self.client)
+            self.picker.picked.connect(self.copy_to_clipboard)
+        self.picker.popup()
+
+    def on_history_clicked(self, index):
+        """Copies the clicked history row"""
+        self.copy_to_clipboard(index.data(ENTRY_ROLE))
+
+    def copy_to_clipboard(self, entry):
+        """Copies selected item back to the clipboard through the daemon, which writes it in the background"""
+        if self.history_ready:
+            self.client.paste(entry["digest"], insert=self.auto_insert)
+
+    def show_history_context_menu(self, pos):
+        """Offers to pin the clicked clip as a snippet"""
+        index = self.history_view.indexAt(pos)
+        if not index.isValid():
+            return
+        entry = index.data(ENTRY_ROLE)
+        context_menu = QMenu(self.history_view)
+        pin_action = context_menu.addAction("Pin as Snippet")
+        pin_action.triggered.connect(lambda: self.pin_entry(entry))
+        context_menu.exec(self.history_view.viewport().mapToGlobal(pos))
+
+    def pin_entry(self, entry):
+        """Turns a clip into a snippet and opens it in the snippet editor"""
+        try:
+            snippet = self.client.pin(entry["digest"])
+        except DaemonError as e:
+            self.tray.showMessage("Snippets", f"Could not pin the clip: {e}", QSystemTrayIcon.MessageIcon.Warning)
+            return
+        self.menu.hide()
+        self.show_snippet_editor(snippet["key"])
+
+    def show_snippet_editor(self, key=None):
+        """Opens the snippet editor, showing the snippet with the given key if any"""
+        if not self.history_ready:
+            return
+        if self.snippet_editor is None:
+            from snippet_editor import SnippetEditor
+
+            self.snippet_editor = SnippetEditor(self.client)
+            self.snippet_editor.paste_requested.connect(self.paste_snippet)
+        if key is None:
+            self.snippet_editor.show()
+            self.snippet_editor.raise_()
+            self.snippet_editor.activateWindow()
+        else:
+            self.snippet_editor.show_snippet(key)
+
+    def paste_snippet(self, key):
+        """Copies a snippet with its placeholders filled in, pasting it into the active window if enabled"""
+        if not self.history_ready:
+            return
+        try:
+            self.client.paste_snippet(key, insert=self.auto_insert)
+        except DaemonError as e:
+            self.tray.showMessage("Snippets", f"Could not paste the snippet: {e}", QSystemTrayIcon.MessageIcon.Warning)
+
+    def set_auto_insert(self, enabled):
+        """Turns pasting chosen clips into the active window on or off"""
+        self.auto_insert = enabled
+
+    def transfer_history(self, action):
+        """Exports or imports the history through a file dialog"""
+        if not self.history_ready:
+            return
+        if self.transfer is None:
+            from history_transfer import HistoryTransfer
+
+            self.transfer = HistoryTransfer(self.client, self)
+            self.transfer.finished.connect(self.on_transfer_finished)
+        if action == "export":
+            self.transfer.export_history()
+        else:
+            self.transfer.import_history()
+
+    def on_transfer_finished(self, action, ok, message):
+        """Reports the result of an export or import"""
+        icon = QSystemTrayIcon.MessageIcon.Information if ok else QSystemTrayIcon.MessageIcon.Warning
+        self.tray.showMessage(f"History {action}", message, icon)
+        if ok and action == "import":
+            self.update_clipboard_history_ui()
 
     def quit_app(self):
-        """Stops the app"""
-        self.timer.stop()
+        """Stops the app, the daemon keeps recording"""
+        if self.client is not None:
+            self.client.close()
         self.tray.setVisible(False)
         self.quit()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clipboard Chimp tray app")
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="print a timing breakdown of the startup phases and exit",
+    )
+    args, qt_args = parser.parse_known_args()
+    sys.argv = sys.argv[:1] + qt_args  # Leave Qt's own options to QApplication
+    profiler = StartupProfiler() if args.profile_startup else None
+    if profiler is not None:
+        profiler.mark("imports")
+
     try:
         # Dynamically construct the path to the icon
         base_dir = Path(__file__).parent.parent  # Go up to project_folder
@@ -229,8 +527,9 @@ if __name__ == "__main__":
             raise FileNotFoundError(f"Icon file not found at: {icon_path}")
 
         logging.info("Starting Clipboard Chimp application...")
+        metrics.dump_at_exit("tray")
         app = SystemTrayApp(
-            str(icon_path)
+            str(icon_path), profiler=profiler
         )  # Convert to string for compatibility with PyQt
         sys.exit(app.exec())
     except Exception as e:
@@ -0,0 +1,418 @@
+"""Clipboard change sources.
+
+A change source watches the system clipboard and calls its subscribers with the
+new text whenever the clipboard changes. The Qt source is event driven and is
+preferred; the polling source is only a fallback for platforms where Qt does
+not report clipboard changes made by other applications.
+
+The Qt source also captures images, HTML and copied files through QMimeData;
+subscribers receive those as a RichClip next to the text. Clips that password
+managers mark as secret are reported with a RichClip flagged as sensitive.
+The polling source only sees plain text.
+
+The polling source adapts its interval: it polls quickly right after a change
+or user activity and backs off exponentially while the clipboard is idle.
+Where the platform keeps a clipboard change counter, the content is only
+fetched when the counter moved, and polls can be as frequent as
+MIN_POLL_INTERVAL; without one every poll fetches the content, so they are
+never more frequent than MIN_CONTENT_POLL_INTERVAL.
+
+Sources do not report what they wrote themselves. The Qt source tags its
+writes with the SELF_WRITE_FORMAT MIME format and skips changes carrying it
+without reading their content; the polling source remembers the change
+counter after its write, or else the text it wrote.
+"""
+import logging
+import sys
+import threading
+import time
+from collections import deque
+
+import pyperclip
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Qt platform plugins that report external clipboard changes through
+# QClipboard.dataChanged (X11 uses XFixes selection-owner notifications)
+EVENT_PLATFORMS = {"xcb", "windows"}
+
+MIN_POLL_INTERVAL = 0.1  # Seconds between polls right after activity, with a change counter
+MIN_CONTENT_POLL_INTERVAL = 0.5  # The same without one, where every poll fetches the content
+MAX_POLL_INTERVAL = 5.0  # Seconds between polls when idle
+POLL_BACKOFF = 2  # Interval growth per idle poll
+POLL_RATE_WINDOW = 60  # Seconds over which poll_rate() is measured
+
+# MIME formats password managers add to mark a clip as secret (KDE, macOS, Windows);
+# Qt wraps the native ones, so formats are matched by substring
+CONCEALED_FORMATS = (
+    "x-kde-passwordManagerHint",
+    "org.nspasteboard.ConcealedType",
+    "ExcludeClipboardContentFromMonitorProcessing",
+)
+CONCEALED_HINT = "x-kde-passwordManagerHint"  # Added to secrets we write, for other clipboard managers
+SELF_WRITE_FORMAT = "application/x-clipboard-chimp-write"  # Tags the clips we write; holds a write counter
+
+
+class RichClip:
+    """Clipboard content other than plain text.
+
+    kind is "image", "html" or "files" and text is what is shown and searched
+    (a label for images, the file paths for files). payload() returns the bytes
+    to store, encoding them on first use so this can happen off the GUI thread.
+    key identifies the content for change detection. Plain text that was
+    marked as secret is reported as kind "text" with sensitive set.
+    """
+
+    def __init__(self, kind, mime, text, key, payload=None, encode=None, sensitive=False):
+        self.kind = kind
+        self.mime = mime
+        self.text = text
+        self.key = key
+        self.sensitive = sensitive
+        self._payload = payload
+        self._encode = encode
+
+    def payload(self):
+        if self._payload is None and self._encode is not None:
+            self._payload, self._encode = self._encode(), None
+        return self._payload
+
+
+def _encode_png(image):
+    from PyQt6.QtCore import QBuffer, QIODevice
+
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    return bytes(buffer.data())
+
+
+def rich_clip_from_mime(mime_data):
+    """Return a RichClip for the non-text content of a QMimeData, or None."""
+    if mime_data.hasImage():
+        image = mime_data.imageData()
+        if image is not None and not image.isNull():
+            return RichClip(
+                "image", "image/png", f"Image {image.width()}\u00d7{image.height()}",
+                key=f"\0image:{image.cacheKey()}", encode=lambda: _encode_png(image),
+            )
+    if mime_data.hasUrls():
+        paths = [url.toLocalFile() for url in mime_data.urls() if url.isLocalFile()]
+        if paths:
+            text = "\n".join(paths)
+            return RichClip("files", "text/uri-list", text, key=text)
+    if mime_data.hasHtml() and mime_data.text():
+        return RichClip(
+            "html", "text/html", mime_data.text(), key=mime_data.text(),
+            payload=mime_data.html().encode("utf-8"),
+        )
+    return None
+
+
+def is_concealed(mime_data):
+    """Return True if the application that set mime_data marked it as secret."""
+    return any(hint in name for name in mime_data.formats() for hint in CONCEALED_FORMATS)
+
+
+class ClipboardSource:
+    """Base class for clipboard change sources.
+
+    Subscribers are called with (text, clip), where clip is a RichClip for
+    non-text content and None otherwise.
+    """
+
+    def __init__(self):
+        self.last_text = ""
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """Register a callable that receives the new clipboard text."""
+        self._subscribers.append(callback)
+
+    def start(self, skip_current=False):
+        """Start watching the clipboard.
+
+        Unless skip_current is set, the current clipboard content is reported
+        as the first change.
+        """
+        current_text = self.read_text()
+        if skip_current:
+            self.last_text = current_text
+        else:
+            self._notify(current_text)
+
+    def stop(self):
+        """Stop watching the clipboard."""
+
+    def notify_activity(self):
+        """Hint that the user is active, so a change is likely soon."""
+
+    def read_text(self):
+        """Return the current clipboard text."""
+        raise NotImplementedError
+
+    def write_text(self, text, secret=False):
+        """Put text on the clipboard without reporting it as a new change.
+
+        With secret, the text is marked so that clipboard managers skip it.
+        """
+        raise NotImplementedError
+
+    def write_clip(self, text, mime, payload=None):
+        """Put a non-text clip on the clipboard; sources without MIME support write text."""
+        self.write_text(text)
+
+    def _notify(self, text, clip=None):
+        """Report a change to the subscribers if it differs from the last one."""
+        key = clip.key if clip is not None else text
+        if not key or key == self.last_text:
+            return
+        self.last_text = key
+        for callback in list(self._subscribers):
+            callback(text, clip)
+
+
+def _clipboard_writer(clipboard):
+    """Return a QObject whose signals set the clipboard content.
+
+    write_requested(text, secret) sets plain text, clip_write_requested(text,
+    mime, payload) a non-text clip, both tagged as our own writes. The signals
+    can be emitted from any thread; the clipboard is always changed on the
+    thread that owns it.
+    """
+    from PyQt6.QtCore import QMimeData, QObject, QUrl, pyqtSignal
+    from PyQt6.QtGui import QImage
+
+    class ClipboardWriter(QObject):
+        write_requested = pyqtSignal(str, bool)
+        clip_write_requested = pyqtSignal(str, str, bytes)
+
+        def __init__(self):
+            super().__init__()
+            self.writes = 0
+
+        def _tagged(self):
+            self.writes += 1
+            mime_data = QMimeData()
+            mime_data.setData(SELF_WRITE_FORMAT, str(self.writes).encode("ascii"))
+            return mime_data
+
+        def write_text(self, text, secret):
+            mime_data = self._tagged()
+            mime_data.setText(text)
+            if secret:
+                mime_data.setData(CONCEALED_HINT, b"secret")
+            clipboard.setMimeData(mime_data)
+
+        def write_clip(self, text, mime, payload):
+            mime_data = self._tagged()
+            if mime.startswith("image/"):
+                mime_data.setImageData(QImage.fromData(payload))
+            elif mime == "text/uri-list":
+                mime_data.setUrls([QUrl.fromLocalFile(path) for path in text.splitlines()])
+            else:
+                if mime == "text/html":
+                    mime_data.setHtml(payload.decode("utf-8"))
+                mime_data.setText(text)
+            clipboard.setMimeData(mime_data)
+
+    writer = ClipboardWriter()
+    writer.write_requested.connect(writer.write_text)
+    writer.clip_write_requested.connect(writer.write_clip)
+    return writer
+
+
+class QtClipboardSource(ClipboardSource):
+    """Event-driven source based on QClipboard.dataChanged.
+
+    Needs a running QGuiApplication; subscribers are called on the GUI thread.
+    write_text() may be called from any thread.
+    """
+
+    def __init__(self, clipboard=None):
+        super().__init__()
+        if clipboard is None:
+            from PyQt6.QtGui import QGuiApplication
+            clipboard = QGuiApplication.clipboard()
+        self.clipboard = clipboard
+        self._writer = _clipboard_writer(clipboard)
+
+    def start(self, skip_current=False):
+        self.clipboard.dataChanged.connect(self._on_data_changed)
+        super().start(skip_current)
+
+    def stop(self):
+        try:
+            self.clipboard.dataChanged.disconnect(self._on_data_changed)
+        except TypeError:
+            pass  # Not connected
+
+    @timed("clipboard.read")
+    def read_text(self):
+        return self.clipboard.text()
+
+    def write_text(self, text, secret=False):
+        self.last_text = text  # The clipboard holds it now, whoever copies it next
+        self._writer.write_requested.emit(text, secret)
+
+    def write_clip(self, text, mime, payload=None):
+        self.last_text = "" if mime.startswith("image/") else text  # Images get a new key once set
+        self._writer.clip_write_requested.emit(text, mime, payload or b"")
+
+    def _on_data_changed(self):
+        mime_data = self.clipboard.mimeData()
+        if mime_data.hasFormat(SELF_WRITE_FORMAT):
+            return  # Written by write_text() or write_clip()
+        clip = rich_clip_from_mime(mime_data)
+        if is_concealed(mime_data):
+            if clip is None:
+                text = self.read_text()
+                clip = RichClip("text", None, text, key=text)
+            clip.sensitive = True
+        if clip is None:
+            self._notify(self.read_text())
+        else:
+            self._notify(clip.text, clip)
+
+
+def _platform_change_counter():
+    """Return a callable giving the clipboard's change count, or None if unavailable."""
+    if sys.platform == "win32":
+        import ctypes
+        return ctypes.windll.user32.GetClipboardSequenceNumber
+    if sys.platform == "darwin":
+        try:
+            from AppKit import NSPasteboard
+        except ImportError:
+            return None
+        return NSPasteboard.generalPasteboard().changeCount
+    return None
+
+
+class PollingClipboardSource(ClipboardSource):
+    """Fallback source that polls pyperclip from a worker thread.
+
+    change_counter, if given, is a cheap callable whose result changes whenever
+    the clipboard does; by default the platform's counter is used if there is
+    one. min_interval defaults to MIN_POLL_INTERVAL with a counter and to
+    MIN_CONTENT_POLL_INTERVAL without. Subscribers are called on the worker
+    thread.
+    """
+
+    def __init__(self, min_interval=None, max_interval=MAX_POLL_INTERVAL, change_counter=None):
+        super().__init__()
+        self.change_counter = change_counter if change_counter is not None else _platform_change_counter()
+        if min_interval is None:
+            min_interval = MIN_POLL_INTERVAL if self.change_counter is not None else MIN_CONTENT_POLL_INTERVAL
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._last_count = None
+        self._poll_times = deque()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    def start(self, skip_current=False):
+        if skip_current:
+            self.last_text = self.read_text()
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="clipboard-poller", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @timed("clipboard.read")
+    def read_text(self):
+        try:
+            return pyperclip.paste()
+        except pyperclip.PyperclipException as e:
+            logger.warning(f"Could not read clipboard: {e}")
+            return ""
+
+    def write_text(self, text, secret=False):
+        self.last_text = text
+        pyperclip.copy(text)
+        if self.change_counter is not None:
+            self._last_count = self.change_counter()  # Our own change, not fetched again
+
+    def notify_activity(self):
+        self.interval = self.min_interval
+        self._wake_event.set()
+
+    def poll_rate(self):
+        """Return the polls per second over the last POLL_RATE_WINDOW seconds."""
+        cutoff = time.monotonic() - POLL_RATE_WINDOW
+        poll_times = list(self._poll_times)
+        return sum(1 for poll_time in poll_times if poll_time >= cutoff) / POLL_RATE_WINDOW
+
+    def _poll(self):
+        """Check the clipboard once; returns True if it changed."""
+        if self.change_counter is not None:
+            count = self.change_counter()
+            if count == self._last_count:
+                return False  # Nothing copied, skip fetching the content
+            self._last_count = count
+        text = self.read_text()
+        if not text or text == self.last_text:
+            return False
+        self._notify(text)
+        return True
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            self._poll_times.append(now)
+            while self._poll_times[0] < now - POLL_RATE_WINDOW:
+                self._poll_times.popleft()
+
+            if self._poll():
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * POLL_BACKOFF, self.max_interval)
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+
+
+class FakeClipboardSource(ClipboardSource):
+    """In-memory source that emits changes on demand, for tests and benchmarks."""
+
+    def __init__(self, text=""):
+        super().__init__()
+        self.text = text
+
+    def read_text(self):
+        return self.text
+
+    def write_text(self, text, secret=False):
+        self.last_text = text
+        self.text = text
+
+    def set_text(self, text):
+        """Simulate another application copying text."""
+        self.text = text
+        self._notify(text)
+
+
+def create_clipboard_source():
+    """Return the best clipboard source for the running platform."""
+    try:
+        from PyQt6.QtGui import QGuiApplication
+    except ImportError:
+        return PollingClipboardSource()
+
+    app = QGuiApplication.instance()
+    if app is not None and QGuiApplication.platformName() in EVENT_PLATFORMS:
+        return QtClipboardSource()
+
+    logger.info("Clipboard change events unavailable, falling back to polling")
+    return PollingClipboardSource()
@@ -0,0 +1,286 @@
+"""Scheduled compaction of the stored history, and its statistics.
+
+Every interval (and once, START_DELAY seconds after the daemon started) a
+worker thread keeps the history database bounded:
+
+- it counts the entries stored before the rollup tables existed, once (later
+  copies are counted by the store as they are inserted, see HistoryStore);
+- it merges clips stored more than once into their newest row and drops the
+  earlier versions of a clip beyond its newest max_versions (see
+  near_duplicates);
+- it removes entries older than the maximum age of their category and the
+  oldest entries beyond max_entries, with their blobs;
+- it deletes blob and thumbnail files no entry refers to, left behind by an
+  interrupted write;
+- it returns the pages freed meanwhile to the file system.
+
+Work is done in batches of COMPACT_BATCH rows, each committed on its own, so
+captures are never held up for long. Sensitive entries are left to expiry.
+Settings are read from a JSON file such as:
+
+    {"interval": 3600, "max_age_days": {"URLs": 90, "*": 365},
+     "max_entries": 200000, "max_versions": 20}
+
+where "*" stands for every category without a maximum age of its own and
+null turns a limit off.
+
+The statistics shown by the analytics view (see analytics()) are summed from
+the rollup tables, which are far smaller than the history and keep counting
+the copies of entries removed since.
+"""
+import json
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = Path.home() / ".clipboard_app" / "retention.json"
+DEFAULT_INTERVAL = 3600  # Seconds between two compactions
+DEFAULT_MAX_ENTRIES = 200000
+DEFAULT_MAX_VERSIONS = 20  # Versions kept per clip, the current one included
+START_DELAY = 60  # Seconds after the start of the daemon before the first compaction
+COMPACT_BATCH = 1000  # Rows removed or counted per transaction
+BLOB_GRACE = 3600  # Seconds a blob file is left alone after it was written
+ANALYTICS_DAYS = 14  # Days listed by analytics()
+TOP_SOURCES = 10  # Link domains listed by analytics()
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def load_settings(config_path=DEFAULT_CONFIG_PATH):
+    """Return the settings from config_path with defaults for missing values."""
+    settings = {
+        "interval": DEFAULT_INTERVAL,
+        "max_age_days": {},
+        "max_entries": DEFAULT_MAX_ENTRIES,
+        "max_versions": DEFAULT_MAX_VERSIONS,
+    }
+    try:
+        with open(config_path, encoding="utf-8") as file:
+            config = json.load(file)
+    except FileNotFoundError:
+        return settings
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read retention settings from {config_path}: {e}")
+        return settings
+
+    interval = config.get("interval", DEFAULT_INTERVAL)
+    if isinstance(interval, (int, float)) and interval > 0:
+        settings["interval"] = interval
+    else:
+        logger.warning(f"Ignoring invalid interval {interval!r}")
+    for name in ("max_entries", "max_versions"):
+        limit = config.get(name, settings[name])
+        if limit is None or (isinstance(limit, int) and limit > 0):
+            settings[name] = limit
+        else:
+            logger.warning(f"Ignoring invalid {name} {limit!r}")
+    max_age_days = config.get("max_age_days", {})
+    if not isinstance(max_age_days, dict):
+        logger.warning(f"Ignoring invalid max_age_days {max_age_days!r}")
+        max_age_days = {}
+    for category, days in max_age_days.items():
+        if days is None or (isinstance(days, (int, float)) and days > 0):
+            settings["max_age_days"][category] = days
+        else:
+            logger.warning(f"Ignoring invalid maximum age {days!r} of {category}")
+    return settings
+
+
+def analytics(store, days=ANALYTICS_DAYS, sources=TOP_SOURCES):
+    """Return the statistics of the analytics view, read from the rollup tables of store."""
+    first_day = date.today() - timedelta(days=days - 1)
+    per_day = {key: copies for key, copies, _ in store.copy_stats("day", since=f"{first_day.isoformat()} 00")}
+    per_hour = dict((key, copies) for key, copies, _ in store.copy_stats("hour_of_day"))
+    categories = sorted(store.copy_stats("category"), key=lambda row: -row[1])
+    used, free = store.database_size()
+    return {
+        "copies": sum(copies for _, copies, _ in categories),
+        "bytes": sum(size for _, _, size in categories),
+        "categories": [
+            {"category": category or "Uncategorized", "copies": copies, "bytes": size}
+            for category, copies, size in categories
+        ],
+        "hours": [per_hour.get(f"{hour:02d}", 0) for hour in range(24)],
+        "days": [
+            {"day": day.isoformat(), "copies": per_day.get(day.isoformat(), 0)}
+            for day in (first_day + timedelta(days=offset) for offset in range(days))
+        ],
+        "sources": [{"source": source, "copies": copies} for source, copies in store.source_stats(sources)],
+        "entries": store.count(),
+        "database_bytes": used,
+        "free_bytes": free,
+        "blob_bytes": int(store.meta("blob_bytes") or 0),
+        "last_compaction": store.meta("last_compaction"),
+    }
+
+
+class CompactionJob:
+    """Compacts the history every interval in a worker thread; on_removed(entries) is called for removed entries."""
+
+    def __init__(self, store, on_removed, settings=None, start_delay=START_DELAY):
+        self.store = store
+        self.on_removed = on_removed
+        self.settings = settings if settings is not None else load_settings()
+        self.start_delay = start_delay
+
+        self.runs = 0
+        self.removed = 0
+        self.merged = 0
+        self.blobs_removed = 0
+        self.last_duration = 0.0  # Milliseconds
+
+        self._requested = False
+        self._wake_event = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker thread, after the batch it is working on."""
+        self._stopping = True
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_now(self):
+        """Compact as soon as possible instead of at the next interval."""
+        self._requested = True
+        self._wake_event.set()
+
+    def _run(self):
+        next_run = time.monotonic() + self.start_delay
+        while True:
+            self._wake_event.wait(max(0.0, next_run - time.monotonic()))
+            self._wake_event.clear()
+            if self._stopping:
+                return
+            if not self._requested and time.monotonic() < next_run:
+                continue
+            self._requested = False
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Could not compact the clipboard history")
+            next_run = time.monotonic() + self.settings["interval"]
+
+    def compact(self):
+        """Run all steps of a compaction."""
+        start = time.perf_counter()
+        self._backfill_rollups()
+        merged = self._merge_duplicates()
+        removed = self._apply_retention()
+        blobs = self._collect_blobs()
+        self.store.vacuum()
+        self.store.set_meta("last_compaction", datetime.now().strftime(TIMESTAMP_FORMAT))
+        self.store.flush()
+
+        self.runs += 1
+        self.merged += merged
+        self.removed += removed
+        self.blobs_removed += blobs
+        self.last_duration = (time.perf_counter() - start) * 1000
+        logger.info(
+            f"Compacted the clipboard history in {self.last_duration:.0f} ms: removed {removed} entries, "
+            f"merged {merged} duplicates and deleted {blobs} orphaned files"
+        )
+
+    # --- Steps ---
+
+    def _backfill_rollups(self):
+        """Count the entries stored before the rollup tables existed, newest first."""
+        before = int(self.store.meta("rollups_backfill") or 0)
+        while before > 0 and not self._stopping:
+            entries = self.store.entries_before(before, COMPACT_BATCH)
+            before = entries[-1]["id"] if entries else 0
+            self.store.add_rollups(entries, before)
+            self.store.flush()
+
+    def _merge_duplicates(self):
+        """Merge clips stored more than once and drop surplus versions; returns the number of rows removed."""
+        self.store.flush()
+        checked = int(self.store.meta("duplicates_checked") or 0)
+        last_id = self.store.last_id()
+        duplicates = self.store.duplicate_rows(checked)
+        for start in range(0, len(duplicates), COMPACT_BATCH):
+            self.store.merge_duplicates(duplicates[start : start + COMPACT_BATCH])
+        self.store.set_meta("duplicates_checked", last_id)  # Later copies replace older ones when stored
+        self.store.flush()
+
+        removed = len(duplicates)
+        max_versions = self.settings["max_versions"]
+        if max_versions is not None:
+            removed += self._remove(lambda: self.store.surplus_versions(max_versions, COMPACT_BATCH))
+        return removed
+
+    def _apply_retention(self):
+        """Remove the entries past the retention limits; returns their number."""
+        removed = 0
+        max_age_days = self.settings["max_age_days"]
+        own = [category for category in max_age_days if category != "*"]
+        for category in own:
+            if max_age_days[category] is not None:
+                cutoff = self._cutoff(max_age_days[category])
+                removed += self._remove(
+                    lambda: self.store.entries_older_than(cutoff, categories=[category], limit=COMPACT_BATCH)
+                )
+        if max_age_days.get("*") is not None:
+            cutoff = self._cutoff(max_age_days["*"])
+            removed += self._remove(
+                lambda: self.store.entries_older_than(cutoff, other_than=own, limit=COMPACT_BATCH)
+            )
+        max_entries = self.settings["max_entries"]
+        if max_entries is not None:
+            removed += self._remove(lambda: self.store.overflow_entries(max_entries, COMPACT_BATCH))
+        return removed
+
+    def _cutoff(self, days):
+        return (datetime.now() - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+
+    def _remove(self, find):
+        """Remove the entries find() returns, a batch at a time, until it returns none."""
+        removed = 0
+        previous = None
+        while not self._stopping:
+            entries = find()
+            if not entries:
+                break
+            if entries[0]["id"] == previous:
+                logger.warning("Stored entries could not be removed, retrying at the next compaction")
+                break
+            previous = entries[0]["id"]
+            self.store.remove_entries(entries)
+            self.store.flush()
+            self.on_removed(entries)
+            removed += len(entries)
+        return removed
+
+    def _collect_blobs(self):
+        """Delete the blob and thumbnail files no entry refers to; returns their number."""
+        referenced = self.store.blob_names()
+        written_before = time.time() - BLOB_GRACE
+        orphans = set()
+        blob_bytes = 0
+        for blobs in (self.store.blobs, self.store.thumbnails):
+            for name, path in blobs.files():
+                try:
+                    status = path.stat()
+                except FileNotFoundError:
+                    continue
+                if name in referenced or status.st_mtime > written_before:
+                    blob_bytes += status.st_size
+                else:
+                    orphans.add(name)
+        orphans = sorted(orphans)
+        for start in range(0, len(orphans), COMPACT_BATCH):
+            self.store.remove_blobs(orphans[start : start + COMPACT_BATCH])
+        self.store.set_meta("blob_bytes", blob_bytes)
+        return len(orphans)
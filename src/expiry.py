@@ -0,0 +1,126 @@
+"""Expiry of sensitive history entries.
+
+Deadlines are kept in a hashed timing wheel: a ring of slots, one per tick,
+with each timer in the slot of its deadline. Scheduling and cancelling are
+O(1) and a tick only looks at the timers of one slot. The wheel spans the
+configured TTL, so every timer in the current slot is due and the cost of a
+tick depends on the number of expiring entries, not on the size of the
+history. Timers further away than one revolution (a TTL that was lowered)
+stay in their slot until their deadline comes around.
+
+The scheduler thread sleeps while no timer is pending.
+"""
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TICK = 1.0  # Seconds per slot
+
+
+class TimerWheel:
+    """Hashed timing wheel of keyed deadlines."""
+
+    def __init__(self, span, tick=TICK, now=None):
+        self.tick = tick
+        self._slots = [set() for _ in range(max(1, math.ceil(span / tick)) + 1)]
+        self._deadlines = {}  # key -> (deadline, slot)
+        self._current = 0
+        self._time = time.time() if now is None else now  # Start of the current tick
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, deadline):
+        """Fire key at deadline (a time.time() value), replacing an earlier schedule."""
+        self.cancel(key)
+        ticks = max(1, math.ceil((deadline - self._time) / self.tick))
+        slot = (self._current + ticks) % len(self._slots)
+        self._slots[slot].add(key)
+        self._deadlines[key] = (deadline, slot)
+
+    def cancel(self, key):
+        scheduled = self._deadlines.pop(key, None)
+        if scheduled is not None:
+            self._slots[scheduled[1]].discard(key)
+
+    def advance(self, now):
+        """Move the wheel to now; returns the keys whose deadline has passed."""
+        if now - self._time >= len(self._slots) * self.tick:
+            # Asleep for more than a revolution (e.g. a suspended machine)
+            due = [key for key, (deadline, _) in self._deadlines.items() if deadline <= now]
+            for key in due:
+                self.cancel(key)
+            self._time = now
+            return due
+
+        due = []
+        while self._time + self.tick <= now:
+            self._time += self.tick
+            self._current = (self._current + 1) % len(self._slots)
+            slot = self._slots[self._current]
+            for key in [key for key in slot if self._deadlines[key][0] <= now]:
+                slot.discard(key)
+                del self._deadlines[key]
+                due.append(key)
+        return due
+
+
+class ExpiryScheduler:
+    """Calls on_expired(keys) from a worker thread as deadlines pass."""
+
+    def __init__(self, on_expired, span, tick=TICK):
+        self.on_expired = on_expired
+        self._wheel = TimerWheel(span, tick)
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._wheel)
+
+    def schedule(self, key, deadline):
+        with self._lock:
+            was_idle = not self._wheel
+            if was_idle:
+                self._wheel.advance(time.time())  # Catch up on the time spent idle
+            self._wheel.schedule(key, deadline)
+        if was_idle:
+            self._wake_event.set()
+
+    def cancel(self, key):
+        with self._lock:
+            self._wheel.cancel(key)
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="expiry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            with self._lock:
+                idle = not self._wheel
+            self._wake_event.wait(None if idle else self._wheel.tick)
+            self._wake_event.clear()
+
+            with self._lock:
+                due = self._wheel.advance(time.time())
+            if due:
+                try:
+                    self.on_expired(due)
+                except Exception:
+                    logger.exception("Could not expire sensitive entries")
@@ -0,0 +1,232 @@
+"""Frecency ranking and fuzzy matching for the quick-paste picker.
+
+Every capture and every paste of a clip is a visit. The frecency of a clip is
+the sum of 2 ** (t / HALF_LIFE) over the times t of its visits, kept as its
+base-2 logarithm: a visit counts half as much for every HALF_LIFE that
+passes, but as all visits decay at the same rate the order of two clips only
+changes when one of them is visited. Scores are therefore never recomputed;
+a visit updates one score and moves one clip in a list kept sorted by score.
+
+A query matches a clip when its characters appear in the clip in order,
+ignoring case. A match scores the frecency of the clip plus up to
+MATCH_WEIGHT for how well it matches (prefix, word start, substring or
+scattered characters). Clips are scanned most frecent first, skipping those
+that lack a character of the query, and the scan stops as soon as no later
+clip can make it into the results. Typing more characters only looks at the
+matches of the previous query.
+
+Where frecency cannot rule out much of the history (say, right after a large
+import) a scan is cut into slices of RANK_BUDGET: rank() returns the best
+clips found so far, and the picker asks again until the scan is complete.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+from datetime import datetime
+
+HALF_LIFE = 3 * 24 * 3600  # Seconds after which a visit counts half
+MATCH_WEIGHT = 8.0  # Half-lives of frecency that the best match outweighs
+MATCH_LENGTH = 200  # Characters of a clip that queries are matched against
+PICK_LIMIT = 50
+RANK_BUDGET = 0.01  # Seconds a fuzzy query may scan before returning, within one frame
+DEADLINE_CHECK = 64  # Clips scanned between two looks at the clock
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def visit_score(visit_time, frecency=None):
+    """Return the frecency of a clip visited at visit_time (a time.time() value).
+
+    frecency is the score of its earlier visits, None for a new clip.
+    """
+    score = visit_time / HALF_LIFE
+    if frecency is None:
+        return score
+    high, low = max(score, frecency), min(score, frecency)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def entry_frecency(entry):
+    """Return the frecency of an entry; entries without one count their capture as a visit."""
+    if entry.get("frecency") is not None:
+        return entry["frecency"]
+    try:
+        visit_time = datetime.strptime(entry["timestamp"], TIMESTAMP_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        visit_time = 0.0
+    return visit_score(visit_time)
+
+
+def match_quality(text, query, end):
+    """Return how well query matches text, from 0 to 1.
+
+    end is where the leftmost in-order match of the characters of query ends.
+    """
+    position = text.find(query)
+    if position == 0:
+        return 1.0
+    if position > 0:
+        return 0.6 if text[position - 1].isalnum() else 0.8
+    # Scattered characters, the closer together the better
+    return 0.4 * len(query) / (end - text.find(query[0]))
+
+
+def _char_mask(text):
+    mask = 0
+    for char in set(text):
+        mask |= 1 << (ord(char) & 63)
+    return mask
+
+
+def _fuzzy_matcher(query):
+    """Return a function matching text up to the end of the characters of query, in order."""
+    return re.compile("".join(f"[^{re.escape(char)}]*{re.escape(char)}" for char in query)).match
+
+
+class FrecencyIndex:
+    """Clips ranked by frecency that can be searched with fuzzy queries."""
+
+    def __init__(self):
+        self._clips = {}  # digest -> (frecency, lowercase text, character mask)
+        self._order = []  # (-frecency, digest), most frecent first
+        self._lock = threading.Lock()
+        self._version = 0  # Changed by every update, invalidates _scan
+        self._scan = None  # _Scan of the last query
+
+    def __len__(self):
+        return len(self._clips)
+
+    def __contains__(self, digest):
+        return digest in self._clips
+
+    def score(self, digest):
+        """Return the frecency of the clip with the given digest, or None."""
+        clip = self._clips.get(digest)
+        return clip[0] if clip is not None else None
+
+    def add(self, entry):
+        """Add the clip of an entry or move it to its new frecency."""
+        digest = entry["digest"]
+        frecency = entry_frecency(entry)
+        text = entry["text"][:MATCH_LENGTH].lower()
+        mask = _char_mask(text)
+        with self._lock:
+            old = self._clips.get(digest)
+            if old is not None:
+                del self._order[bisect.bisect_left(self._order, (-old[0], digest))]
+            self._clips[digest] = (frecency, text, mask)
+            bisect.insort(self._order, (-frecency, digest))
+            self._version += 1
+
+    def add_entries(self, entries):
+        """Add the clips of entries that are not indexed yet, as when loading the history."""
+        clips = []
+        for entry in entries:
+            text = entry["text"][:MATCH_LENGTH].lower()
+            clips.append((entry["digest"], (entry_frecency(entry), text, _char_mask(text))))
+        with self._lock:
+            added = [
+                (-clip[0], digest) for digest, clip in clips
+                if self._clips.setdefault(digest, clip) is clip
+            ]
+            if added:
+                # One sort per batch rather than an insertion per clip
+                self._order.extend(added)
+                self._order.sort()
+                self._version += 1
+
+    def remove(self, digest):
+        with self._lock:
+            old = self._clips.pop(digest, None)
+            if old is not None:
+                del self._order[bisect.bisect_left(self._order, (-old[0], digest))]
+                self._version += 1
+
+    def rank(self, query, limit=PICK_LIMIT, budget=RANK_BUDGET):
+        """Return (digests, complete): the best limit clips for query, best first.
+
+        An empty query ranks all clips by frecency alone. A fuzzy query stops
+        after budget seconds with the best clips found so far and complete
+        False; asking again for the same query carries on where it stopped.
+        """
+        query = query.lower()
+        with self._lock:
+            if not query:
+                return [digest for _, digest in self._order[:limit]], True
+            if limit <= 0:
+                return [], True
+            scan = self._scan
+            if scan is None or scan.version != self._version or scan.query != query or scan.limit != limit:
+                scan = self._scan = self._start_scan(query, limit)
+            if not scan.complete:
+                self._resume(scan, time.perf_counter() + budget)
+            return [digest for _, digest in sorted(scan.best, reverse=True)], scan.complete
+
+    def _start_scan(self, query, limit):
+        scan = _Scan(query, limit, self._version)
+        last = self._scan
+        if last is not None and last.version == self._version and query.startswith(last.query):
+            # Matches of the longer query are among the earlier matches or not looked at yet
+            scan.candidates = last.matches
+            scan.scanned = last.covered(self._order)
+        return scan
+
+    def _resume(self, scan, deadline):
+        """Scan clips in frecency order until done or past deadline (lock held)."""
+        mask = _char_mask(scan.query)
+        match = _fuzzy_matcher(scan.query)
+        best = scan.best
+        for count, key in enumerate(scan.keys(self._order)):
+            frecency = -key[0]
+            if len(best) == scan.limit and best[0][0] >= frecency + MATCH_WEIGHT:
+                scan.complete = True  # Neither this clip nor a less frecent one can do better
+                return
+            if not count % DEADLINE_CHECK and time.perf_counter() > deadline:
+                return
+            _, text, clip_mask = self._clips[key[1]]
+            if clip_mask & mask != mask:
+                continue
+            found = match(text)
+            if found is None:
+                continue
+            scan.matches.append(key)
+            item = (frecency + MATCH_WEIGHT * match_quality(text, scan.query, found.end()), key[1])
+            if len(best) < scan.limit:
+                heapq.heappush(best, item)
+            else:
+                heapq.heappushpop(best, item)
+        scan.complete = True
+
+
+class _Scan:
+    """Progress of the fuzzy search of one query over the clips of one index version."""
+
+    def __init__(self, query, limit, version):
+        self.query = query
+        self.limit = limit
+        self.version = version
+        self.best = []  # Min-heap of (score, digest) of the best matches
+        self.matches = []  # Keys of all matches so far, most frecent first
+        self.complete = False
+        # Keys of clips to look at first (matches of a shorter query), then
+        # the clips of the index from scanned on
+        self.candidates = []
+        self.position = 0
+        self.scanned = 0
+
+    def keys(self, order):
+        """Yield the keys left to look at; position and scanned point at the next one."""
+        while self.position < len(self.candidates):
+            yield self.candidates[self.position]
+            self.position += 1
+        while self.scanned < len(order):
+            yield order[self.scanned]
+            self.scanned += 1
+
+    def covered(self, order):
+        """Return n such that every clip in order[:n] has been looked at."""
+        if self.position < len(self.candidates):
+            return bisect.bisect_left(order, self.candidates[self.position])
+        return self.scanned
@@ -0,0 +1,96 @@
+"""In-memory clipboard history with deduplication and bounded capacity.
+
+Entries are kept in an ordered map keyed by content digest, so looking up a
+clip, moving it to the front and evicting the oldest entry are all O(1).
+Large clips only keep their preview in memory (see history_store.make_entry).
+"""
+from collections import OrderedDict
+
+from history_store import make_entry, text_digest
+
+MAX_ENTRIES = 1000
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def _memory_size(entry):
+    """Return the bytes of text an entry keeps in memory."""
+    return len(entry["text"]) if entry["in_blob"] else entry["size"]
+
+
+class ClipboardHistory:
+    """Deduplicating, move-to-front clipboard history, newest first."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # digest -> entry, oldest first
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        """Iterate over the entries, newest first."""
+        return reversed(self._entries.values())
+
+    def __contains__(self, text):
+        return text_digest(text) in self._entries
+
+    def get(self, digest):
+        """Return the entry with the given digest, or None."""
+        return self._entries.get(digest)
+
+    def add(self, text, category=None, timestamp=None):
+        """Add text as the newest entry.
+
+        Returns (entry, replaced, evicted): the new entry, the older entry with
+        the same text that it replaced (or None) and the list of entries
+        evicted to stay within the capacity limits.
+        """
+        return self.add_entry(make_entry(text, category, timestamp))
+
+    def add_entry(self, entry):
+        """Add an entry made by make_entry() or read from the store; see add()."""
+        replaced = self._entries.pop(entry["digest"], None)
+        if replaced is not None:
+            self.total_bytes -= _memory_size(replaced)
+        self._entries[entry["digest"]] = entry
+        self.total_bytes += _memory_size(entry)
+
+        # Evict the oldest entries, but always keep the newest one
+        evicted = []
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            _, oldest = self._entries.popitem(last=False)
+            self.total_bytes -= _memory_size(oldest)
+            evicted.append(oldest)
+
+        return entry, replaced, evicted
+
+    def remove(self, digest):
+        """Remove and return the entry with the given digest, or None."""
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            self.total_bytes -= _memory_size(entry)
+        return entry
+
+    def replace(self, digest, entry):
+        """Put entry in the place of the entry with the given digest; returns the old entry or None.
+
+        Takes time linear in the number of entries.
+        """
+        old = self._entries.get(digest)
+        if old is None:
+            return None
+        self._entries = OrderedDict(
+            (entry["digest"], entry) if key == digest else (key, value)
+            for key, value in self._entries.items()
+        )
+        self.total_bytes += _memory_size(entry) - _memory_size(old)
+        return old
+
+    def load(self, entries):
+        """Fill the history from stored entries given newest first."""
+        for entry in reversed(entries):
+            self.add_entry(entry)
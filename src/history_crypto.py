@@ -0,0 +1,144 @@
+"""At-rest encryption of the clipboard history.
+
+Every stored record is compressed, then sealed with AES-256-GCM under its own
+random nonce, with the row's lookup key as associated data so records cannot
+be swapped between rows. Digests used for lookups are replaced by keyed
+hashes, so stored data does not reveal which texts it contains either.
+
+The data key is random and kept in KEY_PATH, wrapped with a key derived from
+a passphrase (CLIPBOARD_APP_PASSPHRASE) with scrypt. It is derived once per
+session; the parameters keep that at a few tens of milliseconds, so unlocking
+and reading the first page of history stay fast. No key is created without a
+passphrase, as anyone who can read KEY_PATH could unwrap it; keys wrapped
+with an empty passphrase by earlier versions still unlock.
+
+Needs the optional "cryptography" package.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import zlib
+from pathlib import Path
+
+KEY_PATH = Path.home() / ".clipboard_app" / "history.key"
+PASSPHRASE_ENV = "CLIPBOARD_APP_PASSPHRASE"
+SCRYPT_PARAMS = {"n": 2 ** 14, "r": 8, "p": 1}
+NONCE_SIZE = 12
+COMPRESS_MIN = 64  # Bytes; shorter records are not worth compressing
+
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+
+
+class UnlockError(Exception):
+    """Raised when the history key cannot be loaded."""
+
+
+def _aesgcm(key):
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    except ImportError:
+        raise UnlockError("Encrypted history needs the 'cryptography' package")
+    return AESGCM(key)
+
+
+def _subkey(key, purpose):
+    return hmac.new(key, purpose, hashlib.sha256).digest()
+
+
+class HistoryCipher:
+    """Seals records with AES-256-GCM and computes keyed lookup digests."""
+
+    def __init__(self, key):
+        self._aead = _aesgcm(_subkey(key, b"clipboard-app records"))
+        from cryptography.exceptions import InvalidTag
+
+        self._index_key = _subkey(key, b"clipboard-app index")
+        self._invalid_tag = InvalidTag
+
+    def seal(self, data, associated, compress=True):
+        """Return data compressed (if worthwhile) and encrypted."""
+        body = _RAW + data
+        if compress and len(data) >= COMPRESS_MIN:
+            compressed = zlib.compress(data)
+            if len(compressed) < len(data):
+                body = _ZLIB + compressed
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, body, associated)
+
+    def open(self, record, associated):
+        """Return the data of a sealed record; raises ValueError if it was tampered with."""
+        try:
+            body = self._aead.decrypt(record[:NONCE_SIZE], bytes(record[NONCE_SIZE:]), associated)
+        except self._invalid_tag:
+            raise ValueError("Corrupted or tampered history record")
+        return zlib.decompress(body[1:]) if body[:1] == _ZLIB else body[1:]
+
+    def index_digest(self, digest):
+        """Return the keyed digest stored in place of a content digest."""
+        return hmac.new(self._index_key, digest.encode("ascii"), hashlib.sha1).hexdigest()
+
+
+def _derive(passphrase, salt, params):
+    return hashlib.scrypt(passphrase.encode("utf-8"), salt=salt, dklen=32, **params)
+
+
+def unlock(key_path=KEY_PATH, passphrase=None, create=False):
+    """Return the HistoryCipher of the key in key_path.
+
+    With create, a new key is made if there is none yet, which needs a
+    non-empty passphrase. The passphrase defaults to the
+    CLIPBOARD_APP_PASSPHRASE environment variable.
+    """
+    key_path = Path(key_path)
+    if passphrase is None:
+        passphrase = os.environ.get(PASSPHRASE_ENV, "")
+
+    if not key_path.exists():
+        if not create:
+            raise UnlockError(f"No history key at {key_path}")
+        if not passphrase:
+            raise UnlockError(f"Set {PASSPHRASE_ENV} to the passphrase protecting the history key")
+        return HistoryCipher(_create_key(key_path, passphrase))
+
+    try:
+        stored = json.loads(key_path.read_text())
+        salt = base64.b64decode(stored["salt"])
+        wrapped = base64.b64decode(stored["key"])
+        params = stored["scrypt"]
+    except (OSError, ValueError, KeyError) as e:
+        raise UnlockError(f"Could not read history key {key_path}: {e}")
+
+    aead = _aesgcm(_derive(passphrase, salt, params))
+    from cryptography.exceptions import InvalidTag
+
+    try:
+        key = aead.decrypt(wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:], b"clipboard-app history key")
+    except InvalidTag:
+        if not passphrase:
+            raise UnlockError(f"The clipboard history is locked, set {PASSPHRASE_ENV} to its passphrase")
+        raise UnlockError("Wrong passphrase for the clipboard history")
+    return HistoryCipher(key)
+
+
+def _create_key(key_path, passphrase):
+    key = os.urandom(32)
+    salt = os.urandom(16)
+    nonce = os.urandom(NONCE_SIZE)
+    wrapped = nonce + _aesgcm(_derive(passphrase, salt, SCRYPT_PARAMS)).encrypt(
+        nonce, key, b"clipboard-app history key"
+    )
+    stored = {
+        "version": 1,
+        "scrypt": SCRYPT_PARAMS,
+        "salt": base64.b64encode(salt).decode("ascii"),
+        "key": base64.b64encode(wrapped).decode("ascii"),
+    }
+
+    key_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as file:
+        json.dump(stored, file)
+    return key
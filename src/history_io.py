@@ -0,0 +1,281 @@
+"""Bulk export and import of the clipboard history.
+
+Two formats are supported:
+
+- JSONL: one {"text", "timestamp", "category"} object per line; non-text
+  clips add "mime" and their data as base64 in "data".
+- Binary: the MAGIC header followed by one record per entry, each a RECORD
+  header with the lengths of timestamp, category, mime, text and data (all
+  UTF-8 except data), followed by those fields.
+
+Both are read and written as streams, a batch of entries at a time, so memory
+use does not depend on the size of the history. Export writes the oldest
+entry first, so an import reproduces the original order. Import skips
+entries that are already stored (or repeated in the file), classifies
+records without a category and dates records without a timestamp to the
+time of the import. Sensitive entries (see sensitive) are neither exported
+nor imported, and of clips with several versions (see near_duplicates) only
+the current one is exported.
+
+The daemon does the work, so the history keeps a single writer; from the
+command line:
+
+    python src/history_io.py export history.jsonl
+    python src/history_io.py export history.clips --format binary
+    python src/history_io.py import history.jsonl
+"""
+import argparse
+import base64
+import json
+import struct
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from history_store import make_entry
+from ipc_client import DaemonClient, DaemonError
+from near_duplicates import band_keys, set_variant_key
+
+FORMATS = ("jsonl", "binary")
+MAGIC = b"CLIPHIST\x01"
+RECORD = struct.Struct(">HHHII")  # Lengths of timestamp, category, mime, text and data
+IMPORT_BATCH = 1000  # Records deduplicated and committed together
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def format_for_path(path):
+    """Return the format implied by a file name: binary unless it ends in .jsonl or .json."""
+    return "jsonl" if Path(path).suffix.lower() in (".jsonl", ".json") else "binary"
+
+
+# --- Writing ---
+
+def write_jsonl(records, file):
+    """Write records to a binary file object as JSON lines; returns the number written."""
+    count = 0
+    for record in records:
+        record = {key: value for key, value in record.items() if value is not None}
+        if "data" in record:
+            record["data"] = base64.b64encode(record["data"]).decode("ascii")
+        file.write(json.dumps(record, ensure_ascii=False).encode("utf-8", "surrogatepass") + b"\n")
+        count += 1
+    return count
+
+
+def write_binary(records, file):
+    """Write records to a binary file object in the binary format; returns the number written."""
+    file.write(MAGIC)
+    count = 0
+    for record in records:
+        file.write(pack_record(record))
+        count += 1
+    return count
+
+
+def pack_record(record):
+    """Return one record of the binary format (as also sent by history_sync)."""
+    fields = [
+        (record.get(name) or "").encode("utf-8", "surrogatepass")
+        for name in ("timestamp", "category", "mime", "text")
+    ]
+    fields.append(record.get("data") or b"")
+    return RECORD.pack(*map(len, fields)) + b"".join(fields)
+
+
+# --- Reading ---
+
+def read_jsonl(file):
+    """Yield the records of a JSON lines file object."""
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("not an object")
+            if record.get("data") is not None:
+                if not isinstance(record["data"], str):
+                    raise ValueError("data is not a base64 string")
+                record["data"] = base64.b64decode(record["data"], validate=True)
+            _check_record(record)
+        except ValueError as e:
+            raise ValueError(f"Invalid record on line {number}: {e}")
+        yield record
+
+
+def read_binary(file):
+    """Yield the records of a binary format file object."""
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a clipboard history file")
+    while True:
+        header = file.read(RECORD.size)
+        if not header:
+            return
+        if len(header) < RECORD.size:
+            raise ValueError("Truncated clipboard history file")
+        lengths = RECORD.unpack(header)
+        fields = [file.read(length) for length in lengths]
+        if any(len(field) < length for field, length in zip(fields, lengths)):
+            raise ValueError("Truncated clipboard history file")
+        yield _binary_record(fields)
+
+
+def unpack_record(data):
+    """Return the record packed by pack_record()."""
+    if len(data) < RECORD.size:
+        raise ValueError("Truncated clipboard history record")
+    fields = []
+    offset = RECORD.size
+    for length in RECORD.unpack_from(data):
+        fields.append(data[offset : offset + length])
+        offset += length
+    if offset != len(data):
+        raise ValueError("Malformed clipboard history record")
+    return _binary_record(fields)
+
+
+def _binary_record(fields):
+    timestamp, category, mime, text = (bytes(field).decode("utf-8", "surrogatepass") for field in fields[:4])
+    return _check_record({
+        "text": text,
+        "timestamp": timestamp or None,
+        "category": category or None,
+        "mime": mime or None,
+        "data": bytes(fields[4]) or None,
+    })
+
+
+def _check_record(record):
+    """Return record, or raise ValueError if a field has the wrong type or the timestamp is malformed."""
+    if not isinstance(record.get("text"), str):
+        raise ValueError("missing text")
+    for name in ("timestamp", "category", "mime"):
+        if record.get(name) is not None and not isinstance(record[name], str):
+            raise ValueError(f"{name} is not a string")
+    if record.get("timestamp"):
+        try:
+            datetime.strptime(record["timestamp"], TIMESTAMP_FORMAT)
+        except ValueError:
+            raise ValueError(f"timestamp {record['timestamp']!r} is not in the form YYYY-MM-DD HH:MM:SS")
+    return record
+
+
+def read_records(file):
+    """Yield the records of a file object in either format, detected from its start."""
+    if file.peek(len(MAGIC))[: len(MAGIC)] == MAGIC:
+        return read_binary(file)
+    return read_jsonl(file)
+
+
+# --- Store side, run by the daemon ---
+
+def entry_record(store, entry):
+    """Return the record of a stored entry."""
+    return {
+        "text": store.full_text(entry),
+        "timestamp": entry["timestamp"],
+        "category": entry["category"],
+        "mime": entry["mime"],
+        "data": store.payload(entry),
+    }
+
+
+def export_records(store):
+    """Yield a record for every current stored entry that is not sensitive, oldest first."""
+    for entry in store.iter_entries():
+        if entry["expires_at"] is not None or entry["superseded"]:
+            continue
+        yield entry_record(store, entry)
+
+
+def export_history(store, path, file_format=None):
+    """Write the history to path; returns the number of exported entries."""
+    writer = write_jsonl if (file_format or format_for_path(path)) == "jsonl" else write_binary
+    with open(path, "wb") as file:
+        return writer(export_records(store), file)
+
+
+def import_history(store, path, classifier, detector=None):
+    """Add the entries of the file at path to the store.
+
+    Returns a dict with the number of imported entries, of duplicates and
+    of skipped sensitive entries.
+    """
+    with open(path, "rb") as file:
+        return import_records(store, read_records(file), classifier, detector)
+
+
+def import_records(store, records, classifier, detector=None, on_batch=None):
+    """Add the entries of records to the store, as import_history() does, and return its counts.
+
+    on_batch, if given, is called with the entries of every committed batch,
+    oldest first. Nothing else is held beyond a batch, so records may come
+    from a file of any size.
+    """
+    counts = {"imported": 0, "duplicates": 0, "skipped": 0}
+    now = datetime.now().strftime(TIMESTAMP_FORMAT)
+    batch = {}  # digest -> (entry, text, data, variant)
+    for record in records:
+        text, data = record["text"], record.get("data")
+        if detector is not None and detector.detect(text):
+            counts["skipped"] += 1
+            continue
+        category = record.get("category") or classifier.categorize(text)
+        entry = make_entry(text, category, record.get("timestamp") or now, record.get("mime"), data)
+        if entry["digest"] in batch:
+            counts["duplicates"] += 1
+            continue
+        # Stored with its variant key and band keys, so that clips captured later can be
+        # grouped with it; imported entries themselves are added as they are, never grouped
+        signature = set_variant_key(entry, text)
+        variant = (signature, band_keys(signature)) if signature is not None else None
+        batch[entry["digest"]] = (entry, text, data, variant)
+        if len(batch) >= IMPORT_BATCH:
+            _import_batch(store, batch, counts, on_batch)
+            batch = {}
+    _import_batch(store, batch, counts, on_batch)
+    return counts
+
+
+def _import_batch(store, batch, counts, on_batch):
+    existing = store.existing_digests(batch)
+    new_items = [item for digest, item in batch.items() if digest not in existing]
+    counts["duplicates"] += len(batch) - len(new_items)
+    counts["imported"] += len(new_items)
+    store.add_entries(new_items)
+    store.flush()  # Later batches must see these as existing
+    if on_batch is not None and new_items:
+        on_batch([entry for entry, _, _, _ in new_items])
+
+
+# --- Command line ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import the clipboard history")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("path", help="history file")
+    parser.add_argument(
+        "--format", choices=FORMATS,
+        help="export format (default: jsonl for .jsonl/.json files, binary otherwise)",
+    )
+    args = parser.parse_args()
+
+    path = str(Path(args.path).resolve())  # The daemon has its own working directory
+    try:
+        client = DaemonClient.connect()
+        if args.action == "export":
+            count = client.export_history(path, args.format)
+            print(f"Exported {count} entries to {path}")
+        else:
+            counts = client.import_history(path)
+            print(
+                f"Imported {counts['imported']} entries from {path} "
+                f"({counts['duplicates']} duplicates, {counts['skipped']} sensitive skipped)"
+            )
+    except DaemonError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
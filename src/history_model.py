@@ -0,0 +1,219 @@
+"""Qt model and delegate for displaying clipboard history.
+
+Rows are only painted when visible and a new clip is a single row insert (or
+remove and insert), so updating the view does not depend on the size of the
+history.
+
+Rows show the one-line label of an entry (see history_store.make_label), never
+its whole text; HistoryItemDelegate elides labels to the row width and keeps
+the elided strings of recently painted rows. Entries only hold a preview of
+long clips, so tooltips load the full text on demand through text_loader.
+"""
+from collections import OrderedDict
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, QRectF, QSize, Qt
+from PyQt6.QtGui import QColor, QPainter, QPalette
+from PyQt6.QtWidgets import QStyle, QStyledItemDelegate
+
+ENTRY_ROLE = Qt.ItemDataRole.UserRole  # History entry dict of the row
+TOOLTIP_LENGTH = 2000  # Characters of a clip shown in its tooltip
+TOOLTIP_CACHE = 32  # Loaded tooltips kept per model
+ELIDED_CACHE = 512  # Elided labels kept per delegate, a few screens of rows
+SEARCH_DELAY = 150  # Milliseconds of typing pause before the front-ends search
+SEARCH_TOOLTIP = "Searches of one or two characters only cover the most recent clips"
+
+
+class ClipboardHistoryModel(QAbstractListModel):
+    """List model of history entries, newest first."""
+
+    def __init__(self, max_display_length=40, show_timestamp=False, thumbnails=None, text_loader=None,
+                 parent=None):
+        super().__init__(parent)
+        self.max_display_length = max_display_length  # None shows the whole label
+        self.show_timestamp = show_timestamp
+        self.thumbnails = thumbnails  # ThumbnailLoader for image rows, optional
+        # Called with a digest, returns the text of a clipped entry's tooltip (or None), optional
+        self.text_loader = text_loader
+        # Entries are kept oldest first, so a new clip is appended; the entry
+        # at index i of _entries is in position _first + i, which _positions
+        # maps digests to. Updates then cost O(rows above), not O(rows).
+        self._entries = []
+        self._positions = {}
+        self._first = 0
+        self._tooltips = OrderedDict()  # digest -> loaded tooltip, least recently shown first
+        if thumbnails is not None:
+            thumbnails.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._entries)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entry_at(index.row())
+        if role == Qt.ItemDataRole.DisplayRole:
+            text = entry.get("label", entry["text"])
+            if self.max_display_length is not None and len(text) > self.max_display_length:
+                text = text[: self.max_display_length] + "..."
+            if self.show_timestamp:
+                return f"{entry['timestamp']} - {text}"
+            return text
+        if role == Qt.ItemDataRole.DecorationRole:
+            if self.thumbnails is not None and (entry.get("mime") or "").startswith("image/"):
+                return self.thumbnails.get(entry["digest"])  # Loaded in the background
+            return None
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self._tooltip(entry)
+        if role == ENTRY_ROLE:
+            return entry
+        return None
+
+    def _tooltip(self, entry):
+        if not entry.get("clipped") or self.text_loader is None:
+            return entry["text"]
+        digest = entry["digest"]
+        text = self._tooltips.get(digest)
+        if text is None:
+            text = self.text_loader(digest)
+            if text is None:
+                return entry["text"]
+            self._tooltips[digest] = text
+            if len(self._tooltips) > TOOLTIP_CACHE:
+                self._tooltips.popitem(last=False)
+        else:
+            self._tooltips.move_to_end(digest)
+        return text
+
+    def _row(self, digest):
+        """Return the row of the clip with the given digest, or None if it is not listed."""
+        position = self._positions.get(digest)
+        if position is None:
+            return None
+        return len(self._entries) - 1 - (position - self._first)
+
+    def set_entries(self, entries):
+        """Replace all rows."""
+        self.beginResetModel()
+        self._entries = []
+        self._positions = {}
+        self._first = 0
+        for entry in reversed(list(entries)):
+            if entry["digest"] not in self._positions:
+                self._positions[entry["digest"]] = len(self._entries)
+                self._entries.append(entry)
+        self.endResetModel()
+
+    def _on_thumbnail_ready(self, digest):
+        row = self._row(digest)
+        if row is None:
+            return
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def entry_at(self, row):
+        """Return the entry shown in row."""
+        return self._entries[len(self._entries) - 1 - row]
+
+    def append_entries(self, entries):
+        """Add older entries below the existing rows, skipping clips already listed."""
+        older = []
+        for entry in entries:
+            if entry["digest"] not in self._positions:
+                self._positions[entry["digest"]] = None  # Also drops duplicates within entries
+                older.append(entry)
+        if not older:
+            return
+        count = len(self._entries)
+        self.beginInsertRows(QModelIndex(), count, count + len(older) - 1)
+        self._first -= len(older)
+        for i, entry in enumerate(reversed(older)):
+            self._positions[entry["digest"]] = self._first + i
+        self._entries[:0] = reversed(older)
+        self.endInsertRows()
+
+    def add_to_top(self, entry):
+        """Show entry as the first row, moving its clip there if it is already listed."""
+        row = self._row(entry["digest"])
+        if row == 0:
+            self._entries[-1] = entry
+            self.dataChanged.emit(self.index(0), self.index(0))
+            return
+        if row is not None:
+            self._remove_row(row)
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self._positions[entry["digest"]] = self._first + len(self._entries)
+        self._entries.append(entry)
+        self.endInsertRows()
+
+    def replace(self, digest, entry):
+        """Show entry in the row of the clip with the given digest, if it is listed."""
+        row = self._row(digest)
+        if row is None:
+            return
+        if entry["digest"] != digest:
+            other = self._row(entry["digest"])
+            if other is not None:
+                self._remove_row(other)  # Never list a clip twice
+                row = self._row(digest)
+            self._positions[entry["digest"]] = self._positions.pop(digest)
+        self._entries[len(self._entries) - 1 - row] = entry
+        self.dataChanged.emit(self.index(row), self.index(row))
+
+    def remove(self, digest):
+        """Remove the row of the clip with the given digest, if any."""
+        row = self._row(digest)
+        if row is not None:
+            self._remove_row(row)
+
+    def _remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        i = len(self._entries) - 1 - row
+        del self._positions[self._entries.pop(i)["digest"]]
+        for entry in self._entries[i:]:  # The rows above move down a position
+            self._positions[entry["digest"]] -= 1
+        self.endRemoveRows()
+
+
+class HistoryItemDelegate(QStyledItemDelegate):
+    """Paints history rows as flat, left-aligned buttons with a hover (or selection) highlight."""
+
+    PADDING = 8
+    HOVER_COLOR = QColor("#555")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._elided = OrderedDict()  # (text, width) -> elided text, least recently painted first
+
+    def elided_text(self, text, metrics, width):
+        """Return text elided to width pixels, from the cache when the row was painted before."""
+        key = (text, width)
+        elided = self._elided.get(key)
+        if elided is None:
+            elided = metrics.elidedText(text, Qt.TextElideMode.ElideRight, width)
+            self._elided[key] = elided
+            if len(self._elided) > ELIDED_CACHE:
+                self._elided.popitem(last=False)
+        else:
+            self._elided.move_to_end(key)
+        return elided
+
+    def paint(self, painter, option, index):
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        if option.state & (QStyle.StateFlag.State_MouseOver | QStyle.StateFlag.State_Selected):
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(self.HOVER_COLOR)
+            painter.drawRoundedRect(QRectF(option.rect), 4, 4)
+
+        painter.setPen(option.palette.color(QPalette.ColorRole.Text))
+        text_rect = option.rect.adjusted(self.PADDING, 0, -self.PADDING, 0)
+        painter.drawText(
+            text_rect,
+            Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+            self.elided_text(index.data(Qt.ItemDataRole.DisplayRole), option.fontMetrics, text_rect.width()),
+        )
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), option.fontMetrics.height() + 2 * self.PADDING)
@@ -0,0 +1,1109 @@
+"""Persistent clipboard history storage.
+
+Entries live in an SQLite database in WAL mode so the GUI can read while a
+background writer thread commits new entries in batched transactions. History
+is read back in pages, newest first, so startup cost does not grow with the
+size of the history.
+
+Search uses an FTS5 trigram index that triggers keep in sync with the entries
+table, so every committed clip is searchable without rebuilding anything.
+The index holds the full text of clips kept in the blob store, which the
+writer's connection reads with the indexed_text() SQL function. Queries
+shorter than a trigram cannot use the index: they only scan the newest
+SHORT_QUERY_SCAN entries and match the preview of large clips.
+
+Clips larger than BLOB_THRESHOLD are kept in the content-addressed blob store;
+their entry only holds a preview, and full_text() reads the payload on demand.
+Non-text clips (images, HTML) keep their data there as well: the entry holds
+the MIME type and the digest of the blob, read back with payload().
+
+With a cipher (see history_crypto), rows are stored sealed: digest and payload
+hold keyed digests and text holds the encrypted record with the real ones.
+The full-text index would keep plaintext, so it is dropped and search scans
+and decrypts recent entries instead. Rows written before encryption was
+enabled are sealed by the writer thread when the store is opened.
+
+Sensitive entries carry an expires_at time (see sensitive and expiry); once
+it passes they are deleted with remove_entry() or masked with mask_entry().
+Deleted rows are overwritten on disk and the write-ahead log is truncated
+afterwards, so the secret does not linger in free pages.
+
+Near-duplicates of a clip (see near_duplicates) are stored as versions that
+share a group_key; only the newest is current, the earlier ones are marked
+superseded and left out of pages, search and counts. Band keys of the
+signatures of current entries live in the variant_bands table, so
+variant_candidates() is a single index lookup.
+
+Every inserted row is also counted in the rollup tables, copies and bytes
+per hour and category and copies per link domain, in the same transaction,
+so statistics (see compaction) outlive the entries they count and are read
+without scanning the history. Domains are not counted in encrypted stores,
+where they would be the only plaintext left.
+
+Pinned snippets (see snippets) are kept in the snippets table for good, one
+JSON record per row, sealed like the entries when a cipher is set. They are
+indexed in memory by the snippet library, which reads them all at once.
+"""
+import hashlib
+import json
+import logging
+import queue
+import re
+import sqlite3
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from blob_store import BlobStore
+from history_crypto import UnlockError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path.home() / ".clipboard_app" / "history.db"
+PAGE_SIZE = 200
+SEARCH_LIMIT = 50
+# Queries shorter than a trigram (or any query on an encrypted store) scan this many recent entries
+SHORT_QUERY_SCAN = 20000
+SEAL_BATCH = 500  # Plaintext rows sealed per transaction when enabling encryption
+LOOKUP_BATCH = 500  # Digests per query in existing_digests(), below SQLite's variable limit
+BLOB_THRESHOLD = 4096  # Bytes of UTF-8 text kept inline in the database
+PREVIEW_LENGTH = 200  # Characters of a large clip kept in its entry
+LABEL_LENGTH = 200  # Characters of the one-line label shown for a clip
+VARIANT_CANDIDATES = 64  # Entries returned by variant_candidates() at most
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    text TEXT NOT NULL,  -- Full text, or a preview when in_blob is set
+    category TEXT,
+    timestamp TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    in_blob INTEGER NOT NULL DEFAULT 0,
+    mime TEXT,  -- MIME type of the payload, NULL for plain text
+    payload TEXT,  -- Blob digest of the payload, if any
+    sealed INTEGER NOT NULL DEFAULT 0,  -- Encrypted row, see history_crypto
+    expires_at REAL,  -- Unix time a sensitive entry expires, NULL otherwise
+    frecency REAL,  -- Ranking in the quick-paste picker (see frecency), NULL if not yet known
+    variant_key TEXT,  -- Digest of the normalized text (see near_duplicates)
+    minhash BLOB,  -- Near-duplicate signature of longer texts, not part of entry dicts
+    group_key TEXT,  -- Digest of the first version of a clip that has several
+    superseded INTEGER NOT NULL DEFAULT 0  -- Set on the earlier versions of a clip
+);
+CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (timestamp);
+CREATE INDEX IF NOT EXISTS entries_category ON entries (category, id);
+CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+CREATE TABLE IF NOT EXISTS variant_bands (
+    band INTEGER NOT NULL,  -- Band key of the signature of a current entry (see near_duplicates)
+    entry_id INTEGER NOT NULL,
+    PRIMARY KEY (band, entry_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS variant_bands_entry ON variant_bands (entry_id);
+CREATE TABLE IF NOT EXISTS copy_stats (
+    hour TEXT NOT NULL,  -- "YYYY-MM-DD HH" of the timestamp of the copies
+    category TEXT NOT NULL,
+    copies INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    PRIMARY KEY (hour, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS source_stats (
+    source TEXT PRIMARY KEY,  -- Domain of copied links
+    copies INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS store_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS snippets (
+    key TEXT PRIMARY KEY,  -- Id of the snippet (see snippets)
+    data BLOB NOT NULL,  -- JSON record of the snippet, encrypted when sealed
+    sealed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Columns added after the first release, created on existing databases
+MIGRATIONS = {
+    "mime": "ALTER TABLE entries ADD COLUMN mime TEXT",
+    "payload": "ALTER TABLE entries ADD COLUMN payload TEXT",
+    "sealed": "ALTER TABLE entries ADD COLUMN sealed INTEGER NOT NULL DEFAULT 0",
+    "expires_at": "ALTER TABLE entries ADD COLUMN expires_at REAL",
+    "frecency": "ALTER TABLE entries ADD COLUMN frecency REAL",
+    "variant_key": "ALTER TABLE entries ADD COLUMN variant_key TEXT",
+    "minhash": "ALTER TABLE entries ADD COLUMN minhash BLOB",
+    "group_key": "ALTER TABLE entries ADD COLUMN group_key TEXT",
+    "superseded": "ALTER TABLE entries ADD COLUMN superseded INTEGER NOT NULL DEFAULT 0",
+}
+# Indexes and triggers on migrated columns, created once the columns exist;
+# band keys are only kept for current entries
+MIGRATED_INDEXES = """
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at) WHERE expires_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS entries_variant ON entries (variant_key) WHERE superseded = 0;
+CREATE INDEX IF NOT EXISTS entries_group ON entries (group_key) WHERE group_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS entries_payload ON entries (payload) WHERE payload IS NOT NULL;
+CREATE TRIGGER IF NOT EXISTS variant_bands_delete AFTER DELETE ON entries BEGIN
+    DELETE FROM variant_bands WHERE entry_id = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS variant_bands_supersede AFTER UPDATE OF superseded ON entries
+WHEN new.superseded = 1 BEGIN
+    DELETE FROM variant_bands WHERE entry_id = old.id;
+END;
+"""
+
+DROP_FTS = """
+DROP TRIGGER IF EXISTS entries_fts_insert;
+DROP TRIGGER IF EXISTS entries_fts_delete;
+DROP TABLE IF EXISTS entries_fts;
+"""
+
+# indexed_text() is defined by the writer, the only connection that changes entries
+INDEXED_TEXT = "indexed_text({0}in_blob, {0}digest, {0}text)"
+
+FTS_INSERT_TRIGGER = """
+CREATE TRIGGER entries_fts_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, text) VALUES (new.id, """ + INDEXED_TEXT.format("new.") + """);
+END;
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE entries_fts USING fts5(
+    text, content='entries', content_rowid='id', tokenize='trigram'
+);
+""" + FTS_INSERT_TRIGGER + """
+CREATE TRIGGER entries_fts_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, text)
+    VALUES ('delete', old.id, """ + INDEXED_TEXT.format("old.") + """);
+END;
+INSERT INTO entries_fts (rowid, text) SELECT id, """ + INDEXED_TEXT.format("") + """ FROM entries;
+"""
+
+COPY_STATS_UPSERT = """
+INSERT INTO copy_stats (hour, category, copies, bytes) VALUES (?, ?, ?, ?)
+ON CONFLICT (hour, category) DO UPDATE SET copies = copies + excluded.copies, bytes = bytes + excluded.bytes
+"""
+# Keys the copy rollups can be summed by, see copy_stats()
+COPY_GROUPS = {"category": "category", "hour_of_day": "substr(hour, 12, 2)", "day": "substr(hour, 1, 10)"}
+SOURCE_STATS_UPSERT = """
+INSERT INTO source_stats (source, copies) VALUES (?, ?)
+ON CONFLICT (source) DO UPDATE SET copies = copies + excluded.copies
+"""
+
+_STOP = object()
+_FLUSH = object()
+_NON_BLANK = re.compile(r"\S")
+_LINK = re.compile(r"\s*https?://(?:[^@/\s]*@)?([^/:?#\s]+)", re.IGNORECASE)
+
+
+def _like_pattern(text):
+    """Escape LIKE wildcards in text."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def text_digest(text):
+    """Return the content digest used to identify a clip."""
+    return hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def make_label(text):
+    """Return the label of a clip: its first non-blank line with whitespace collapsed.
+
+    Only the start of the line is read, so labels of huge clips are as cheap
+    as any other; a label that does not hold the whole line ends with "...".
+    """
+    match = _NON_BLANK.search(text)
+    if match is None:
+        return ""
+    line = text[match.start() : match.start() + 2 * LABEL_LENGTH].split("\n", 1)[0]
+    label = " ".join(line.split())
+    if len(label) > LABEL_LENGTH or (len(line) == 2 * LABEL_LENGTH and match.start() + len(line) < len(text)):
+        return label[:LABEL_LENGTH].rstrip() + "..."
+    return label
+
+
+def link_source(text):
+    """Return the domain of a clip that starts with a link, without "www.", or None."""
+    match = _LINK.match(text)
+    if match is None:
+        return None
+    domain = match.group(1).lower()
+    return domain[4:] if domain.startswith("www.") else domain
+
+
+def make_entry(text, category=None, timestamp=None, mime=None, payload=None):
+    """Return the entry for a new clip; large clips only keep a preview.
+
+    For non-text clips, text is what is shown and searched (a label for
+    images), mime the type of the clip and payload its data as bytes.
+    """
+    data = text.encode("utf-8", "surrogatepass")
+    in_blob = len(data) > BLOB_THRESHOLD
+    digest = hashlib.sha1(data)
+    payload_digest = None
+    if payload is not None:
+        payload_digest = hashlib.sha1(payload).hexdigest()
+        digest.update(payload)
+    return {
+        "digest": digest.hexdigest(),
+        "text": text[:PREVIEW_LENGTH] if in_blob else text,
+        "label": make_label(text),
+        "category": category,
+        "timestamp": timestamp,
+        "size": len(data),
+        "in_blob": in_blob,
+        "mime": mime,
+        "payload": payload_digest,
+        "expires_at": None,
+        "frecency": None,
+        "variant_key": None,
+        "group_key": None,
+    }
+
+
+class HistoryStore:
+    """SQLite-backed clipboard history with a batching writer thread."""
+
+    def __init__(self, path=DEFAULT_DB_PATH, batch_size=100, flush_interval=0.2, max_pending=10000,
+                 cipher=None):
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cipher = cipher
+        directory = Path(self.path).parent
+        directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.blobs = BlobStore(directory / "blobs", cipher)
+        self.thumbnails = BlobStore(directory / "thumbnails", cipher)  # Cache of image thumbnails
+        self._locked = False
+        self._checkpoint = False  # Set by writes that remove content
+        self.failed_writes = 0  # Queued writes dropped because they failed
+        self._queued = {}  # Digest -> (entry, text) added but not committed yet
+        self._queued_lock = threading.Lock()
+
+        # The writer creates the schema before readers are allowed in;
+        # add_entry() blocks once max_pending writes are queued
+        self._queue = queue.Queue(max_pending)
+        self._ready = threading.Event()
+        self._writer = threading.Thread(
+            target=self._run_writer, name="history-writer", daemon=True
+        )
+        self._writer.start()
+        self._ready.wait()
+        if self._locked:
+            self._writer.join()
+            raise UnlockError("The clipboard history is encrypted and needs its key")
+
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # --- Writes (queued, committed by the writer thread) ---
+
+    def add_entry(self, entry, text, unique=False, payload=None, variant=None):
+        """Queue an entry made by make_entry() together with its full text and payload.
+
+        With unique, older copies of the same clip are dropped. variant is
+        the (signature, band keys) of its text, if any (see near_duplicates).
+        """
+        blob_text = text if entry["in_blob"] else None
+        with self._queued_lock:
+            self._queued.pop(entry["digest"], None)  # Moved to the end, as the newest
+            self._queued[entry["digest"]] = (entry, text)
+        self._queue.put((self._insert_entry, (entry, blob_text, payload, unique, variant)))
+
+    def add_entries(self, items):
+        """Queue (entry, text, payload, variant) items to be committed in one transaction, as for imports."""
+        items = [
+            (entry, text if entry["in_blob"] else None, payload, False, variant)
+            for entry, text, payload, variant in items
+        ]
+        self._queue.put((self._insert_entries, (items,)))
+
+    def remove_entry(self, entry):
+        """Queue the deletion of an entry and of its blobs."""
+        self._queue.put((self._delete_entry, (entry,)))
+
+    def mask_entry(self, entry, masked):
+        """Queue replacing an entry by masked in place, dropping its blobs."""
+        self._queue.put((self._mask_entry, (entry, masked)))
+
+    def set_frecency(self, entry):
+        """Queue storing the frecency of an entry that was pasted again."""
+        self._queue.put((self._update_frecency, (entry,)))
+
+    def remove_entries(self, entries):
+        """Queue the deletion of stored entries, by row, and of the blobs no other entry refers to."""
+        self._queue.put((self._delete_rows, (entries,)))
+
+    def merge_duplicates(self, duplicates):
+        """Queue deleting the older rows of (digest column value, newest id) pairs (see duplicate_rows())."""
+        self._queue.put((self._merge_duplicates, (duplicates,)))
+
+    def add_rollups(self, entries, backfill_before):
+        """Queue counting entries stored before the rollups existed; the rest starts at backfill_before."""
+        self._queue.put((self._backfill_rollups, (entries, backfill_before)))
+
+    def remove_blobs(self, names):
+        """Queue deleting blob and thumbnail files by name (see BlobStore.files()) unless an entry refers to them."""
+        self._queue.put((self._delete_orphans, (names,)))
+
+    def vacuum(self):
+        """Queue returning free pages of the database to the file system."""
+        self._queue.put((self._vacuum, ()))
+
+    def set_meta(self, name, value):
+        """Queue storing a value of the store_meta table."""
+        self._queue.put((self._write_meta, (name, value)))
+
+    def save_snippet(self, snippet):
+        """Queue storing a snippet, replacing the one with the same key."""
+        self._queue.put((self._write_snippet, (snippet,)))
+
+    def delete_snippet(self, key):
+        """Queue the deletion of a snippet."""
+        self._queue.put((self._delete_snippet, (key,)))
+
+    def _lookup_keys(self, digest):
+        """Return the values the digest column may hold for a content digest."""
+        if self.cipher is None:
+            return (digest, digest)
+        return (self.cipher.index_digest(digest), digest)  # Plain until sealed on open
+
+    def _index_key(self, digest):
+        return self.cipher.index_digest(digest) if digest else None
+
+    def _seal_row(self, entry):
+        """Return the column values of an entry in its encrypted form."""
+        key = self.cipher.index_digest(entry["digest"])
+        record = json.dumps({
+            name: entry.get(name) for name in ("digest", "text", "payload", "variant_key", "group_key")
+        }).encode("utf-8", "surrogatepass")
+        return {
+            **entry,
+            "digest": key,
+            "text": self.cipher.seal(record, key.encode("ascii")),
+            "payload": self.cipher.index_digest(entry["payload"]) if entry["payload"] else None,
+            "variant_key": self._index_key(entry.get("variant_key")),
+            "group_key": self._index_key(entry.get("group_key")),
+            "sealed": 1,
+        }
+
+    def queued_entries(self):
+        """Return (entry, full text) of the entries added with add_entry() but not committed yet, newest first."""
+        with self._queued_lock:
+            return list(reversed(self._queued.values()))
+
+    def flush(self):
+        """Commit queued writes now and block until they are done."""
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """Commit pending writes and close the database."""
+        self._queue.put(_STOP)
+        self._writer.join()
+        with self._read_lock:
+            self._reader.close()
+
+    def _insert_entry(self, connection, entry, blob_text, payload, unique, variant, count=True):
+        if blob_text is not None:
+            self.blobs.put(entry["digest"], blob_text.encode("utf-8", "surrogatepass"))
+        if payload is not None:
+            self.blobs.put(entry["payload"], payload)
+        if unique:
+            connection.execute(
+                "DELETE FROM entries WHERE digest IN (?, ?)", self._lookup_keys(entry["digest"])
+            )
+        if entry["group_key"] is not None:
+            # The new version takes the place of the current one
+            keys = self._lookup_keys(entry["group_key"])
+            connection.execute(
+                "UPDATE entries SET superseded = 1 "
+                "WHERE (group_key IN (?, ?) OR digest IN (?, ?)) AND superseded = 0",
+                keys + keys,
+            )
+        if self.cipher is not None:
+            row = self._seal_row(entry)
+            variant = None  # Band keys would tell which entries are alike
+        else:
+            row = {**entry, "sealed": 0}
+        signature, bands = variant if variant is not None else (None, ())
+        row_id = connection.execute(
+            "INSERT INTO entries "
+            "(digest, text, category, timestamp, size, in_blob, mime, payload, sealed, expires_at, frecency, "
+            "variant_key, minhash, group_key) "
+            "VALUES (:digest, :text, :category, :timestamp, :size, :in_blob, :mime, :payload, :sealed, "
+            ":expires_at, :frecency, :variant_key, :minhash, :group_key)",
+            {**row, "minhash": signature},
+        ).lastrowid
+        connection.executemany(
+            "INSERT OR IGNORE INTO variant_bands (band, entry_id) VALUES (?, ?)",
+            [(band, row_id) for band in bands],
+        )
+        if count:
+            self._record_copies(connection, [entry])
+
+    def _insert_entries(self, connection, items):
+        # Indexing all new rows in one statement is several times faster than the trigger
+        bulk = self.has_fts and len(items) > 1
+        if bulk:
+            last_id = connection.execute("SELECT IFNULL(MAX(id), 0) FROM entries").fetchone()[0]
+            connection.execute("DROP TRIGGER entries_fts_insert")
+        for item in items:
+            self._insert_entry(connection, *item, count=False)
+        self._record_copies(connection, [item[0] for item in items])
+        if bulk:
+            connection.execute(
+                f"INSERT INTO entries_fts (rowid, text) SELECT id, {INDEXED_TEXT.format('')} FROM entries "
+                "WHERE id > ?",
+                (last_id,),
+            )
+            connection.execute(FTS_INSERT_TRIGGER)
+
+    def _record_copies(self, connection, entries):
+        """Add new entries to the rollups of copies per hour, category and link domain."""
+        copies = {}
+        sources = {}
+        for entry in entries:
+            key = ((entry["timestamp"] or "")[:13], entry["category"] or "")
+            count, size = copies.get(key, (0, 0))
+            copies[key] = (count + 1, size + entry["size"])
+            if self.cipher is None:
+                source = link_source(entry["text"])
+                if source is not None:
+                    sources[source] = sources.get(source, 0) + 1
+        connection.executemany(COPY_STATS_UPSERT, [key + value for key, value in copies.items()])
+        connection.executemany(SOURCE_STATS_UPSERT, list(sources.items()))
+
+    def _backfill_rollups(self, connection, entries, backfill_before):
+        self._record_copies(connection, entries)
+        self._write_meta(connection, "rollups_backfill", backfill_before)
+
+    def _write_meta(self, connection, name, value):
+        connection.execute("INSERT OR REPLACE INTO store_meta (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def _delete_rows(self, connection, entries):
+        for entry in entries:
+            connection.execute("DELETE FROM entries WHERE id = ?", (entry["id"],))
+            self._delete_blobs(connection, entry)
+        self._checkpoint = True
+
+    def _merge_duplicates(self, connection, duplicates):
+        connection.executemany("DELETE FROM entries WHERE digest = ? AND id < ?", duplicates)
+        self._checkpoint = True
+
+    def _delete_orphans(self, connection, names):
+        # Checked by the writer, the only one adding blobs, so a blob is never taken from a new entry
+        for name in names:
+            still_used = connection.execute(
+                "SELECT 1 FROM entries WHERE (digest = ? AND in_blob = 1) OR payload = ? LIMIT 1", (name, name)
+            ).fetchone()
+            if not still_used:
+                self.blobs.delete_file(name)
+                self.thumbnails.delete_file(name)
+
+    def _vacuum(self, connection):
+        connection.commit()  # Neither form of vacuum runs inside a transaction
+        free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free_pages:
+            return
+        if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Switching to incremental vacuum takes one full vacuum
+            connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            connection.execute("VACUUM")
+            logger.info("Switched the clipboard history database to incremental vacuum")
+        else:
+            connection.execute("PRAGMA incremental_vacuum").fetchall()  # Frees a page per row stepped
+        self._checkpoint = True
+
+    def _delete_entry(self, connection, entry):
+        connection.execute("DELETE FROM entries WHERE digest IN (?, ?)", self._lookup_keys(entry["digest"]))
+        self._delete_blobs(connection, entry)
+        self._checkpoint = True
+
+    def _update_frecency(self, connection, entry):
+        connection.execute(
+            "UPDATE entries SET frecency = ? WHERE digest IN (?, ?)",
+            (entry["frecency"], *self._lookup_keys(entry["digest"])),
+        )
+
+    def _mask_entry(self, connection, entry, masked):
+        ids = [
+            row[0] for row in connection.execute(
+                "SELECT id FROM entries WHERE digest IN (?, ?)", self._lookup_keys(entry["digest"])
+            )
+        ]
+        row = self._seal_row(masked) if self.cipher is not None else {**masked, "sealed": 0}
+        for row_id in ids:
+            # The index has no update trigger, so the row is taken out and put back in
+            if self.has_fts:
+                connection.execute(
+                    "INSERT INTO entries_fts (entries_fts, rowid, text) "
+                    f"SELECT 'delete', id, {INDEXED_TEXT.format('')} FROM entries WHERE id = ?", (row_id,)
+                )
+            connection.execute(
+                "UPDATE entries SET digest = :digest, text = :text, size = :size, in_blob = :in_blob, "
+                "mime = :mime, payload = :payload, sealed = :sealed, expires_at = :expires_at "
+                "WHERE id = :id",
+                {**row, "id": row_id},
+            )
+            if self.has_fts:
+                connection.execute(
+                    f"INSERT INTO entries_fts (rowid, text) SELECT id, {INDEXED_TEXT.format('')} FROM entries "
+                    "WHERE id = ?",
+                    (row_id,),
+                )
+        self._delete_blobs(connection, entry)
+        self._checkpoint = True
+
+    def _write_snippet(self, connection, snippet):
+        data = json.dumps(snippet).encode("utf-8", "surrogatepass")
+        sealed = self.cipher is not None
+        if sealed:
+            data = self.cipher.seal(data, snippet["key"].encode("ascii"))
+        connection.execute(
+            "INSERT OR REPLACE INTO snippets (key, data, sealed) VALUES (?, ?, ?)",
+            (snippet["key"], data, int(sealed)),
+        )
+
+    def _delete_snippet(self, connection, key):
+        connection.execute("DELETE FROM snippets WHERE key = ?", (key,))
+        self._checkpoint = True
+
+    def _delete_blobs(self, connection, entry):
+        """Delete the blobs of a removed entry that no other entry refers to."""
+        if entry["in_blob"]:
+            still_used = connection.execute(
+                "SELECT 1 FROM entries WHERE digest IN (?, ?) LIMIT 1", self._lookup_keys(entry["digest"])
+            ).fetchone()
+            if not still_used:
+                self.blobs.delete(entry["digest"])
+        if entry.get("payload"):
+            still_used = connection.execute(
+                "SELECT 1 FROM entries WHERE payload IN (?, ?) LIMIT 1",
+                self._lookup_keys(entry["payload"]),
+            ).fetchone()
+            if not still_used:
+                self.blobs.delete(entry["payload"])
+                self.thumbnails.delete(entry["payload"])
+
+    def _run_writer(self):
+        connection = self._connect()
+        connection.create_function("indexed_text", 3, self._indexed_text)
+        new_rollups = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'copy_stats'").fetchone() is None
+        connection.executescript(SCHEMA)
+        self._migrate(connection)
+        if new_rollups:
+            # Rows stored until now are counted by the compaction job, later ones when inserted
+            with connection:
+                self._write_meta(
+                    connection, "rollups_backfill",
+                    connection.execute("SELECT IFNULL(MAX(id), 0) + 1 FROM entries").fetchone()[0],
+                )
+        connection.executescript(MIGRATED_INDEXES)
+        # Overwrite deleted content instead of leaving it in free pages
+        connection.execute("PRAGMA secure_delete=ON")
+        if self.cipher is None:
+            self._locked = connection.execute(
+                "SELECT 1 FROM entries WHERE sealed = 1 UNION ALL SELECT 1 FROM snippets WHERE sealed = 1 LIMIT 1"
+            ).fetchone() is not None
+            if self._locked:
+                connection.close()
+                self._ready.set()
+                return
+            self.has_fts = self._create_fts(connection)
+        else:
+            connection.executescript(DROP_FTS)
+            self.has_fts = False
+        self._ready.set()
+
+        if self.cipher is not None:
+            self._seal_existing(connection)
+
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            if batch[0] is _STOP:
+                self._queue.task_done()
+                break
+            if batch[0] is _FLUSH:
+                self._queue.task_done()
+                continue
+
+            # Collect whatever arrives within the flush interval into one transaction
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP or item is _FLUSH:
+                    self._queue.task_done()
+                    stopping = item is _STOP
+                    break
+                batch.append(item)
+
+            self._write_batch(connection, batch)
+            if self._checkpoint:
+                # Drop the copies of deleted pages kept in the write-ahead log
+                connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._checkpoint = False
+
+        connection.close()
+
+    def _migrate(self, connection):
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(entries)")}
+        with connection:
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    connection.execute(statement)
+
+    def _seal_existing(self, connection):
+        """Encrypt the rows and blobs written before encryption was enabled."""
+        plain_blobs = BlobStore(self.blobs.root)
+        sealed_any = False
+        while True:
+            rows = connection.execute(
+                "SELECT * FROM entries WHERE sealed = 0 LIMIT ?", (SEAL_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            sealed_any = True
+            with connection:
+                for row in rows:
+                    entry = self._row_to_entry(row)
+                    for digest in (entry["digest"] if entry["in_blob"] else None, entry["payload"]):
+                        if digest is None:
+                            continue
+                        try:
+                            self.blobs.put(digest, plain_blobs.get(digest))
+                        except FileNotFoundError:
+                            continue
+                        plain_blobs.delete(digest)
+                    sealed = self._seal_row(entry)
+                    connection.execute("DELETE FROM variant_bands WHERE entry_id = ?", (row["id"],))
+                    connection.execute(
+                        "UPDATE entries SET digest = :digest, text = :text, payload = :payload, "
+                        "variant_key = :variant_key, minhash = NULL, group_key = :group_key, "
+                        "sealed = 1 WHERE id = :id",
+                        sealed,
+                    )
+        rows = connection.execute("SELECT key, data FROM snippets WHERE sealed = 0").fetchall()
+        with connection:
+            for row in rows:
+                connection.execute(
+                    "UPDATE snippets SET data = ?, sealed = 1 WHERE key = ?",
+                    (self.cipher.seal(bytes(row["data"]), row["key"].encode("ascii")), row["key"]),
+                )
+        if sealed_any:
+            # Thumbnails made before encryption are plaintext; they are made again on demand
+            shutil.rmtree(self.thumbnails.root, ignore_errors=True)
+            self.thumbnails.root.mkdir()
+            logger.info("Encrypted the existing clipboard history")
+
+    def _create_fts(self, connection):
+        """Create the full-text index if missing; return False if FTS5 is unavailable."""
+        trigger = connection.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'entries_fts_insert'"
+        ).fetchone()
+        if trigger is not None and "indexed_text" in trigger[0]:
+            return True
+        if trigger is not None:
+            # Built when the index only held the preview of large clips
+            logger.info("Indexing the full text of large clips for search")
+            connection.executescript(DROP_FTS)
+        try:
+            connection.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search unavailable, using plain scans: {e}")
+            return False
+        return True
+
+    def _indexed_text(self, in_blob, digest, text):
+        """Return the text indexed for a row: the full text of a clip kept in the blob store."""
+        if not in_blob:
+            return text
+        try:
+            return self.blobs.get(digest).decode("utf-8", "surrogatepass")
+        except (OSError, ValueError):
+            return text  # Only the preview is left
+
+    def _write_batch(self, connection, batch):
+        """Commit batch in one transaction, or each write on its own if that fails.
+
+        A write that fails is logged and dropped; whatever it raised, the
+        writer keeps running and flush() returns.
+        """
+        try:
+            with connection:
+                for operation, args in batch:
+                    operation(connection, *args)
+        except Exception:
+            if len(batch) == 1:
+                self._write_failed(batch[0])
+            else:
+                for item in batch:
+                    try:
+                        with connection:
+                            item[0](connection, *item[1])
+                    except Exception:
+                        self._write_failed(item)
+        finally:
+            with self._queued_lock:
+                for operation, args in batch:
+                    if operation != self._insert_entry:
+                        continue
+                    digest = args[0]["digest"]
+                    if digest in self._queued and self._queued[digest][0] is args[0]:
+                        del self._queued[digest]  # Unless added again meanwhile
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_failed(self, item):
+        self.failed_writes += 1
+        logger.exception(f"Could not write to the clipboard history ({item[0].__name__})")
+
+    # --- Reads ---
+
+    def load_page(self, category=None, before_id=None, limit=PAGE_SIZE):
+        """Return up to limit entries, newest first, older than before_id."""
+        query = "SELECT * FROM entries"
+        conditions, params = ["superseded = 0"], []
+        if category is not None:
+            conditions.append("category = ?")
+            params.append(category)
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._read_lock:
+            return [self._row_to_entry(row) for row in self._reader.execute(query, params)]
+
+    def get_entry(self, digest):
+        """Return the newest entry with the given digest, or None."""
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT * FROM entries WHERE digest IN (?, ?) ORDER BY id DESC LIMIT 1",
+                self._lookup_keys(digest),
+            ).fetchone()
+        return self._row_to_entry(row) if row is not None else None
+
+    def iter_entries(self, batch_size=PAGE_SIZE):
+        """Yield every stored entry, oldest first, reading batch_size rows at a time."""
+        last_id = 0
+        while True:
+            with self._read_lock:
+                rows = self._reader.execute(
+                    "SELECT * FROM entries WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1]["id"]
+            for row in rows:
+                yield self._row_to_entry(row)
+
+    def existing_digests(self, digests):
+        """Return the subset of digests that have a stored entry."""
+        keys = {}
+        for digest in digests:
+            for key in self._lookup_keys(digest):
+                keys[key] = digest
+        found = set()
+        keys_list = list(keys)
+        with self._read_lock:
+            for start in range(0, len(keys_list), LOOKUP_BATCH):
+                chunk = keys_list[start : start + LOOKUP_BATCH]
+                found.update(
+                    keys[row[0]] for row in self._reader.execute(
+                        f"SELECT DISTINCT digest FROM entries WHERE digest IN ({', '.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                )
+        return found
+
+    def variant_candidates(self, variant_key, bands=()):
+        """Return (entry, signature) of current entries that may be variants of a clip, newest first.
+
+        These are the entries with the given variant key and, unless the
+        history is encrypted, those sharing one of the band keys of its
+        signature (see near_duplicates).
+        """
+        query = "SELECT * FROM entries WHERE variant_key = ? AND superseded = 0"
+        params = [self._index_key(variant_key) if self.cipher is not None else variant_key]
+        if bands and self.cipher is None:
+            query += (
+                " UNION SELECT e.* FROM variant_bands b JOIN entries e ON e.id = b.entry_id "
+                f"WHERE b.band IN ({', '.join('?' * len(bands))}) AND e.superseded = 0"
+            )
+            params.extend(bands)
+        params.append(VARIANT_CANDIDATES)
+        with self._read_lock:
+            rows = self._reader.execute(query + " ORDER BY id DESC LIMIT ?", params).fetchall()
+            return [(self._row_to_entry(row), row["minhash"]) for row in rows]
+
+    def versions(self, entry):
+        """Return all stored versions of the clip of an entry, newest first."""
+        keys = self._lookup_keys(entry.get("group_key") or entry["digest"])
+        with self._read_lock:
+            return [
+                self._row_to_entry(row) for row in self._reader.execute(
+                    "SELECT * FROM entries WHERE group_key IN (?, ?) OR digest IN (?, ?) ORDER BY id DESC",
+                    keys + keys,
+                )
+            ]
+
+    def expiring_entries(self):
+        """Return the entries that have an expiry time, soonest first."""
+        with self._read_lock:
+            return [
+                self._row_to_entry(row) for row in self._reader.execute(
+                    "SELECT * FROM entries WHERE expires_at IS NOT NULL ORDER BY expires_at"
+                )
+            ]
+
+    def full_text(self, entry):
+        """Return the complete text of an entry, reading large clips from the blob store."""
+        if not entry["in_blob"]:
+            return entry["text"]
+        return self._read_blob(entry["digest"]).decode("utf-8", "surrogatepass")
+
+    def payload(self, entry):
+        """Return the payload bytes of a non-text entry, or None."""
+        if not entry.get("payload"):
+            return None
+        return self._read_blob(entry["payload"])
+
+    def _read_blob(self, digest):
+        try:
+            return self.blobs.get(digest)
+        except FileNotFoundError:
+            self.flush()  # The blob may still be queued for writing
+            return self.blobs.get(digest)
+
+    def meta(self, name):
+        """Return a value of the store_meta table, or None."""
+        with self._read_lock:
+            row = self._reader.execute("SELECT value FROM store_meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def entries_before(self, before_id, limit=PAGE_SIZE):
+        """Return up to limit stored entries older than before_id, including earlier versions, newest first."""
+        with self._read_lock:
+            return [
+                self._row_to_entry(row) for row in self._reader.execute(
+                    "SELECT * FROM entries WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit)
+                )
+            ]
+
+    def duplicate_rows(self, after_id=0):
+        """Return (digest column value, newest id) of current clips stored more than once, newest after after_id."""
+        with self._read_lock:
+            return [
+                tuple(row) for row in self._reader.execute(
+                    "SELECT e.digest, MAX(e.id) FROM entries e WHERE e.id > ? AND e.superseded = 0 "
+                    "AND EXISTS (SELECT 1 FROM entries o WHERE o.digest = e.digest AND o.id < e.id) "
+                    "GROUP BY e.digest",
+                    (after_id,),
+                )
+            ]
+
+    def entries_older_than(self, timestamp, categories=None, other_than=(), limit=PAGE_SIZE):
+        """Return up to limit entries stored before timestamp that are not sensitive, oldest first.
+
+        Only entries of the given categories are returned, or, without
+        categories, those of any category but the ones in other_than.
+        """
+        conditions, params = ["timestamp < ?", "expires_at IS NULL"], [timestamp]
+        if categories is not None:
+            conditions.append(f"category IN ({', '.join('?' * len(categories))})")
+            params.extend(categories)
+        elif other_than:
+            conditions.append(f"(category IS NULL OR category NOT IN ({', '.join('?' * len(other_than))}))")
+            params.extend(other_than)
+        params.append(limit)
+        with self._read_lock:
+            return [
+                self._row_to_entry(row) for row in self._reader.execute(
+                    f"SELECT * FROM entries WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?", params
+                )
+            ]
+
+    def overflow_entries(self, max_entries, limit=PAGE_SIZE):
+        """Return up to limit of the oldest entries beyond the newest max_entries rows that are not sensitive."""
+        with self._read_lock:
+            return [
+                self._row_to_entry(row) for row in self._reader.execute(
+                    "SELECT * FROM entries WHERE id <= (SELECT id FROM entries ORDER BY id DESC LIMIT 1 OFFSET ?) "
+                    "AND expires_at IS NULL ORDER BY id LIMIT ?",
+                    (max_entries, limit),
+                )
+            ]
+
+    def surplus_versions(self, max_versions, limit=PAGE_SIZE):
+        """Return up to limit of the earlier versions of clips beyond their newest max_versions, oldest first."""
+        with self._read_lock:
+            return [
+                self._row_to_entry(row) for row in self._reader.execute(
+                    "SELECT e.* FROM entries e JOIN ("
+                    "SELECT id, ROW_NUMBER() OVER (PARTITION BY IFNULL(group_key, digest) ORDER BY id DESC) AS position "
+                    "FROM entries WHERE group_key IS NOT NULL "
+                    "OR digest IN (SELECT group_key FROM entries WHERE group_key IS NOT NULL)"
+                    ") v ON v.id = e.id WHERE v.position > ? AND e.superseded = 1 ORDER BY e.id LIMIT ?",
+                    (max_versions, limit),
+                )
+            ]
+
+    def last_id(self):
+        """Return the id of the newest stored row, 0 if there is none."""
+        with self._read_lock:
+            return self._reader.execute("SELECT IFNULL(MAX(id), 0) FROM entries").fetchone()[0]
+
+    def blob_names(self):
+        """Return the file names (see BlobStore) of the blobs and of the payloads that entries refer to."""
+        with self._read_lock:
+            return {
+                row[0] for row in self._reader.execute(
+                    "SELECT digest FROM entries WHERE in_blob = 1 "
+                    "UNION SELECT payload FROM entries WHERE payload IS NOT NULL"
+                )
+            }
+
+    def copy_stats(self, group, since=None):
+        """Return (key, copies, bytes) of the copy rollups summed by a key of COPY_GROUPS, in key order.
+
+        since is the first "YYYY-MM-DD HH" hour counted, if given.
+        """
+        expression = COPY_GROUPS[group]
+        query = f"SELECT {expression} AS key, SUM(copies), SUM(bytes) FROM copy_stats"
+        params = []
+        if since is not None:
+            query += " WHERE hour >= ?"
+            params.append(since)
+        with self._read_lock:
+            return [tuple(row) for row in self._reader.execute(query + " GROUP BY key ORDER BY key", params)]
+
+    def source_stats(self, limit):
+        """Return (domain, copies) of the most copied link domains."""
+        with self._read_lock:
+            return [
+                tuple(row) for row in self._reader.execute(
+                    "SELECT source, copies FROM source_stats ORDER BY copies DESC, source LIMIT ?", (limit,)
+                )
+            ]
+
+    def database_size(self):
+        """Return (bytes in use, free bytes) of the database file."""
+        with self._read_lock:
+            page_size, page_count, free_pages = (
+                self._reader.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in ("page_size", "page_count", "freelist_count")
+            )
+        return (page_count - free_pages) * page_size, free_pages * page_size
+
+    def load_snippets(self):
+        """Return all stored snippets."""
+        with self._read_lock:
+            rows = self._reader.execute("SELECT key, data, sealed FROM snippets").fetchall()
+        snippets = []
+        for row in rows:
+            data = row["data"]
+            if row["sealed"]:
+                data = self.cipher.open(data, row["key"].encode("ascii"))
+            snippets.append(json.loads(data))
+        return snippets
+
+    def _row_to_entry(self, row):
+        entry = dict(row)
+        entry["in_blob"] = bool(entry["in_blob"])
+        entry["superseded"] = bool(entry["superseded"])
+        del entry["minhash"]
+        if entry.pop("sealed"):
+            record = json.loads(self.cipher.open(entry["text"], entry["digest"].encode("ascii")))
+            entry.update(record)
+        entry["label"] = make_label(entry["text"])  # Derived, so neither stored nor sealed
+        return entry
+
+    def search(self, query, category=None, prefix=False, limit=SEARCH_LIMIT):
+        """Return up to limit entries, newest first, containing query.
+
+        Matching is case-insensitive; with prefix only entries starting with
+        query are returned. Queries shorter than three characters only look
+        at the newest SHORT_QUERY_SCAN entries.
+        """
+        if not query:
+            return []
+        if self.cipher is not None:
+            return self._search_sealed(query, category, prefix, limit)
+
+        pattern = _like_pattern(query) + "%"
+        if not prefix:
+            pattern = "%" + pattern
+        conditions = ["e.text LIKE ? ESCAPE '\\'", "e.superseded = 0"]
+        params = [pattern]
+
+        if self.has_fts and len(query) >= 3:
+            # The trigram index narrows the candidates to entries containing the query
+            source = "entries_fts f JOIN entries e ON e.id = f.rowid"
+            conditions.insert(0, "entries_fts MATCH ?")
+            params.insert(0, '"' + query.replace('"', '""') + '"')
+            order = "f.rowid"
+            if not prefix:
+                # Large clips matched their full text in the index; the row only has a preview
+                conditions[1] = "(e.in_blob = 1 OR " + conditions[1] + ")"
+        else:
+            source = "entries e"
+            conditions.append("e.id > (SELECT IFNULL(MAX(id), 0) FROM entries) - ?")
+            params.append(SHORT_QUERY_SCAN)
+            order = "e.id"
+
+        if category is not None:
+            conditions.append("e.category = ?")
+            params.append(category)
+        params.append(limit)
+
+        sql = (
+            f"SELECT e.* FROM {source} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY {order} DESC LIMIT ?"
+        )
+        with self._read_lock:
+            return [self._row_to_entry(row) for row in self._reader.execute(sql, params)]
+
+    def _search_sealed(self, query, category, prefix, limit):
+        """Search by decrypting the most recent entries."""
+        needle = query.casefold()
+        sql = "SELECT * FROM entries WHERE superseded = 0"
+        params = []
+        if category is not None:
+            sql += " AND category = ?"
+            params.append(category)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(SHORT_QUERY_SCAN)
+
+        results = []
+        with self._read_lock:
+            for row in self._reader.execute(sql, params):
+                entry = self._row_to_entry(row)
+                text = entry["text"].casefold()
+                if text.startswith(needle) if prefix else needle in text:
+                    results.append(entry)
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def count(self, category=None):
+        """Return the number of stored entries."""
+        with self._read_lock:
+            if category is None:
+                row = self._reader.execute("SELECT COUNT(*) FROM entries WHERE superseded = 0").fetchone()
+            else:
+                row = self._reader.execute(
+                    "SELECT COUNT(*) FROM entries WHERE category = ? AND superseded = 0", (category,)
+                ).fetchone()
+        return row[0]
@@ -0,0 +1,361 @@
+"""Replication of the clipboard history between devices.
+
+Every device appends the clips it captures to its own operation log, numbered
+1, 2, 3..., and a sync server (see sync_server) keeps the logs of all
+devices. A device pushes the operations the server has not acknowledged yet
+and pulls those of the other devices past its clock, the last operation it
+applied per device. After a reconnect only what changed meanwhile crosses
+the network, whatever the size of the history.
+
+Captured clips wait in an outbox until none was captured for DEBOUNCE
+seconds, or at most MAX_DELAY seconds, and are then pushed PUSH_BATCH at a
+time in compressed frames. An operation is built from the stored entry when
+it is pushed: a record of the binary export format (see history_io), sealed
+with the history key if the history is encrypted (the other devices then
+need the same key file). Sensitive clips are never synced. Pulled clips are
+added like imported ones: deduplicated, but not grouped as versions.
+
+The device id, the outbox, the operations the server has not acknowledged
+and the clock are kept in their own database next to the history. The
+first time a device syncs, its whole history goes into the outbox.
+
+A server can fall behind the devices, when it starts over with an empty log
+or is restored from a backup. A device that finds a new server id forgets
+its clock and sends its whole history again. A device whose own operations
+are missing on the server sends its whole history again under a new device
+id, so the other devices pull it from the start whatever they applied
+before. Clips sent twice are deduplicated where they are applied.
+"""
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from history_io import entry_record, pack_record, unpack_record
+from sync_client import SyncClient, SyncError
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE = 2.0  # Seconds without a capture before the outbox is pushed
+MAX_DELAY = 10.0  # Seconds a captured clip waits at most
+PUSH_BATCH = 500  # Operations per push
+PULL_BATCH = 1000  # Operations per pull
+PULL_INTERVAL = 30.0  # Seconds between two pulls
+MIN_BACKOFF = 1.0  # Seconds before the first retry after a failure
+MAX_BACKOFF = 300.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY, digest TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS unacked (seq INTEGER PRIMARY KEY, body BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS clock (device TEXT PRIMARY KEY, seq INTEGER NOT NULL);
+"""
+
+
+class HistorySync:
+    """Pushes captured clips to a sync server and applies those of other devices, in a worker thread."""
+
+    def __init__(self, store, address, apply, path=None, debounce=DEBOUNCE, max_delay=MAX_DELAY,
+                 pull_interval=PULL_INTERVAL):
+        self.store = store
+        self.cipher = store.cipher
+        self.client = SyncClient(address)
+        self.apply = apply  # Called with the records pulled from other devices, from the worker thread
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.pull_interval = pull_interval
+
+        self.connected = False
+        self.pushed = 0
+        self.pulled = 0
+        self.pending = 0  # Operations in the outbox or not acknowledged yet
+
+        path = Path(path) if path is not None else Path(store.path).with_name("sync.db")
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self.device = self._meta("device")
+        self._clock = dict(self._db.execute("SELECT device, seq FROM clock"))
+        self._server_clock = {}
+
+        self._recorded = []  # Digests of captured clips, taken by the worker thread
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="history-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Push what is pending if the server is reachable, then stop the worker thread."""
+        self._stopping = True
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.client.close()
+        self._db.close()
+
+    def record(self, digests):
+        """Queue captured clips for the next push."""
+        if not digests:
+            return
+        with self._lock:
+            self._recorded.extend(digests)
+        self._wake_event.set()
+
+    # --- State ---
+
+    def _meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, name, value):
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def _count_pending(self):
+        (outbox,) = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()
+        (unacked,) = self._db.execute("SELECT COUNT(*) FROM unacked").fetchone()
+        self.pending = outbox + unacked
+
+    def _bootstrap(self):
+        """Queue the whole history, the first time this device syncs."""
+        if self.device is not None:
+            return
+        start = time.perf_counter()
+        with self._db:
+            self._queue_history(0)
+            # Committed together with the outbox, so an interrupted bootstrap starts over
+            self.device = uuid.uuid4().hex
+            self._set_meta("device", self.device)
+        self._count_pending()
+        elapsed = (time.perf_counter() - start) * 1000
+        logger.info(f"Queued {self.pending} clipboard entries for the first sync in {elapsed:.0f} ms")
+
+    def _queue_history(self, seq):
+        """Put the whole history into the outbox, to be numbered after seq, within the caller's transaction."""
+        self._db.execute("DELETE FROM unacked")
+        self._db.executemany(
+            "INSERT OR IGNORE INTO outbox (digest) VALUES (?)",
+            (
+                (entry["digest"],) for entry in self.store.iter_entries()
+                if entry["expires_at"] is None and not entry["superseded"]
+            ),
+        )
+        self._set_meta("seq", seq)
+
+    def _acked(self):
+        """Return the last operation of this device the server acknowledged."""
+        (first,) = self._db.execute("SELECT MIN(seq) FROM unacked").fetchone()
+        return first - 1 if first is not None else int(self._meta("seq"))
+
+    def _check_server(self, response):
+        """Note the server's clock and catch up if the server fell behind; returns True if it did."""
+        self._server_clock = response["clock"]
+        server, known = response.get("server"), self._meta("server")
+        if server is not None and server != known:
+            with self._db:
+                self._set_meta("server", server)
+                if known is not None:
+                    self._db.execute("DELETE FROM clock")
+                    self._queue_history(0)
+            if known is None:
+                return False
+            logger.warning("The sync server started over; sending the whole history again")
+            self._clock = {}
+            self._count_pending()
+            return True
+
+        stored = self._server_clock.get(self.device, 0)
+        if stored < self._acked():
+            logger.warning(f"The sync server only has operations up to {stored}; sending the whole history again")
+            previous, self.device = self.device, uuid.uuid4().hex
+            with self._db:
+                self._queue_history(0)
+                self._set_meta("device", self.device)
+                # What the server kept under the old id is already here
+                self._db.execute("INSERT OR REPLACE INTO clock (device, seq) VALUES (?, ?)", (previous, stored))
+            self._clock[previous] = stored
+            self._count_pending()
+            return True
+        return False
+
+    def _take_recorded(self):
+        with self._lock:
+            recorded, self._recorded = self._recorded, []
+        if recorded:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO outbox (digest) VALUES (?)", ((digest,) for digest in recorded)
+                )
+            self._count_pending()
+        return bool(recorded)
+
+    # --- Worker ---
+
+    def _run(self):
+        try:
+            self._bootstrap()
+            self._count_pending()
+        except Exception:
+            logger.exception("Could not prepare the history sync")
+            return
+        first_recorded = last_recorded = None
+        next_pull = retry_at = time.monotonic()
+        backoff = MIN_BACKOFF
+        while True:
+            now = time.monotonic()
+            if self._take_recorded():
+                if first_recorded is None:
+                    first_recorded = now
+                last_recorded = now
+            push_at = None
+            if self.pending:
+                # Leftovers of an earlier run or a failed push go right away
+                push_at = now if first_recorded is None else min(
+                    last_recorded + self.debounce, first_recorded + self.max_delay
+                )
+            if self._stopping:
+                if self.pending and self.connected:
+                    self._sync(push=True, pull=False)
+                return
+
+            if now >= retry_at:
+                push = push_at is not None and now >= push_at
+                pull = now >= next_pull
+                if self._sync(push, pull):
+                    backoff = MIN_BACKOFF
+                    if pull:
+                        next_pull = now + self.pull_interval
+                    if push:
+                        first_recorded = last_recorded = push_at = None
+                        if self._behind():
+                            next_pull = now  # Other devices pushed meanwhile
+                else:
+                    retry_at = now + backoff
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+
+            wake_at = next_pull if push_at is None else min(push_at, next_pull)
+            self._wake_event.wait(max(0.0, max(wake_at, retry_at) - time.monotonic()))
+            self._wake_event.clear()
+
+    def _sync(self, push, pull):
+        """Push and pull as asked; returns False if the server could not be reached."""
+        try:
+            if push:
+                self._push()
+            if pull:
+                self._pull()
+        except SyncError as e:
+            if self.connected:
+                logger.warning(f"History sync interrupted: {e}")
+            self.connected = False
+            return False
+        except Exception:
+            logger.exception("History sync failed")
+            self.connected = False
+            return False
+        if not self.connected:
+            logger.info(f"History synced with {self.client.address[0]}:{self.client.address[1]}")
+        self.connected = True
+        return True
+
+    def _behind(self):
+        return any(
+            seq > self._clock.get(device, 0)
+            for device, seq in self._server_clock.items() if device != self.device
+        )
+
+    # --- Push ---
+
+    def _push(self):
+        """Push the outbox and the unacknowledged operations until the server has them all."""
+        self.store.flush()  # Operations are built from the stored entries
+        while True:
+            self._build_operations()
+            rows = self._db.execute(
+                "SELECT seq, body FROM unacked ORDER BY seq LIMIT ?", (PUSH_BATCH,)
+            ).fetchall()
+            if not rows:
+                return
+            response, _ = self.client.request(
+                {"op": "push", "device": self.device, "ops": [{"seq": seq, "size": len(body)} for seq, body in rows]},
+                [body for _, body in rows],
+            )
+            if self._check_server(response):
+                continue
+            acked = response["acked"]
+            if acked < rows[0][0]:
+                raise SyncError(f"Sync server did not store operation {rows[0][0]}")
+            with self._db:
+                self._db.execute("DELETE FROM unacked WHERE seq <= ?", (acked,))
+            self.pushed += sum(seq <= acked for seq, _ in rows)
+            self._count_pending()
+
+    def _build_operations(self):
+        """Turn the oldest clips of the outbox into numbered operations, unless enough are unacknowledged."""
+        (unacked,) = self._db.execute("SELECT COUNT(*) FROM unacked").fetchone()
+        if unacked >= PUSH_BATCH:
+            return
+        rows = self._db.execute("SELECT id, digest FROM outbox ORDER BY id LIMIT ?", (PUSH_BATCH,)).fetchall()
+        if not rows:
+            return
+        seq = int(self._meta("seq"))
+        operations = []
+        for _, digest in rows:
+            entry = self.store.get_entry(digest)
+            if entry is None or entry["expires_at"] is not None or entry["superseded"]:
+                continue  # Expired or replaced by a newer version meanwhile
+            seq += 1
+            operations.append((seq, self._seal(pack_record(entry_record(self.store, entry)), self.device, seq)))
+        with self._db:
+            self._db.executemany("INSERT INTO unacked (seq, body) VALUES (?, ?)", operations)
+            self._db.execute("DELETE FROM outbox WHERE id <= ?", (rows[-1][0],))
+            self._set_meta("seq", seq)
+
+    def _seal(self, body, device, seq):
+        if self.cipher is None:
+            return body
+        return self.cipher.seal(body, f"{device}:{seq}".encode("ascii"))
+
+    # --- Pull ---
+
+    def _pull(self):
+        """Apply the operations of the other devices past the clock."""
+        while True:
+            response, bodies = self.client.request(
+                {"op": "pull", "device": self.device, "clock": self._clock, "limit": PULL_BATCH}
+            )
+            if self._check_server(response):
+                continue
+            clock = dict(self._clock)
+            records = []
+            unreadable = 0
+            for op, body in zip(response["ops"], bodies):
+                clock[op["device"]] = op["seq"]
+                try:
+                    records.append(unpack_record(self._open(body, op["device"], op["seq"])))
+                except ValueError:
+                    unreadable += 1
+            if unreadable:
+                logger.warning(f"Skipped {unreadable} sync operations that could not be read (another history key?)")
+            if records:
+                self.apply(records)  # Committed before the clock moves past them
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO clock (device, seq) VALUES (?, ?)",
+                    [(device, seq) for device, seq in clock.items() if seq != self._clock.get(device)],
+                )
+            self._clock = clock
+            self.pulled += len(response["ops"])
+            if not response["more"]:
+                return
+
+    def _open(self, body, device, seq):
+        if self.cipher is None:
+            return body
+        return self.cipher.open(body, f"{device}:{seq}".encode("ascii"))
@@ -0,0 +1,79 @@
+"""Import and export of the history from the front-ends (see history_io).
+
+The daemon does the work; HistoryTransfer asks for the file and waits for the
+daemon on a separate connection and thread, so the front-end stays usable
+while millions of entries are processed.
+"""
+import threading
+from pathlib import Path
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtWidgets import QFileDialog
+
+from ipc_client import DaemonClient, DaemonError
+
+FILE_FILTERS = {
+    "JSON lines (*.jsonl)": "jsonl",
+    "Compact binary (*.clips)": "binary",
+}
+IMPORT_FILTER = "Clipboard history (*.jsonl *.json *.clips);;All files (*)"
+
+
+class HistoryTransfer(QObject):
+    """Runs one history import or export at a time in the background."""
+
+    finished = pyqtSignal(str, bool, str)  # Action, success, message for the user
+
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.client = client
+        self.busy = False
+
+    def export_history(self, parent_widget=None):
+        """Ask for a file and export the history to it."""
+        path, selected_filter = QFileDialog.getSaveFileName(
+            parent_widget, "Export Clipboard History",
+            str(Path.home() / "clipboard-history.jsonl"), ";;".join(FILE_FILTERS),
+        )
+        if path:
+            self._start("export", path, FILE_FILTERS.get(selected_filter))
+
+    def import_history(self, parent_widget=None):
+        """Ask for a file and import its entries."""
+        path, _ = QFileDialog.getOpenFileName(
+            parent_widget, "Import Clipboard History", str(Path.home()), IMPORT_FILTER
+        )
+        if path:
+            self._start("import", path)
+
+    def _start(self, action, path, file_format=None):
+        if self.busy:
+            self.finished.emit(action, False, "Another import or export is still running.")
+            return
+        self.busy = True
+        threading.Thread(
+            target=self._run, args=(action, path, file_format), name="history-transfer", daemon=True
+        ).start()
+
+    def _run(self, action, path, file_format):
+        try:
+            # A connection of its own, so other requests are not held up
+            client = DaemonClient(self.client.socket_path)
+            try:
+                if action == "export":
+                    count = client.export_history(path, file_format)
+                    message = f"Exported {count} entries to {path}."
+                else:
+                    counts = client.import_history(path)
+                    message = (
+                        f"Imported {counts['imported']} entries "
+                        f"({counts['duplicates']} duplicates and {counts['skipped']} secrets skipped)."
+                    )
+            finally:
+                client.close()
+        except (OSError, DaemonError) as e:
+            self.busy = False
+            self.finished.emit(action, False, str(e))
+            return
+        self.busy = False
+        self.finished.emit(action, True, message)
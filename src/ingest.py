@@ -0,0 +1,251 @@
+"""Clipboard ingestion pipeline.
+
+Captured clips flow through worker threads connected by bounded queues:
+
+    capture (submit) -> classify -> dedupe -> persist (HistoryStore writer)
+
+The classify stage also encodes the payload of non-text clips (see
+clipboard_sources.RichClip), so images are never converted on the GUI thread,
+and looks for secrets: sensitive entries get an expiry time, and the dedupe
+stage hands them to the expiry scheduler. The dedupe stage also counts every
+capture as a visit of the clip for the quick-paste ranking (see frecency).
+A clip that is a near-duplicate of a current entry (see near_duplicates)
+becomes the new version of that entry and is reported as replacing it.
+
+submit() never blocks: when the pipeline falls behind, new clips are dropped
+and counted instead of stalling the caller, which may be the GUI thread. The
+front-end is told about new entries through a single coalesced notification
+that fires at most once per min_interval; it then collects all pending
+updates at once with take_updates().
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+import metrics
+from classifier import MEDIA_CATEGORIES
+from frecency import entry_frecency, visit_score
+from history_store import make_entry
+from near_duplicates import band_keys, set_variant_key
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 256
+MIN_NOTIFY_INTERVAL = 0.1  # Seconds between two notifications
+
+_STOP = object()
+
+
+class IngestPipeline:
+    """Classifies, deduplicates and persists captured clips off the GUI thread."""
+
+    def __init__(self, store, history, classifier, on_updates, detector=None, expiry=None,
+                 ttl=None, ranking=None, variants=None, queue_size=QUEUE_SIZE,
+                 min_interval=MIN_NOTIFY_INTERVAL):
+        self.store = store
+        self.history = history
+        self.classifier = classifier
+        self.on_updates = on_updates
+        self.detector = detector  # SensitiveDetector, optional
+        self.expiry = expiry  # ExpiryScheduler of sensitive entries, optional
+        self.ttl = ttl  # Seconds sensitive entries are kept
+        self.ranking = ranking  # FrecencyIndex of the quick-paste picker, optional
+        self.variants = variants  # VariantIndex grouping near-duplicates, optional
+        self.min_interval = min_interval
+
+        self.captured = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.sensitive = 0
+        self.near_duplicates = 0
+
+        # Only the dedupe stage mutates history; readers take this lock
+        self.history_lock = threading.Lock()
+
+        self._classify_queue = queue.Queue(queue_size)
+        self._dedupe_queue = queue.Queue(queue_size)
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._notify_event = threading.Event()
+        self._stopping = False
+        self._dropping = False  # Only the first drop of a burst is logged
+        self._threads = [
+            threading.Thread(target=self._run_classify, name="ingest-classify", daemon=True),
+            threading.Thread(target=self._run_dedupe, name="ingest-dedupe", daemon=True),
+            threading.Thread(target=self._run_notify, name="ingest-notify", daemon=True),
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Process the clips already captured, then stop the worker threads."""
+        self._classify_queue.put(_STOP)
+        self._threads[0].join()
+        self._threads[1].join()
+        self._stopping = True
+        self._notify_event.set()
+        self._threads[2].join()
+
+    def submit(self, text, clip=None):
+        """Capture stage: queue a clip without blocking; returns False if it was dropped.
+
+        clip is the RichClip of non-text content, if any.
+        """
+        if clip is None and not text.strip():
+            return True
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self._classify_queue.put_nowait((text, clip, timestamp, time.perf_counter()))
+        except queue.Full:
+            if not self._dropping:
+                logger.warning("Ingestion queue full, dropping clipboard entries")
+            self._dropping = True
+            self.dropped += 1
+            return False
+        self._dropping = False
+        self.captured += 1
+        return True
+
+    def take_updates(self):
+        """Return and clear the pending (entry, replaced, evicted) updates, oldest first."""
+        with self._pending_lock:
+            updates, self._pending = self._pending, []
+        return updates
+
+    def snapshot(self):
+        """Return the entries of the in-memory history, newest first."""
+        with self.history_lock:
+            return list(self.history)
+
+    def backlog(self):
+        """Return the number of captured clips still waiting to be processed."""
+        return self._classify_queue.qsize() + self._dedupe_queue.qsize()
+
+    def _run_classify(self):
+        while True:
+            item = self._classify_queue.get()
+            if item is _STOP:
+                self._dedupe_queue.put(_STOP)
+                return
+            try:
+                item = self._classify(*item)
+            except Exception:
+                logger.exception("Could not prepare clipboard entry")
+                continue
+            if item is not None:
+                self._dedupe_queue.put(item)  # Blocks if dedupe lags
+
+    def _classify(self, text, clip, timestamp, captured_at):
+        """Return the item of a captured clip for the dedupe stage, or None to drop the clip."""
+        try:
+            category = MEDIA_CATEGORIES.get(clip.kind) if clip is not None else None
+            if category is None:
+                category = self.classifier.categorize(text)
+        except Exception:
+            logger.exception("Could not classify clipboard entry")
+            category = None
+
+        mime = payload = None
+        if clip is not None:
+            mime = clip.mime
+            try:
+                payload = clip.payload()
+            except Exception:
+                logger.exception(f"Could not encode {clip.kind} clip")
+                return None
+        entry = make_entry(text, category, timestamp, mime, payload)
+        if self.detector is not None:
+            reason = self.detector.detect(text, clip)
+            if reason is not None:
+                logger.debug(f"Sensitive clip: {reason}")
+                entry["expires_at"] = time.time() + self.ttl
+                self.sensitive += 1
+        signature = None
+        if self.variants is not None and entry["expires_at"] is None:
+            signature = set_variant_key(entry, text)
+        return entry, text, payload, signature, captured_at
+
+    def _run_dedupe(self):
+        while True:
+            item = self._dedupe_queue.get()
+            if item is _STOP:
+                return
+            try:
+                self._dedupe(*item)
+            except Exception:
+                logger.exception("Could not add clipboard entry to the history")
+
+    def _dedupe(self, entry, text, payload, signature, captured_at):
+        # The entry is completed first and queued for the store before any
+        # in-memory state changes, so a failure cannot leave memory ahead of disk
+        head = self.variants.find(entry, signature) if self.variants is not None else None
+        new_version = head is not None and head["digest"] != entry["digest"]
+        if new_version:
+            entry["group_key"] = head["group_key"] or head["digest"]  # The first version names the group
+        elif head is not None:
+            entry["group_key"] = head["group_key"]  # Copied again, still the current version
+        with self.history_lock:
+            # Front-ends drop the row of the earlier version
+            replaced = head if new_version else self.history.get(entry["digest"])
+        if self.ranking is not None:
+            previous = self.ranking.score(entry["digest"])
+            if previous is None and replaced is not None:
+                previous = self.ranking.score(replaced["digest"])
+                if previous is None:
+                    previous = entry_frecency(replaced)
+            entry["frecency"] = visit_score(time.time(), previous)
+
+        # Persist stage: the store's writer thread commits in batches
+        variant = (signature, band_keys(signature)) if signature is not None else None
+        self.store.add_entry(entry, text, unique=True, payload=payload, variant=variant)
+
+        with self.history_lock:
+            if new_version:
+                self.history.remove(head["digest"])
+            entry, _, evicted = self.history.add_entry(entry)
+        if new_version:
+            self.near_duplicates += 1
+            self.variants.remove(head["digest"])
+        elif replaced is not None:
+            self.deduplicated += 1
+        if self.variants is not None:
+            self.variants.add(entry, signature)
+        if self.ranking is not None:
+            if new_version:
+                self.ranking.remove(head["digest"])
+            self.ranking.add(entry)
+        if self.expiry is not None:
+            if entry["expires_at"] is not None:
+                self.expiry.schedule(entry["digest"], entry["expires_at"])
+            elif replaced is not None:
+                self.expiry.cancel(entry["digest"])
+        if metrics.ENABLED:
+            # Time from capture until the clip is in the in-memory history
+            metrics.REGISTRY.histogram("ingest.latency").record(
+                (time.perf_counter() - captured_at) * 1000
+            )
+
+        with self._pending_lock:
+            self._pending.append((entry, replaced, evicted))
+        self._notify_event.set()
+
+    def _run_notify(self):
+        last_notify = 0.0
+        while True:
+            self._notify_event.wait()
+            if self._stopping:
+                return
+
+            # Rate limit, so a burst of clips results in a single notification
+            delay = last_notify + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._notify_event.clear()
+            if self._stopping:
+                return  # stop() may have set the event while this thread slept
+            last_notify = time.monotonic()
+            self.on_updates()
@@ -0,0 +1,251 @@
+"""Client for the clipboard daemon's Unix domain socket API.
+
+See clipboard_daemon for the protocol. The front-ends use DaemonClient.connect(),
+which starts the daemon if it is not running yet.
+"""
+import base64
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from metrics import timed
+
+DEFAULT_SOCKET_PATH = Path.home() / ".clipboard_app" / "daemon.sock"
+DAEMON_SCRIPT = Path(__file__).with_name("clipboard_daemon.py")
+SPAWN_TIMEOUT = 10  # Seconds to wait for a spawned daemon
+PAGE_SIZE = 200  # Entries per "query" page unless a limit is given
+# Front-ends reload their view rather than apply more updates than this one by one
+RELOAD_THRESHOLD = 100
+
+
+class DaemonError(Exception):
+    """Raised when the daemon cannot be reached or rejects a request."""
+
+
+def encode_message(message):
+    """Return message as one line of JSON."""
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+class DaemonClient:
+    """Connection to a running clipboard daemon."""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH):
+        self.socket_path = str(socket_path)
+        self._lock = threading.Lock()  # One request at a time on the connection
+        self._socket = self._open()
+        self._file = self._socket.makefile("rb")
+
+        self._pending = []
+        self._expired = []
+        self._pending_lock = threading.Lock()
+        self._subscription = None
+
+    @classmethod
+    def connect(cls, socket_path=DEFAULT_SOCKET_PATH, spawn=True):
+        """Connect to the daemon, starting it first if needed and spawn is set."""
+        try:
+            return cls(socket_path)
+        except OSError:
+            if not spawn:
+                raise DaemonError(f"Clipboard daemon is not running at {socket_path}")
+
+        subprocess.Popen(
+            [sys.executable, str(DAEMON_SCRIPT), "--socket", str(socket_path)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + SPAWN_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            try:
+                return cls(socket_path)
+            except OSError:
+                continue
+        raise DaemonError(f"Clipboard daemon did not start at {socket_path}")
+
+    def _open(self):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.socket_path)
+        except OSError:
+            connection.close()
+            raise
+        return connection
+
+    def close(self):
+        if self._subscription is not None:
+            self._subscription.shutdown(socket.SHUT_RDWR)
+            self._subscription.close()
+        self._file.close()
+        self._socket.close()
+
+    @timed("daemon.request")
+    def request(self, op, **params):
+        """Send a request and return the daemon's response."""
+        with self._lock:
+            try:
+                self._socket.sendall(encode_message({"op": op, **params}))
+                line = self._file.readline()
+            except OSError as e:
+                raise DaemonError(f"Lost connection to the clipboard daemon: {e}")
+        if not line:
+            raise DaemonError("Clipboard daemon closed the connection")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise DaemonError(response.get("error", "Unknown daemon error"))
+        return response
+
+    def recent(self):
+        """Return the daemon's in-memory history, newest first."""
+        return self.request("recent")["entries"]
+
+    def query(self, category=None, before_id=None, limit=None):
+        """Return a page of stored entries; see HistoryStore.load_page()."""
+        return self.request("query", category=category, before_id=before_id, limit=limit)["entries"]
+
+    def search(self, query, category=None, prefix=False, limit=None):
+        """Return entries containing query; see HistoryStore.search()."""
+        return self.request(
+            "search", query=query, category=category, prefix=prefix, limit=limit
+        )["entries"]
+
+    def categories(self):
+        """Return the categories known to the daemon's classifier."""
+        return self.request("categories")["categories"]
+
+    def metrics(self):
+        """Return a snapshot of the daemon's metrics registry."""
+        return self.request("metrics")["metrics"]
+
+    def paste(self, digest, insert=False):
+        """Put the full text of the entry with the given digest on the clipboard.
+
+        The daemon writes the clipboard in the background; with insert it
+        also pastes the clip into the focused window.
+        """
+        self.request("paste", digest=digest, insert=insert)
+
+    def copy_text(self, text, secret=False):
+        """Put text on the clipboard without recording it; secret marks it for other clipboard managers."""
+        self.request("copy", text=text, secret=secret)
+
+    def pick(self, query, limit=None):
+        """Return (entries, complete): the clips best matching query, best first.
+
+        While complete is False the daemon stopped early to answer quickly;
+        asking again with the same query improves the results.
+        """
+        response = self.request("pick", query=query, limit=limit)
+        return response["entries"], response["complete"]
+
+    def versions(self, digest):
+        """Return the stored versions of the clip with the given digest, newest first."""
+        return self.request("versions", digest=digest)["entries"]
+
+    def text(self, digest, limit=None):
+        """Return the full text of the entry with the given digest, cut to limit characters if given."""
+        return self.request("text", digest=digest, limit=limit)["text"]
+
+    def thumbnail(self, digest):
+        """Return the PNG thumbnail of the image entry with the given digest."""
+        return base64.b64decode(self.request("thumbnail", digest=digest)["thumbnail"])
+
+    def export_history(self, path, file_format=None):
+        """Have the daemon write the history to path; returns the number of entries."""
+        return self.request("export", path=str(path), format=file_format)["count"]
+
+    def import_history(self, path):
+        """Have the daemon import the history file at path.
+
+        Returns a dict with the numbers of imported, duplicate and skipped entries.
+        """
+        response = self.request("import", path=str(path))
+        return {key: response[key] for key in ("imported", "duplicates", "skipped")}
+
+    def snippets(self, query="", folder=None, tag=None, limit=None):
+        """Return the snippets matching query, best first, with a preview of their body; see SnippetLibrary.lookup()."""
+        return self.request("snippets", query=query, folder=folder, tag=tag, limit=limit)["snippets"]
+
+    def snippet_folders(self):
+        """Return (folders, tags): the folder names and tags used by snippets, sorted."""
+        response = self.request("snippet_folders")
+        return response["folders"], response["tags"]
+
+    def snippet(self, key):
+        """Return the snippet with the given key, with its full body."""
+        return self.request("snippet", key=key)["snippet"]
+
+    def save_snippet(self, snippet):
+        """Store a snippet dict, a new one if it has no key; returns the stored snippet."""
+        return self.request("save_snippet", snippet=snippet)["snippet"]
+
+    def delete_snippet(self, key):
+        """Remove the snippet with the given key."""
+        self.request("delete_snippet", key=key)
+
+    def pin(self, digest, folder=None):
+        """Turn the clip with the given digest into a snippet; returns the snippet."""
+        return self.request("pin", digest=digest, folder=folder)["snippet"]
+
+    def paste_snippet(self, key, insert=False):
+        """Put a snippet on the clipboard with its placeholders filled in; with insert, paste it too."""
+        self.request("paste_snippet", key=key, insert=insert)
+
+    def analytics(self, days=None):
+        """Return the copy statistics and storage figures, with the copies per day of the last days."""
+        return self.request("analytics", days=days)["analytics"]
+
+    def compact(self):
+        """Have the daemon compact the stored history now instead of at the next interval."""
+        self.request("compact")
+
+    def subscribe(self, on_updates):
+        """Stream new entries; on_updates is called from a reader thread per batch.
+
+        The updates themselves are collected with take_updates() and
+        take_expired().
+        """
+        self._subscription = self._open()
+        self._subscription.sendall(encode_message({"op": "subscribe"}))
+        events = self._subscription.makefile("rb")
+        if not json.loads(events.readline() or "{}").get("ok"):
+            raise DaemonError("Clipboard daemon refused the subscription")
+
+        def read_events():
+            try:
+                for line in events:
+                    message = json.loads(line)
+                    with self._pending_lock:
+                        if message["event"] == "expired":
+                            self._expired.extend(
+                                (expired["digest"], expired["masked"]) for expired in message["expired"]
+                            )
+                        else:
+                            self._pending.extend(
+                                (update["entry"], update["replaced"], update["evicted"])
+                                for update in message["updates"]
+                            )
+                    on_updates()
+            except (OSError, ValueError):
+                pass  # Connection closed
+
+        threading.Thread(target=read_events, name="daemon-events", daemon=True).start()
+
+    def take_updates(self):
+        """Return and clear the (entry, replaced, evicted digests) updates, oldest first."""
+        with self._pending_lock:
+            updates, self._pending = self._pending, []
+        return updates
+
+    def take_expired(self):
+        """Return and clear the (digest, masked entry or None) of expired sensitive entries."""
+        with self._pending_lock:
+            expired, self._expired = self._expired, []
+        return expired
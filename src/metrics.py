@@ -0,0 +1,170 @@
+"""Lightweight instrumentation for the clipboard daemon and front-ends.
+
+Set CLIPBOARD_APP_METRICS=1 to enable it. The setting is read at import time:
+when it is off, timed() returns the function unchanged, so instrumented hot
+paths cost nothing. Front-ends pass the environment on to the daemon they
+start, so one variable covers every process.
+
+Each process has one registry (REGISTRY) holding latency histograms and
+gauges. Gauges are callables read when a snapshot is taken, so existing
+counters can be exposed without touching the code that updates them.
+Snapshots are served by the daemon's "metrics" request, shown in the debug
+window (metrics_window) and written to METRICS_DIR when a process exits.
+"""
+import atexit
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("CLIPBOARD_APP_METRICS", "") not in ("", "0")
+METRICS_DIR = Path.home() / ".clipboard_app" / "metrics"
+
+# Upper bounds of the latency buckets in milliseconds; the last bucket is open
+BUCKETS_MS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Histogram:
+    """Latency histogram with fixed, roughly logarithmic buckets."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, milliseconds):
+        index = bisect.bisect_left(BUCKETS_MS, milliseconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += milliseconds
+            self.max = max(self.max, milliseconds)
+
+    def percentile(self, fraction):
+        """Return the bucket bound below which fraction of the samples fall."""
+        with self._lock:
+            counts, count, maximum = list(self.counts), self.count, self.max
+        if not count:
+            return 0.0
+        rank = fraction * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(BUCKETS_MS[index], maximum) if index < len(BUCKETS_MS) else maximum
+        return maximum
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class Registry:
+    """Named histograms and gauges of one process."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        """Return the histogram called name, creating it on first use."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def gauge(self, name, function):
+        """Report function() as name in every snapshot."""
+        self.gauges[name] = function
+
+    def snapshot(self):
+        """Return the current values as a JSON-serializable dict."""
+        gauges = {}
+        for name, function in list(self.gauges.items()):
+            try:
+                gauges[name] = function()
+            except Exception as e:
+                logger.debug(f"Could not read gauge {name}: {e}")
+        if resource is not None:
+            gauges["process.max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {
+            "enabled": ENABLED,
+            "pid": os.getpid(),
+            "gauges": gauges,
+            "latency_ms": {name: histogram.summary() for name, histogram in list(self.histograms.items())},
+        }
+
+
+REGISTRY = Registry()
+
+
+def timed(name):
+    """Decorator recording the duration of each call in histogram name.
+
+    Returns the function itself when metrics are disabled.
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+        histogram = REGISTRY.histogram(name)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.record((time.perf_counter() - start) * 1000)
+
+        return wrapper
+
+    return decorator
+
+
+def dump(path):
+    """Write a snapshot of REGISTRY to path as JSON."""
+    path = Path(path)
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    path.write_text(json.dumps(REGISTRY.snapshot(), indent=2) + "\n")
+
+
+def dump_at_exit(process_name):
+    """Write the snapshot to METRICS_DIR/<process_name>.json when the process exits."""
+    if ENABLED:
+        atexit.register(dump, METRICS_DIR / f"{process_name}.json")
+
+
+def format_snapshot(title, snapshot):
+    """Return snapshot as a plain-text table."""
+    lines = [f"{title} (pid {snapshot['pid']})"]
+    for name, value in sorted(snapshot["gauges"].items()):
+        lines.append(f"  {name:<32}{value:>12}")
+    if snapshot["latency_ms"]:
+        lines.append(f"  {'latency (ms)':<32}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, summary in sorted(snapshot["latency_ms"].items()):
+        lines.append(
+            f"  {name:<32}{summary['count']:>8}{summary['p50']:>9.2f}{summary['p95']:>9.2f}"
+            f"{summary['p99']:>9.2f}{summary['max']:>9.2f}"
+        )
+    return "\n".join(lines)
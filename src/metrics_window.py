@@ -0,0 +1,48 @@
+"""Debug window showing the metrics of a front-end and of the clipboard daemon."""
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QFontDatabase
+from PyQt6.QtWidgets import QPlainTextEdit, QVBoxLayout, QWidget
+
+from ipc_client import DaemonError
+from metrics import REGISTRY, format_snapshot
+
+REFRESH_INTERVAL = 1000  # Milliseconds
+
+
+class MetricsWindow(QWidget):
+    """Periodically refreshed plain-text view of the metrics snapshots."""
+
+    def __init__(self, client, title="Front-end"):
+        super().__init__()
+        self.client = client
+        self.title = title
+        self.setWindowTitle("Clipboard Metrics")
+        self.resize(700, 500)
+
+        layout = QVBoxLayout(self)
+        self.text_view = QPlainTextEdit()
+        self.text_view.setReadOnly(True)
+        self.text_view.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        layout.addWidget(self.text_view)
+
+        # Only refresh while the window is open
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_INTERVAL)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        sections = [format_snapshot(self.title, REGISTRY.snapshot())]
+        try:
+            sections.append(format_snapshot("Daemon", self.client.metrics()))
+        except DaemonError as e:
+            sections.append(f"Daemon metrics unavailable: {e}")
+        self.text_view.setPlainText("\n\n".join(sections))
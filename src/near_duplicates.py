@@ -0,0 +1,211 @@
+"""Detection of near-duplicate clips.
+
+Copying the same paragraph again with different trailing whitespace, or the
+same link with different tracking parameters, should not add another entry.
+Clips are normalized first: line endings and trailing whitespace are
+unified and links lose their tracking parameters; clips with the same
+normalized text are variants of each other. Texts of at least MIN_LENGTH
+characters also get a MinHash signature of their character shingles, so that
+small edits (a fixed typo, a changed number) are variants too: two texts are
+variants when their signatures estimate a Jaccard similarity of at least
+MIN_SIMILARITY.
+
+Signatures are looked up by locality-sensitive hashing: each band of
+BAND_ROWS signature values is hashed to a key, and variants share at least
+one key with high probability, so a lookup is a single index lookup of a few
+keys whatever the size of the history. The most recent clips are
+looked up in memory (they may not be committed yet), older ones in the store
+(see HistoryStore.variant_candidates).
+
+A new variant becomes the current entry of its group and the entry it
+replaces is kept as an earlier version (see HistoryStore.versions).
+Non-text clips are only deduplicated exactly. An encrypted history stores
+no signatures, as band keys would reveal which entries are alike: there only
+the recent clips held in memory are compared by signature, older ones are
+grouped when they normalize to the same text.
+"""
+import hashlib
+import re
+import struct
+import zlib
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from history_store import text_digest
+
+MIN_LENGTH = 64  # Shorter texts are only grouped when they normalize to the same text
+MAX_LENGTH = 1024 * 1024  # Characters of the longest clip that is normalized
+MAX_SHINGLED = 16384  # Characters of the longest text that gets a signature
+SHINGLE_SIZE = 5  # Characters per shingle
+SIGNATURE_SIZE = 32  # MinHash values per signature
+BAND_ROWS = 4  # Signature values hashed into one band key
+MIN_SIMILARITY = 0.75  # Estimated Jaccard similarity of the shingles of two variants
+RECENT_CLIPS = 256  # Current entries looked up in memory
+
+URL = re.compile(r"https?://\S+\Z", re.IGNORECASE)
+TRACKING_PARAMETER = re.compile(
+    r"utm_\w+|fbclid|gclid|dclid|gbraid|wbraid|msclkid|yclid|mc_cid|mc_eid|igshid|_ga|_gl|ref_src",
+    re.IGNORECASE,
+)
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+SIGNATURE = struct.Struct(f"<{SIGNATURE_SIZE}I")
+
+# A shingle hash picks its signature slot with the top bits and competes with the rest
+_SLOT_SHIFT = 32 - (SIGNATURE_SIZE - 1).bit_length()
+_VALUE_MASK = (1 << _SLOT_SHIFT) - 1
+_EMPTY = 0xFFFFFFFF
+
+
+def normalize(text):
+    """Return the text that variants of a clip have in common."""
+    text = "\n".join(line.rstrip() for line in text.splitlines()).strip()
+    if URL.match(text):
+        return _normalize_url(text)
+    return text
+
+
+def _normalize_url(url):
+    try:
+        parts = urlsplit(url)
+        query = [
+            (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not TRACKING_PARAMETER.fullmatch(name)
+        ]
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if netloc.endswith(DEFAULT_PORTS.get(scheme, "\0")):
+        netloc = netloc.rsplit(":", 1)[0]
+    return urlunsplit((scheme, netloc, parts.path or "/", urlencode(query), parts.fragment))
+
+
+def signature(text):
+    """Return the packed MinHash signature of the shingles of text, or None for short texts.
+
+    Every shingle is hashed once and only competes for the slot its hash
+    picks (one-permutation hashing); empty slots borrow the value of the
+    next filled one, so that short texts compare as well as long ones.
+    """
+    if len(text) > MAX_SHINGLED:
+        return None
+    data = " ".join(text.lower().split()).encode("utf-8", "surrogatepass")
+    if len(data) < MIN_LENGTH:
+        return None  # Mostly whitespace
+    hashes = {
+        zlib.crc32(data[start : start + SHINGLE_SIZE]) * 0x9E3779B1 & 0xFFFFFFFF
+        for start in range(len(data) - SHINGLE_SIZE + 1)
+    }
+    values = [_EMPTY] * SIGNATURE_SIZE
+    for value in hashes:
+        slot = value >> _SLOT_SHIFT
+        value &= _VALUE_MASK
+        if value < values[slot]:
+            values[slot] = value
+    filled = list(values)
+    for slot, value in enumerate(filled):
+        if value == _EMPTY:
+            offset = 1
+            while filled[(slot + offset) % SIGNATURE_SIZE] == _EMPTY:
+                offset += 1
+            values[slot] = filled[(slot + offset) % SIGNATURE_SIZE] | offset << _SLOT_SHIFT
+    return SIGNATURE.pack(*values)
+
+
+def similarity(first, second):
+    """Return the Jaccard similarity of the shingles of two texts estimated from their signatures."""
+    equal = sum(a == b for a, b in zip(SIGNATURE.unpack(first), SIGNATURE.unpack(second)))
+    return equal / SIGNATURE_SIZE
+
+
+def band_keys(packed):
+    """Return the band keys of a signature, as signed 64-bit integers."""
+    band_size = 4 * BAND_ROWS
+    return [
+        int.from_bytes(
+            hashlib.blake2b(packed[start : start + band_size], digest_size=8, salt=bytes([start])).digest(),
+            "little", signed=True,
+        )
+        for start in range(0, len(packed), band_size)
+    ]
+
+
+def set_variant_key(entry, text):
+    """Set the variant_key of a new entry from its full text; returns its signature or None."""
+    if entry["mime"] is not None or len(text) > MAX_LENGTH:
+        return None
+    normalized = normalize(text)
+    entry["variant_key"] = text_digest(normalized)
+    if URL.match(normalized):
+        return None  # Links differing elsewhere are different pages
+    return signature(normalized)
+
+
+class VariantIndex:
+    """Finds the current entry that a new clip is a variant of."""
+
+    def __init__(self, store, recent=RECENT_CLIPS):
+        self.store = store
+        self.recent = recent
+        self._entries = OrderedDict()  # digest -> (recent current entry, signature), oldest first
+        self._keys = {}  # variant_key -> digest
+        self._bands = {}  # band key -> set of digests
+
+    def find(self, entry, packed=None):
+        """Return the current entry of the group of entry, or None if it starts a group.
+
+        packed is the signature of entry, if it has one. The entry found has
+        the digest of entry when the same clip is copied again.
+        """
+        key = entry["variant_key"]
+        if key is None:
+            return None
+        bands = band_keys(packed) if packed is not None else []
+        found = self._find_recent(key, packed, bands)
+        if found is not None:
+            return found
+        for candidate, other in self.store.variant_candidates(key, bands):
+            if candidate["variant_key"] == key or self._similar(packed, other):
+                return candidate
+        return None
+
+    def _find_recent(self, key, packed, bands):
+        digest = self._keys.get(key)
+        if digest is not None:
+            return self._entries[digest][0]
+        for band in bands:
+            for digest in self._bands.get(band, ()):
+                candidate, other = self._entries[digest]
+                if self._similar(packed, other):
+                    return candidate
+        return None
+
+    def _similar(self, packed, other):
+        return packed is not None and other is not None and similarity(packed, other) >= MIN_SIMILARITY
+
+    def add(self, entry, packed=None):
+        """Remember entry, with its signature packed, as the current entry of its group."""
+        if entry["variant_key"] is None:
+            return
+        self.remove(entry["digest"])
+        self._entries[entry["digest"]] = (entry, packed)
+        self._keys[entry["variant_key"]] = entry["digest"]
+        if packed is not None:
+            for band in band_keys(packed):
+                self._bands.setdefault(band, set()).add(entry["digest"])
+        while len(self._entries) > self.recent:
+            self.remove(next(iter(self._entries)))
+
+    def remove(self, digest):
+        """Forget the entry with the given digest, e.g. once a newer variant replaced it."""
+        entry, packed = self._entries.pop(digest, (None, None))
+        if entry is None:
+            return
+        if self._keys.get(entry["variant_key"]) == digest:
+            del self._keys[entry["variant_key"]]
+        if packed is not None:
+            for band in band_keys(packed):
+                digests = self._bands[band]
+                digests.discard(digest)
+                if not digests:
+                    del self._bands[band]
@@ -0,0 +1,141 @@
+"""Paste-back of history entries, off the daemon's request threads.
+
+Writing the clipboard can be slow: the polling source runs a subprocess per
+write on Linux, and large clips are first read back from the blob store.
+PasteBack does both on a worker thread, so a "paste" request is answered at
+once. Writes are coalesced: when several clips are picked in quick
+succession, only the last one is written.
+
+With insert, the clip is also pasted into the focused window by sending the
+platform's paste shortcut, once the menu or picker it was chosen from had
+INSERT_DELAY seconds to close and give the focus back. On Linux this needs
+xdotool (X11) or wtype (Wayland).
+"""
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INSERT_DELAY = 0.2  # Seconds between writing the clipboard and sending the paste shortcut
+SHORTCUT_TIMEOUT = 5  # Seconds to wait for the command sending the shortcut
+
+
+def paste_shortcut_command():
+    """Return the command that sends the paste shortcut to the focused window, or None."""
+    if sys.platform == "darwin":
+        return ["osascript", "-e", 'tell application "System Events" to keystroke "v" using command down']
+    if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wtype"):
+        return ["wtype", "-M", "ctrl", "v", "-m", "ctrl"]
+    if shutil.which("xdotool"):
+        return ["xdotool", "key", "--clearmodifiers", "ctrl+v"]
+    return None
+
+
+def can_send_paste_shortcut():
+    """Return True if the paste shortcut can be sent on this system."""
+    return sys.platform == "win32" or paste_shortcut_command() is not None
+
+
+def send_paste_shortcut():
+    """Send the paste shortcut to the focused window; returns False if that is not possible."""
+    if sys.platform == "win32":
+        import ctypes
+
+        keybd_event = ctypes.windll.user32.keybd_event
+        control, v, key_up = 0x11, 0x56, 0x0002
+        keybd_event(control, 0, 0, 0)
+        keybd_event(v, 0, 0, 0)
+        keybd_event(v, 0, key_up, 0)
+        keybd_event(control, 0, key_up, 0)
+        return True
+    command = paste_shortcut_command()
+    if command is None:
+        return False
+    try:
+        return subprocess.run(command, timeout=SHORTCUT_TIMEOUT, check=False).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+class PasteBack:
+    """Writes clips to the clipboard from a worker thread, the newest request only."""
+
+    def __init__(self, source, store, insert_delay=INSERT_DELAY):
+        self.source = source
+        self.store = store
+        self.insert_delay = insert_delay
+
+        self.written = 0
+        self.coalesced = 0  # Requests replaced by a newer one before they were written
+        self.inserted = 0
+
+        self._pending = None  # (entry, text, secret, insert) of the newest request
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._insert_warned = False
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="paste-back", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write the pending request, then stop the worker thread."""
+        self._stopping = True
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def paste(self, entry, insert=False):
+        """Queue writing the clip of a history entry, pasting it into the focused window with insert."""
+        self._queue((entry, None, False, insert))
+
+    def copy_text(self, text, secret=False, insert=False):
+        """Queue writing text that is not recorded in the history, e.g. a generated password or a snippet."""
+        self._queue((None, text, secret, insert))
+
+    def _queue(self, request):
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = request
+        self._wake_event.set()
+
+    def _run(self):
+        while True:
+            self._wake_event.wait()
+            self._wake_event.clear()
+            with self._lock:
+                request, self._pending = self._pending, None
+            if request is not None:
+                try:
+                    self._write(*request)
+                except Exception:
+                    logger.exception("Could not write the clipboard")
+            if self._stopping:
+                return
+
+    def _write(self, entry, text, secret, insert):
+        if entry is None:
+            self.source.write_text(text, secret=secret)
+        elif entry.get("mime"):
+            self.source.write_clip(self.store.full_text(entry), entry["mime"], self.store.payload(entry))
+        else:
+            self.source.write_text(self.store.full_text(entry))
+        self.written += 1
+        if not insert:
+            return
+        time.sleep(self.insert_delay)
+        if send_paste_shortcut():
+            self.inserted += 1
+        elif not self._insert_warned:
+            logger.warning("Cannot paste into the active window: install xdotool (X11) or wtype (Wayland)")
+            self._insert_warned = True
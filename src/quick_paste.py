@@ -0,0 +1,129 @@
+"""Keyboard-driven quick-paste picker.
+
+A popup with a query field above the clips of the whole history, ranked by
+the daemon by frecency and fuzzy match (see frecency). Typing filters, Up and
+Down choose, Enter pastes the chosen clip and Escape closes the picker. When
+the daemon cuts a ranking short to answer within a frame, the picker asks
+again from the event loop, so typing is never held up by a large history.
+"""
+import logging
+
+from PyQt6.QtCore import QEvent, Qt, QTimer, pyqtSignal
+from PyQt6.QtGui import QCursor, QGuiApplication
+from PyQt6.QtWidgets import QAbstractItemView, QApplication, QLineEdit, QListView, QVBoxLayout, QWidget
+
+from history_model import ENTRY_ROLE, ClipboardHistoryModel, HistoryItemDelegate
+from ipc_client import DaemonError
+
+PICKER_STYLESHEET = """
+    QWidget {
+        background-color: #2d2d2d;
+        color: #ffffff;
+    }
+    QLineEdit {
+        background-color: #3d3d3d;
+        border: 1px solid #555;
+        padding: 6px;
+        border-radius: 4px;
+    }
+    QListView {
+        border: none;
+    }
+"""
+NAVIGATION_KEYS = (Qt.Key.Key_Up, Qt.Key.Key_Down, Qt.Key.Key_PageUp, Qt.Key.Key_PageDown)
+
+
+class QuickPastePicker(QWidget):
+    """Popup that finds a clip by typing and pastes it with Enter."""
+
+    picked = pyqtSignal(object)  # Entry chosen by the user
+
+    def __init__(self, client, max_display_length=None):
+        super().__init__(None, Qt.WindowType.Popup)
+        self.client = client
+        self.setStyleSheet(PICKER_STYLESHEET)
+        self.resize(480, 360)
+
+        layout = QVBoxLayout(self)
+        self.query_field = QLineEdit()
+        self.query_field.setPlaceholderText("Type to find a clip, Enter to paste")
+        self.query_field.textChanged.connect(self.refresh)
+        self.query_field.installEventFilter(self)
+        layout.addWidget(self.query_field)
+
+        self.model = ClipboardHistoryModel(max_display_length)
+        self.list_view = QListView()
+        self.list_view.setModel(self.model)
+        self.list_view.setItemDelegate(HistoryItemDelegate())
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setFocusPolicy(Qt.FocusPolicy.NoFocus)  # Typing always goes to the query
+        self.list_view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.list_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.list_view.clicked.connect(self.pick)
+        layout.addWidget(self.list_view)
+
+        # Carries on with a ranking the daemon did not finish
+        self.more_timer = QTimer(self)
+        self.more_timer.setSingleShot(True)
+        self.more_timer.setInterval(0)
+        self.more_timer.timeout.connect(self.refresh)
+
+    def popup(self):
+        """Show the picker with an empty query next to the mouse pointer."""
+        self.query_field.clear()
+        self.refresh()
+        screen = QGuiApplication.screenAt(QCursor.pos()) or QGuiApplication.primaryScreen()
+        geometry = self.frameGeometry()
+        geometry.moveCenter(QCursor.pos())
+        area = screen.availableGeometry()
+        geometry.moveLeft(max(area.left(), min(geometry.left(), area.right() - geometry.width())))
+        geometry.moveTop(max(area.top(), min(geometry.top(), area.bottom() - geometry.height())))
+        self.move(geometry.topLeft())
+        self.show()
+        self.activateWindow()
+        self.query_field.setFocus()
+
+    def refresh(self):
+        """Show the clips ranked for the current query, keeping the chosen clip if still listed."""
+        self.more_timer.stop()
+        current = self.list_view.currentIndex().data(ENTRY_ROLE)
+        try:
+            entries, complete = self.client.pick(self.query_field.text())
+        except DaemonError as e:
+            logging.error(f"Could not rank the clipboard history: {e}")
+            return
+        self.model.set_entries(entries)
+
+        digests = [entry["digest"] for entry in entries]
+        row = digests.index(current["digest"]) if current is not None and current["digest"] in digests else 0
+        if entries:
+            self.list_view.setCurrentIndex(self.model.index(row))
+        if not complete:
+            self.more_timer.start()
+
+    def pick(self, index=None):
+        """Paste the clip at index, or the chosen one."""
+        if index is None:
+            index = self.list_view.currentIndex()
+        if not index.isValid():
+            return
+        self.hide()
+        self.picked.emit(index.data(ENTRY_ROLE))
+
+    def eventFilter(self, watched, event):
+        if watched is self.query_field and event.type() == QEvent.Type.KeyPress:
+            key = event.key()
+            if key in NAVIGATION_KEYS:
+                QApplication.sendEvent(self.list_view, event)
+                return True
+            if key in (Qt.Key.Key_Return, Qt.Key.Key_Enter):
+                self.pick()
+                return True
+            if key == Qt.Key.Key_Escape:
+                self.hide()
+                return True
+        return super().eventFilter(watched, event)
+
+    def hideEvent(self, event):
+        self.more_timer.stop()
+        super().hideEvent(event)
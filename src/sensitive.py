@@ -0,0 +1,142 @@
+"""Detection of secrets among captured clips.
+
+A clip is sensitive when the application that copied it marked it so (see
+clipboard_sources.is_concealed) or when it contains something that looks
+like a credential; passwords from our own generator are never recorded (see
+paste_back). All secret patterns are compiled into one alternation, so a clip
+is scanned once whatever the number of patterns. Digit runs only count as
+card numbers when they are grouped like one, start with an issuer's prefix
+and pass the Luhn check, so purging does not take order numbers or
+timestamps along.
+
+Sensitive entries get an expiry time; the daemon purges or masks them once it
+has passed (see expiry). Settings are read from a JSON file such as:
+
+    {"ttl": 60, "action": "mask",
+     "patterns": [{"name": "Internal token", "pattern": "itk_[0-9a-f]{32}"}]}
+"""
+import json
+import logging
+import re
+import secrets
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = Path.home() / ".clipboard_app" / "sensitive.json"
+DEFAULT_TTL = 60  # Seconds a sensitive clip is kept
+ACTIONS = ("purge", "mask")  # purge deletes expired entries, mask only their content
+MAX_SCAN_LENGTH = 64 * 1024  # Characters of a clip searched for secrets
+MASKED_TEXT = "\u2022" * 8 + " (expired secret)"
+
+BUILTIN_PATTERNS = [
+    ("Private key", r"-----BEGIN (?:[A-Z0-9]+ )*PRIVATE KEY-----"),
+    ("AWS access key", r"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b"),
+    ("GitHub token", r"\b(?:gh[pousr]_[A-Za-z0-9]{36,}|github_pat_[A-Za-z0-9_]{22,})"),
+    ("Slack token", r"\bxox[abposr]-[A-Za-z0-9-]{10,}"),
+    ("Stripe key", r"\b[rs]k_live_[A-Za-z0-9]{16,}"),
+    ("Google API key", r"\bAIza[0-9A-Za-z_-]{35}"),
+    ("JSON web token", r"\beyJ[A-Za-z0-9_-]{8,}\.eyJ[A-Za-z0-9_-]{8,}\.[A-Za-z0-9_-]{8,}"),
+    ("Credential", r"(?i:\b(?:api[_-]?key|secret|token|passw(?:or)?d)\b\s*[:=]\s*\S{8,})"),
+]
+CARD_NUMBER = r"\b[2-6](?:[ -]?\d){12,18}\b"  # Candidates, checked by is_card_number()
+# Issuer prefixes: Visa, Mastercard, American Express, Diners Club, JCB, Discover and UnionPay
+CARD_PREFIX = re.compile(r"4|5[1-5]|2(?:2[2-9]|[3-6]|7[01]|720)|3[47]|3(?:0[0-5]|[689])|35|6(?:011|4[4-9]|5|2)")
+CARD_GROUPS = {(4, 4, 4, 4), (4, 4, 4, 4, 3), (4, 6, 5), (4, 6, 4)}  # Digits per group when printed
+
+
+def luhn_valid(number):
+    """Return True if the digits of number pass the Luhn checksum."""
+    digits = [int(char) for char in number if char.isdigit()]
+    total = 0
+    for index, digit in enumerate(reversed(digits)):
+        if index % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def is_card_number(candidate):
+    """Return True if candidate, digits optionally grouped by spaces or dashes, is a card number."""
+    separators = set(re.findall(r"[ -]", candidate))
+    if len(separators) > 1:
+        return False
+    groups = tuple(len(group) for group in re.split(r"[ -]", candidate))
+    if len(groups) > 1 and groups not in CARD_GROUPS:
+        return False
+    return CARD_PREFIX.match(candidate) is not None and luhn_valid(candidate)
+
+
+def load_settings(config_path=DEFAULT_CONFIG_PATH):
+    """Return the settings from config_path with defaults for missing values."""
+    settings = {"ttl": DEFAULT_TTL, "action": ACTIONS[0], "patterns": []}
+    try:
+        with open(config_path, encoding="utf-8") as file:
+            config = json.load(file)
+    except FileNotFoundError:
+        return settings
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read sensitive-content settings from {config_path}: {e}")
+        return settings
+
+    ttl = config.get("ttl", DEFAULT_TTL)
+    if isinstance(ttl, (int, float)) and ttl > 0:
+        settings["ttl"] = ttl
+    else:
+        logger.warning(f"Ignoring invalid ttl {ttl!r}")
+    action = config.get("action", ACTIONS[0])
+    if action in ACTIONS:
+        settings["action"] = action
+    else:
+        logger.warning(f"Ignoring unknown action {action!r}")
+
+    for pattern in config.get("patterns", []):
+        try:
+            name, regex = pattern["name"], pattern["pattern"]
+            re.compile(regex)
+        except (KeyError, TypeError, re.error) as e:
+            logger.warning(f"Skipping invalid secret pattern {pattern!r}: {e}")
+            continue
+        settings["patterns"].append((name, regex))
+    return settings
+
+
+class SensitiveDetector:
+    """Tells whether a captured clip holds a secret."""
+
+    def __init__(self, patterns=(), max_length=MAX_SCAN_LENGTH):
+        self.max_length = max_length
+        patterns = list(patterns) + BUILTIN_PATTERNS
+        self.names = [name for name, _ in patterns]
+        parts = [f"(?P<s{index}>{regex})" for index, (_, regex) in enumerate(patterns)]
+        parts.append(f"(?P<card>{CARD_NUMBER})")
+        self._matcher = re.compile("|".join(parts))
+
+    def detect(self, text, clip=None):
+        """Return why the clip is sensitive, or None if it is not."""
+        if clip is not None and clip.sensitive:
+            return "Marked by the source application"
+        for match in self._matcher.finditer(text, 0, self.max_length):
+            name = match.lastgroup
+            if name != "card":
+                return self.names[int(name[1:])]
+            if is_card_number(match.group()):
+                return "Card number"
+        return None
+
+
+def masked_entry(entry):
+    """Return a copy of entry with its content replaced by a placeholder."""
+    return {
+        **entry,
+        "digest": secrets.token_hex(20),  # Unrelated to the secret
+        "text": MASKED_TEXT,
+        "label": MASKED_TEXT,
+        "size": len(MASKED_TEXT.encode("utf-8")),
+        "in_blob": False,
+        "mime": None,
+        "payload": None,
+        "expires_at": None,
+    }
@@ -0,0 +1,338 @@
+"""Front-end views of the snippet library (see snippets).
+
+SnippetEditor is a window to find, create, edit and delete snippets;
+SnippetMenu is a menu that looks snippets up by keyword, name or content as
+one types and pastes the chosen one. Both ask the daemon, which keeps the
+library indexed, so lookups stay instant with thousands of snippets.
+"""
+import logging
+
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtGui import QAction
+from PyQt6.QtWidgets import (
+    QComboBox,
+    QFormLayout,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QListWidget,
+    QListWidgetItem,
+    QMenu,
+    QMessageBox,
+    QPlainTextEdit,
+    QPushButton,
+    QVBoxLayout,
+    QWidget,
+    QWidgetAction,
+)
+
+from ipc_client import DaemonError
+
+EDITOR_LIMIT = 1000  # Snippets listed in the editor
+MENU_LIMIT = 15  # Snippets listed in the menu
+KEY_ROLE = Qt.ItemDataRole.UserRole
+ALL_FOLDERS = "All folders"
+PLACEHOLDER_HELP = (
+    "Placeholders: {date}, {time}, {datetime} (or {date:%d.%m.%Y}), "
+    "{clipboard} for the newest clip, {counter} for the number of pastes, {{ and }} for braces."
+)
+
+
+def snippet_title(snippet):
+    """Return the text a snippet is listed by."""
+    if snippet["keyword"]:
+        return f"{snippet['name']}  [{snippet['keyword']}]"
+    return snippet["name"]
+
+
+class SnippetEditor(QWidget):
+    """Window listing the snippets next to a form to edit the chosen one."""
+
+    paste_requested = pyqtSignal(str)  # Key of the snippet to paste
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.current_key = None  # Snippet shown in the form, None for a new one
+        self.setWindowTitle("Snippets")
+        self.resize(760, 480)
+
+        layout = QHBoxLayout(self)
+
+        # --- Lookup ---
+        list_layout = QVBoxLayout()
+        self.query_field = QLineEdit()
+        self.query_field.setPlaceholderText("Find by keyword, name or content...")
+        self.query_field.textChanged.connect(self.refresh)
+        list_layout.addWidget(self.query_field)
+
+        self.folder_filter = QComboBox()
+        self.folder_filter.currentIndexChanged.connect(self.refresh)
+        list_layout.addWidget(self.folder_filter)
+
+        self.snippet_list = QListWidget()
+        self.snippet_list.currentItemChanged.connect(self.on_current_changed)
+        self.snippet_list.itemDoubleClicked.connect(lambda item: self.paste_requested.emit(item.data(KEY_ROLE)))
+        list_layout.addWidget(self.snippet_list)
+
+        list_buttons = QHBoxLayout()
+        new_button = QPushButton("New")
+        new_button.clicked.connect(self.new_snippet)
+        list_buttons.addWidget(new_button)
+        self.delete_button = QPushButton("Delete")
+        self.delete_button.clicked.connect(self.delete_snippet)
+        list_buttons.addWidget(self.delete_button)
+        list_layout.addLayout(list_buttons)
+        layout.addLayout(list_layout, 2)
+
+        # --- Form ---
+        form_layout = QVBoxLayout()
+        form = QFormLayout()
+        self.name_field = QLineEdit()
+        self.name_field.setPlaceholderText("Taken from the body if empty")
+        form.addRow("Name", self.name_field)
+        self.keyword_field = QLineEdit()
+        self.keyword_field.setPlaceholderText("Short abbreviation to find it by")
+        form.addRow("Keyword", self.keyword_field)
+        self.folder_field = QComboBox()
+        self.folder_field.setEditable(True)
+        form.addRow("Folder", self.folder_field)
+        self.tags_field = QLineEdit()
+        self.tags_field.setPlaceholderText("Comma separated")
+        form.addRow("Tags", self.tags_field)
+        form_layout.addLayout(form)
+
+        self.body_field = QPlainTextEdit()
+        form_layout.addWidget(self.body_field)
+        help_label = QLabel(PLACEHOLDER_HELP)
+        help_label.setWordWrap(True)
+        form_layout.addWidget(help_label)
+
+        form_buttons = QHBoxLayout()
+        form_buttons.addStretch()
+        self.paste_button = QPushButton("Paste")
+        self.paste_button.clicked.connect(lambda: self.paste_requested.emit(self.current_key))
+        form_buttons.addWidget(self.paste_button)
+        save_button = QPushButton("Save")
+        save_button.clicked.connect(self.save_snippet)
+        form_buttons.addWidget(save_button)
+        form_layout.addLayout(form_buttons)
+        layout.addLayout(form_layout, 3)
+
+        self.new_snippet()
+
+    def showEvent(self, event):
+        self.refresh_folders()
+        self.refresh()
+        super().showEvent(event)
+
+    def show_snippet(self, key):
+        """Show the window with the given snippet in the form."""
+        self.query_field.clear()
+        self.folder_filter.setCurrentIndex(0)
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        self.select(key)
+
+    def refresh_folders(self):
+        """Offer the folders in use in the folder filter and field."""
+        try:
+            folders, _ = self.client.snippet_folders()
+        except DaemonError as e:
+            logging.error(f"Could not load the snippet folders: {e}")
+            return
+        chosen = self.folder_filter.currentText()
+        typed = self.folder_field.currentText()
+        self.folder_filter.blockSignals(True)
+        self.folder_filter.clear()
+        self.folder_filter.addItems([ALL_FOLDERS] + folders)
+        self.folder_filter.setCurrentIndex(max(0, self.folder_filter.findText(chosen)))
+        self.folder_filter.blockSignals(False)
+        self.folder_field.clear()
+        self.folder_field.addItems([""] + folders)
+        self.folder_field.setCurrentText(typed)
+
+    def refresh(self):
+        """List the snippets matching the query in the chosen folder, keeping the chosen one if listed."""
+        folder = self.folder_filter.currentText()
+        try:
+            snippets = self.client.snippets(
+                self.query_field.text(), None if folder in ("", ALL_FOLDERS) else folder, limit=EDITOR_LIMIT
+            )
+        except DaemonError as e:
+            logging.error(f"Could not load the snippets: {e}")
+            return
+        self.snippet_list.blockSignals(True)
+        self.snippet_list.clear()
+        for snippet in snippets:
+            item = QListWidgetItem(snippet_title(snippet))
+            item.setData(KEY_ROLE, snippet["key"])
+            item.setToolTip(snippet["body"] + ("..." if snippet["clipped"] else ""))
+            self.snippet_list.addItem(item)
+            if snippet["key"] == self.current_key:
+                self.snippet_list.setCurrentItem(item)
+        self.snippet_list.blockSignals(False)
+
+    def select(self, key):
+        """Show the snippet with the given key in the form and choose it in the list if listed."""
+        for row in range(self.snippet_list.count()):
+            item = self.snippet_list.item(row)
+            if item.data(KEY_ROLE) == key:
+                self.snippet_list.blockSignals(True)
+                self.snippet_list.setCurrentItem(item)
+                self.snippet_list.blockSignals(False)
+                break
+        self.load_snippet(key)
+
+    def on_current_changed(self, current, previous):
+        if current is not None:
+            self.load_snippet(current.data(KEY_ROLE))
+
+    def load_snippet(self, key):
+        """Fill the form with the snippet with the given key."""
+        try:
+            snippet = self.client.snippet(key)
+        except DaemonError as e:
+            QMessageBox.warning(self, "Snippets", f"Could not load the snippet: {e}")
+            return
+        self.current_key = key
+        self.name_field.setText(snippet["name"])
+        self.keyword_field.setText(snippet["keyword"])
+        self.folder_field.setCurrentText(snippet["folder"])
+        self.tags_field.setText(", ".join(snippet["tags"]))
+        self.body_field.setPlainText(snippet["body"])
+        self.paste_button.setEnabled(True)
+        self.delete_button.setEnabled(True)
+
+    def new_snippet(self):
+        """Clear the form for a new snippet."""
+        self.current_key = None
+        self.snippet_list.clearSelection()
+        self.snippet_list.setCurrentItem(None)
+        for field in (self.name_field, self.keyword_field, self.tags_field):
+            field.clear()
+        # New snippets go to the folder being looked at
+        folder = self.folder_filter.currentText() if self.folder_filter.currentIndex() > 0 else ""
+        self.folder_field.setCurrentText(folder)
+        self.body_field.clear()
+        self.paste_button.setEnabled(False)
+        self.delete_button.setEnabled(False)
+        self.name_field.setFocus()
+
+    def save_snippet(self):
+        """Store the snippet in the form."""
+        snippet = {
+            "key": self.current_key,
+            "name": self.name_field.text(),
+            "keyword": self.keyword_field.text(),
+            "folder": self.folder_field.currentText(),
+            "tags": self.tags_field.text(),
+            "body": self.body_field.toPlainText(),
+        }
+        try:
+            snippet = self.client.save_snippet(snippet)
+        except DaemonError as e:
+            QMessageBox.warning(self, "Snippets", f"Could not save the snippet: {e}")
+            return
+        self.current_key = snippet["key"]
+        self.refresh_folders()
+        self.refresh()
+        self.select(snippet["key"])
+
+    def delete_snippet(self):
+        """Delete the snippet in the form after asking."""
+        if self.current_key is None:
+            return
+        answer = QMessageBox.question(self, "Snippets", f"Delete the snippet {self.name_field.text()}?")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            self.client.delete_snippet(self.current_key)
+        except DaemonError as e:
+            QMessageBox.warning(self, "Snippets", f"Could not delete the snippet: {e}")
+            return
+        self.new_snippet()
+        self.refresh_folders()
+        self.refresh()
+
+
+class SnippetMenu(QMenu):
+    """Menu that looks snippets up while typing; choosing one pastes it."""
+
+    picked = pyqtSignal(str)  # Key of the chosen snippet
+    edit_requested = pyqtSignal()
+
+    def __init__(self, client=None, title="Snippets", parent=None):
+        super().__init__(title, parent)
+        self.client = client  # Set once the daemon is connected
+        self.result_actions = []
+        self.setToolTipsVisible(True)
+
+        self.query_field = QLineEdit()
+        self.query_field.setPlaceholderText("Keyword or name...")
+        self.query_field.textChanged.connect(self.refresh)
+        self.query_field.returnPressed.connect(self.pick_first)
+        query_widget = QWidget()
+        query_layout = QVBoxLayout(query_widget)
+        query_layout.addWidget(self.query_field)
+        query_layout.setContentsMargins(5, 5, 10, 5)
+        query_action = QWidgetAction(self)
+        query_action.setDefaultWidget(query_widget)
+        self.addAction(query_action)
+        self.addSeparator()
+
+        self.end_separator = self.addSeparator()
+        edit_action = QAction("Edit Snippets...", self)
+        edit_action.triggered.connect(self.edit_requested.emit)
+        self.addAction(edit_action)
+
+        self.aboutToShow.connect(self.refresh)
+        self.aboutToShow.connect(self.query_field.setFocus)
+
+    def refresh(self):
+        """List the snippets best matching the typed text."""
+        for action in self.result_actions:
+            self.removeAction(action)
+            action.deleteLater()
+        self.result_actions = []
+
+        if self.client is None:
+            self.add_result_action("Loading snippets...")
+            return
+        try:
+            snippets = self.client.snippets(self.query_field.text(), limit=MENU_LIMIT)
+        except DaemonError as e:
+            logging.error(f"Could not look up snippets: {e}")
+            self.add_result_action("Snippets unavailable")
+            return
+        if not snippets:
+            self.add_result_action("No snippets")
+        for snippet in snippets:
+            action = self.add_result_action(snippet["name"], snippet["key"])
+            if snippet["keyword"]:
+                action.setText(f"{snippet['name']}\t{snippet['keyword']}")  # Aligned like a shortcut
+            action.setToolTip(snippet["body"] + ("..." if snippet["clipped"] else ""))
+
+    def add_result_action(self, text, key=None):
+        action = QAction(text, self)
+        if key is None:
+            action.setEnabled(False)
+        else:
+            action.setData(key)
+            action.triggered.connect(lambda checked, key=key: self.picked.emit(key))
+        self.insertAction(self.end_separator, action)
+        self.result_actions.append(action)
+        return action
+
+    def pick_first(self):
+        """Paste the best match of the typed text."""
+        for action in self.result_actions:
+            if action.isEnabled():
+                self.picked.emit(action.data())
+                # Close the menus this one was opened from, as choosing an action does
+                menu = self
+                while isinstance(menu, QMenu):
+                    menu.hide()
+                    menu = menu.parentWidget()
+                return
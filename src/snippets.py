@@ -0,0 +1,286 @@
+"""Library of snippets: clips pinned out of the history, edited and kept.
+
+A snippet has a name, an optional keyword (a short abbreviation such as
+"sig"), a folder, tags and a body. The body is a template whose placeholders
+are filled in when the snippet is pasted (see expand()):
+
+    {date}, {time}, {datetime}   the current date and time; a strftime format
+                                 may follow a colon, as in {date:%d.%m.%Y}
+    {clipboard}                  the newest clip of the history
+    {counter}                    how often the snippet was pasted, this time included
+    {{ and }}                    literal braces
+
+Unknown placeholders are left as typed.
+
+Snippets are stored in the history database (see HistoryStore.save_snippet())
+and never expire. The library holds them all in memory with two indexes,
+built in the background when the daemon starts: the keywords in sorted
+order, so the snippets whose keyword starts with a query are found by binary
+search, and the trigrams of name, keyword, tags and the start of the body, so
+a longer query only looks at the snippets containing all of its trigrams. A
+lookup thus touches the matching snippets, not the whole library.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from history_store import make_label
+
+logger = logging.getLogger(__name__)
+
+SNIPPET_LIMIT = 50  # Snippets returned by lookup() by default
+NAME_LENGTH = 60  # Characters of a pinned clip used as the name of its snippet
+INDEX_LENGTH = 4096  # Characters of a body searched by lookup()
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMATS = {"date": "%Y-%m-%d", "time": "%H:%M", "datetime": "%Y-%m-%d %H:%M"}
+_PLACEHOLDER = re.compile(r"\{\{|\}\}|\{(\w+)(?::([^{}]*))?\}")
+
+
+def expand(body, clipboard="", counter=0, now=None):
+    """Return body with its placeholders filled in."""
+    now = now if now is not None else datetime.now()
+
+    def replace(match):
+        token, name, spec = match.group(0), match.group(1), match.group(2)
+        if name is None:
+            return token[0]  # {{ or }}
+        if name in DATE_FORMATS:
+            return now.strftime(spec or DATE_FORMATS[name])
+        if name == "clipboard":
+            return clipboard
+        if name == "counter":
+            return str(counter)
+        return token
+
+    return _PLACEHOLDER.sub(replace, body)
+
+
+def parse_tags(tags):
+    """Return the tags of a list or of a comma separated string, without duplicates."""
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return list(dict.fromkeys(tag.strip() for tag in tags if tag.strip()))
+
+
+def _trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _haystack(snippet):
+    """Return the lowercased text a snippet is looked up by."""
+    return "\n".join(
+        (snippet["name"], snippet["keyword"], " ".join(snippet["tags"]), snippet["body"][:INDEX_LENGTH])
+    ).lower()
+
+
+class SnippetLibrary:
+    """The stored snippets, indexed by keyword prefix and trigrams."""
+
+    def __init__(self, store):
+        self.store = store
+        self._snippets = {}  # key -> snippet
+        self._haystacks = {}  # key -> text matched by lookup()
+        self._keywords = []  # (lowercased keyword, key), sorted
+        self._trigrams = defaultdict(set)  # trigram -> keys of the snippets containing it
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+    def load(self):
+        """Read and index the stored snippets; until this is done, the other methods wait."""
+        start = time.perf_counter()
+        try:
+            with self._lock:
+                for snippet in self.store.load_snippets():
+                    self._index(snippet, sort=False)
+                self._keywords.sort()
+        except Exception:
+            logger.exception("Could not load the snippets")
+            return
+        finally:
+            self._loaded.set()
+        elapsed = (time.perf_counter() - start) * 1000
+        logger.info(f"Indexed {len(self._snippets)} snippets in {elapsed:.0f} ms")
+
+    def __len__(self):
+        return len(self._snippets)
+
+    def get(self, key):
+        """Return the snippet with the given key, or None."""
+        self._loaded.wait()
+        with self._lock:
+            snippet = self._snippets.get(key)
+            return dict(snippet) if snippet is not None else None
+
+    def folders(self):
+        """Return the names of the folders in use, sorted."""
+        self._loaded.wait()
+        with self._lock:
+            return sorted({snippet["folder"] for snippet in self._snippets.values() if snippet["folder"]})
+
+    def tags(self):
+        """Return the tags in use, sorted."""
+        self._loaded.wait()
+        with self._lock:
+            return sorted({tag for snippet in self._snippets.values() for tag in snippet["tags"]})
+
+    # --- Changes ---
+
+    def save(self, fields):
+        """Store a new snippet, or update the one with the key given in fields; returns it.
+
+        Raises ValueError if the body is empty or the keyword is taken by
+        another snippet.
+        """
+        self._loaded.wait()
+        with self._lock:
+            key = fields.get("key")
+            old = self._snippets.get(key) if key else None
+            now = datetime.now().strftime(TIMESTAMP_FORMAT)
+            snippet = {
+                "key": old["key"] if old is not None else uuid.uuid4().hex,
+                "name": (fields.get("name") or "").strip(),
+                "keyword": (fields.get("keyword") or "").strip(),
+                "folder": (fields.get("folder") or "").strip(),
+                "tags": parse_tags(fields.get("tags") or ()),
+                "body": fields.get("body") or "",
+                "counter": old["counter"] if old is not None else 0,
+                "created": old["created"] if old is not None else now,
+                "updated": now,
+            }
+            if not snippet["body"]:
+                raise ValueError("A snippet needs a body")
+            if not snippet["name"]:
+                snippet["name"] = make_label(snippet["body"])[:NAME_LENGTH]
+            if snippet["keyword"]:
+                taken = self._keyword_owner(snippet["keyword"].lower())
+                if taken is not None and taken != snippet["key"]:
+                    raise ValueError(f"The keyword {snippet['keyword']} is used by another snippet")
+            if old is not None:
+                self._unindex(old)
+            self._index(snippet)
+            self.store.save_snippet(dict(snippet))
+        return dict(snippet)
+
+    def pin(self, text, name=None, folder=None):
+        """Store text, typically a clip of the history, as a new snippet; returns it."""
+        return self.save({"name": name, "folder": folder, "body": text})
+
+    def delete(self, key):
+        """Remove a snippet; returns False if there is none with that key."""
+        self._loaded.wait()
+        with self._lock:
+            snippet = self._snippets.get(key)
+            if snippet is None:
+                return False
+            self._unindex(snippet)
+            self.store.delete_snippet(key)
+        return True
+
+    def expand(self, key, clipboard=""):
+        """Count a paste of a snippet and return its body with the placeholders filled in, or None."""
+        self._loaded.wait()
+        with self._lock:
+            snippet = self._snippets.get(key)
+            if snippet is None:
+                return None
+            snippet["counter"] += 1
+            self.store.save_snippet(dict(snippet))
+            body, counter = snippet["body"], snippet["counter"]
+        return expand(body, clipboard, counter)
+
+    # --- Lookup ---
+
+    def lookup(self, query="", folder=None, tag=None, limit=SNIPPET_LIMIT):
+        """Return up to limit snippets matching query, in the given folder and with the given tag.
+
+        Snippets whose keyword is the query come first, then those whose
+        keyword starts with it, then those whose name starts with it, then
+        the ones containing it anywhere (ignoring case), each by name. An
+        empty query lists all snippets by folder and name.
+        """
+        self._loaded.wait()
+        needle = query.strip().lower()
+        with self._lock:
+            if needle:
+                order = sorted(
+                    (self._rank(self._snippets[key], needle), self._snippets[key]["name"].lower(), key)
+                    for key in self._matches(needle)
+                )
+                ranked = [self._snippets[key] for _, _, key in order]
+            else:
+                ranked = sorted(
+                    self._snippets.values(),
+                    key=lambda snippet: (snippet["folder"].lower(), snippet["name"].lower()),
+                )
+            results = []
+            for snippet in ranked:
+                if folder is not None and snippet["folder"] != folder:
+                    continue
+                if tag is not None and tag not in snippet["tags"]:
+                    continue
+                results.append(dict(snippet))
+                if limit is not None and len(results) >= limit:
+                    break
+            return results
+
+    def _matches(self, needle):
+        """Return the keys of the snippets matching a lowercased query."""
+        keys = set()
+        start = bisect.bisect_left(self._keywords, (needle,))
+        for keyword, key in self._keywords[start:]:
+            if not keyword.startswith(needle):
+                break
+            keys.add(key)
+        if len(needle) < 3:
+            candidates = self._haystacks  # Too short for the trigram index
+        else:
+            postings = sorted((self._trigrams.get(trigram, ()) for trigram in _trigrams(needle)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        keys.update(key for key in candidates if needle in self._haystacks[key])
+        return keys
+
+    def _rank(self, snippet, needle):
+        keyword = snippet["keyword"].lower()
+        if keyword == needle:
+            return 0
+        if keyword.startswith(needle):
+            return 1
+        if snippet["name"].lower().startswith(needle):
+            return 2
+        return 3
+
+    def _keyword_owner(self, keyword):
+        index = bisect.bisect_left(self._keywords, (keyword,))
+        if index < len(self._keywords) and self._keywords[index][0] == keyword:
+            return self._keywords[index][1]
+        return None
+
+    def _index(self, snippet, sort=True):
+        key = snippet["key"]
+        self._snippets[key] = snippet
+        haystack = self._haystacks[key] = _haystack(snippet)
+        for trigram in _trigrams(haystack):
+            self._trigrams[trigram].add(key)
+        if snippet["keyword"]:
+            item = (snippet["keyword"].lower(), key)
+            if sort:
+                bisect.insort(self._keywords, item)
+            else:
+                self._keywords.append(item)
+
+    def _unindex(self, snippet):
+        key = snippet["key"]
+        del self._snippets[key]
+        for trigram in _trigrams(self._haystacks.pop(key)):
+            keys = self._trigrams[trigram]
+            keys.discard(key)
+            if not keys:
+                del self._trigrams[trigram]
+        if snippet["keyword"]:
+            index = bisect.bisect_left(self._keywords, (snippet["keyword"].lower(), key))
+            del self._keywords[index]
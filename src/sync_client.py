@@ -0,0 +1,132 @@
+"""Client for the history sync protocol (see history_sync and sync_server).
+
+Devices talk to the sync server over TCP in frames: a 4-byte big-endian
+length followed by that many bytes of zlib-compressed data, which hold the
+4-byte length of a JSON message, the message and the bodies of the
+operations it lists, back to back:
+
+    {"op": "push", "device": "...", "ops": [{"seq": 1, "size": 120}, ...]}
+        -> {"ok": true, "acked": 42, "clock": {"<device>": 42, ...}, "server": "..."}
+    {"op": "pull", "device": "...", "clock": {"<device>": 17, ...}, "limit": 500}
+        -> {"ok": true, "ops": [{"device": "...", "seq": 18, "size": 96}, ...],
+            "more": false, "clock": {...}, "server": "..."}
+
+Every device numbers its operations 1, 2, 3... "push" stores them and answers
+the highest sequence number of the device stored without a gap. "pull"
+returns the operations of the other devices that come after the given clock
+(the last sequence number applied per device), at most limit at a time.
+Both answer the server's clock, the last sequence number stored per device,
+and the id of the server's operation log, which changes when the server
+starts over with an empty log. The server never looks into operation bodies.
+
+Failed requests are answered with {"ok": false, "error": "..."}.
+"""
+import json
+import socket
+import struct
+import zlib
+
+DEFAULT_PORT = 8765
+LENGTH = struct.Struct(">I")
+MAX_FRAME = 64 * 1024 * 1024  # Bytes of a frame, compressed or not
+TIMEOUT = 30  # Seconds to wait for the server
+
+
+class SyncError(Exception):
+    """Raised when the sync server cannot be reached or rejects a request."""
+
+
+def parse_address(address):
+    """Return (host, port) of a "host:port" or "host" address."""
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, DEFAULT_PORT
+    return host.strip("[]"), int(port)
+
+
+def encode_frame(message, bodies=()):
+    """Return the frame of a message and the bodies of the operations it lists."""
+    header = json.dumps(message).encode("utf-8")
+    data = zlib.compress(LENGTH.pack(len(header)) + header + b"".join(bodies))
+    return LENGTH.pack(len(data)) + data
+
+
+def read_frame(file):
+    """Return the next frame of a binary file object as is, or None at the end of the stream."""
+    prefix = file.read(LENGTH.size)
+    if not prefix:
+        return None
+    if len(prefix) < LENGTH.size:
+        raise ValueError("Truncated sync frame")
+    (length,) = LENGTH.unpack(prefix)
+    if length > MAX_FRAME:
+        raise ValueError("Sync frame too large")
+    data = file.read(length)
+    if len(data) < length:
+        raise ValueError("Truncated sync frame")
+    return prefix + data
+
+
+def decode_frame(frame):
+    """Return (message, bodies) of a frame, where bodies are those of the operations listed."""
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(frame[LENGTH.size :], MAX_FRAME)
+    except zlib.error as e:
+        raise ValueError(f"Corrupted sync frame: {e}")
+    if decompressor.unconsumed_tail:
+        raise ValueError("Sync frame too large")
+    if len(data) < LENGTH.size:
+        raise ValueError("Truncated sync frame")
+    (length,) = LENGTH.unpack_from(data)
+    message = json.loads(data[LENGTH.size : LENGTH.size + length])
+    bodies = []
+    offset = LENGTH.size + length
+    for op in message.get("ops", ()):
+        bodies.append(data[offset : offset + op["size"]])
+        offset += op["size"]
+    if offset != len(data):
+        raise ValueError("Sync frame does not match its operations")
+    return message, bodies
+
+
+class SyncClient:
+    """Connection to a sync server, opened on the first request and again after a failure."""
+
+    def __init__(self, address, timeout=TIMEOUT):
+        self.address = address  # (host, port)
+        self.timeout = timeout
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._socket = None
+        self._file = None
+
+    def _open(self):
+        self._socket = socket.create_connection(self.address, self.timeout)
+        self._file = self._socket.makefile("rb")
+
+    def close(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = self._file = None
+
+    def request(self, message, bodies=()):
+        """Send a request with the bodies of its operations; returns (response, bodies)."""
+        frame = encode_frame(message, bodies)
+        try:
+            if self._socket is None:
+                self._open()
+            self._socket.sendall(frame)
+            self.bytes_sent += len(frame)
+            response = read_frame(self._file)
+            if response is None:
+                raise ValueError("closed the connection")
+            self.bytes_received += len(response)
+            response, bodies = decode_frame(response)
+        except (OSError, ValueError) as e:
+            self.close()
+            raise SyncError(f"Lost connection to the sync server: {e}")
+        if not response.get("ok"):
+            raise SyncError(response.get("error", "Unknown sync server error"))
+        return response, bodies
@@ -0,0 +1,174 @@
+"""Stand-in sync server for history_sync.
+
+Keeps the operation log of every device in SQLite and serves it with the
+protocol of sync_client. Operations are stored as they arrive, so the server
+works the same for encrypted histories. It is meant for a home network or a
+test run, not the internet: there is neither authentication nor TLS.
+
+    python src/sync_server.py --port 8765 --db ~/.clipboard_app/sync-server.db
+"""
+import argparse
+import logging
+import signal
+import socketserver
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+
+from sync_client import DEFAULT_PORT, decode_frame, encode_frame, read_frame
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path.home() / ".clipboard_app" / "sync-server.db"
+PULL_LIMIT = 1000  # Operations per pull answer
+PULL_BYTES = 4 * 1024 * 1024  # Bytes of operation bodies per pull answer, unless a single one is larger
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server.sync_server
+        while True:
+            try:
+                frame = read_frame(self.rfile)
+                if frame is None:
+                    return
+                message, bodies = decode_frame(frame)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping sync client {self.client_address[0]}: {e}")
+                return
+            response, bodies = server.handle_request(message, bodies)
+            self.wfile.write(encode_frame(response, bodies))
+
+
+class SyncServer:
+    """Stores the operations of all devices and serves them to the others."""
+
+    def __init__(self, path=DEFAULT_DB_PATH, address=("127.0.0.1", DEFAULT_PORT)):
+        self.address = address
+        Path(path).parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ops ("
+            "device TEXT NOT NULL, seq INTEGER NOT NULL, body BLOB NOT NULL, "
+            "PRIMARY KEY (device, seq)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('id', ?)", (uuid.uuid4().hex,))
+        # Tells devices whether this is still the log they synced with
+        (self.id,) = self._db.execute("SELECT value FROM meta WHERE name = 'id'").fetchone()
+        self._lock = threading.Lock()
+        # Last sequence number stored per device
+        self._clock = dict(self._db.execute("SELECT device, MAX(seq) FROM ops GROUP BY device"))
+        self._server = None
+
+    def start(self):
+        """Serve in a background thread; self.address is the bound address afterwards."""
+        self._server = _Server(self.address, _RequestHandler)
+        self._server.sync_server = self
+        self.address = self._server.server_address
+        threading.Thread(target=self._server.serve_forever, name="sync-server", daemon=True).start()
+        logger.info(f"Sync server listening on {self.address[0]}:{self.address[1]}")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self._db.close()
+
+    def handle_request(self, message, bodies):
+        """Return the response to a request and the bodies of the operations it lists."""
+        op = message.get("op")
+        try:
+            if op == "push":
+                return self._push(message["device"], message["ops"], bodies), []
+            if op == "pull":
+                return self._pull(message["device"], message["clock"], message.get("limit", PULL_LIMIT))
+        except (KeyError, TypeError, AttributeError) as e:
+            return {"ok": False, "error": f"Invalid request: {e}"}, []
+        except sqlite3.Error as e:
+            logger.exception(f"Could not handle {op} request")
+            return {"ok": False, "error": str(e)}, []
+        return {"ok": False, "error": f"Unknown operation: {op}"}, []
+
+    def _push(self, device, ops, bodies):
+        with self._lock:
+            last = self._clock.get(device, 0)
+            rows = []
+            for op, body in zip(ops, bodies):
+                seq = op["seq"]
+                if seq <= last:
+                    continue  # Sent again after an answer was lost
+                if seq != last + 1:
+                    break  # Operations are only stored without a gap
+                rows.append((device, seq, body))
+                last = seq
+            if rows:
+                with self._db:
+                    self._db.executemany("INSERT INTO ops (device, seq, body) VALUES (?, ?, ?)", rows)
+                self._clock[device] = last
+            return {"ok": True, "acked": last, "clock": dict(self._clock), "server": self.id}
+
+    def _pull(self, device, clock, limit):
+        limit = max(1, min(limit, PULL_LIMIT))
+        with self._lock:
+            server_clock = dict(self._clock)
+            ops, bodies = [], []
+            size = 0
+            for other, last in sorted(server_clock.items()):
+                after = clock.get(other, 0)
+                if other == device or after >= last:
+                    continue
+                rows = self._db.execute(
+                    "SELECT seq, body FROM ops WHERE device = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (other, after, limit - len(ops)),
+                )
+                for seq, body in rows:
+                    if ops and size + len(body) > PULL_BYTES:
+                        break
+                    ops.append({"device": other, "seq": seq, "size": len(body)})
+                    bodies.append(body)
+                    size += len(body)
+                if len(ops) >= limit or size >= PULL_BYTES:
+                    break
+        sent = {}
+        for op in ops:
+            sent[op["device"]] = op["seq"]
+        more = any(
+            sent.get(other, clock.get(other, 0)) < last
+            for other, last in server_clock.items() if other != device
+        )
+        return {"ok": True, "ops": ops, "more": more, "clock": server_clock, "server": self.id}, bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in clipboard history sync server")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on (0 picks one)")
+    parser.add_argument("--db", default=str(DEFAULT_DB_PATH), help="operation log database")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    server = SyncServer(args.db, (args.host, args.port))
+    server.start()
+    print(f"{server.address[0]}:{server.address[1]}", flush=True)  # For scripts that picked port 0
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    stopped.wait()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Thumbnails of image clips.
+
+The daemon scales images down on request and caches the result in a blob
+store next to the history. Front-ends fetch thumbnails through
+ThumbnailLoader, which talks to the daemon from a worker thread and tells
+the model when a thumbnail is ready.
+"""
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtCore import QBuffer, QIODevice, QObject, Qt, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from ipc_client import DaemonError
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = 64  # Pixels, longest side
+CACHE_SIZE = 200  # Thumbnails kept in memory per front-end
+
+
+def make_thumbnail(data, size=THUMBNAIL_SIZE):
+    """Return a PNG of at most size x size pixels of the image data."""
+    image = QImage.fromData(data)
+    if image.isNull():
+        raise ValueError("Not an image")
+    thumbnail = image.scaled(
+        size, size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation
+    )
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    thumbnail.save(buffer, "PNG")
+    return bytes(buffer.data())
+
+
+class ThumbnailLoader(QObject):
+    """Fetches thumbnails from the daemon off the GUI thread and caches them."""
+
+    thumbnail_ready = pyqtSignal(str)  # Entry digest
+
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.client = client
+        self._cache = OrderedDict()  # digest -> QImage, least recently used first
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnails")
+
+    def get(self, digest):
+        """Return the cached thumbnail of an entry, or None after scheduling its loading."""
+        image = self._cache.get(digest)
+        if image is not None:
+            self._cache.move_to_end(digest)
+            return image
+        if digest not in self._pending:
+            self._pending.add(digest)
+            self._executor.submit(self._load, digest)
+        return None
+
+    def _load(self, digest):
+        try:
+            image = QImage.fromData(self.client.thumbnail(digest))
+        except DaemonError as e:
+            logger.warning(f"Could not load thumbnail: {e}")
+            return  # Stays pending, so it is not requested again
+        self._cache[digest] = image
+        while len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        self._pending.discard(digest)
+        self.thumbnail_ready.emit(digest)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
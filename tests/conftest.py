@@ -0,0 +1,19 @@
+"""Shared fixtures; the modules under test live in src/."""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from history_store import HistoryStore  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A history store in a temporary directory, closed after the test."""
+    history_store = HistoryStore(tmp_path / "history.db")
+    yield history_store
+    history_store.close()
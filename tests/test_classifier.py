@@ -0,0 +1,48 @@
+from classifier import DEFAULT_CATEGORY, Classifier, load_rules
+
+
+def test_builtin_categories():
+    classifier = Classifier()
+    assert classifier.categorize("https://example.com/page") == "URLs"
+    assert classifier.categorize("someone@example.com") == "Emails"
+    assert classifier.categorize("+1 555-0100".replace(" ", "")) == "Numbers"
+    assert classifier.categorize("just some words") == DEFAULT_CATEGORY
+
+
+def test_whole_rules_must_match_the_entire_clip():
+    classifier = Classifier()
+    assert classifier.categorize("write to someone@example.com") == DEFAULT_CATEGORY
+    assert classifier.categorize("12 apples") == DEFAULT_CATEGORY
+
+
+def test_every_matching_category_is_reported_in_rule_order():
+    classifier = Classifier([("Tickets", r"[A-Z]+-\d+", False), ("Projects", r"[A-Z]+", False)])
+    assert classifier.classify("ABC-123") == ["Tickets", "Projects"]
+    assert classifier.classify("lowercase") == [DEFAULT_CATEGORY]
+
+
+def test_long_clips_only_use_prefix_rules():
+    classifier = Classifier(max_length=100)
+    assert classifier.categorize("https://example.com/" + "a" * 200) == "URLs"
+    assert classifier.categorize("1" * 200) == DEFAULT_CATEGORY
+
+
+def test_categories_list_defaults_rules_and_media():
+    classifier = Classifier([("Tickets", r"[A-Z]+-\d+", True)])
+    assert classifier.categories == [DEFAULT_CATEGORY, "Tickets", "Images", "Files"]
+
+
+def test_user_rules_come_first_and_invalid_ones_are_skipped(tmp_path):
+    config = tmp_path / "categories.json"
+    config.write_text(
+        '{"categories": [{"name": "Tickets", "pattern": "[A-Z]+-\\\\d+"},'
+        ' {"name": "Broken", "pattern": "("}, {"pattern": "no name"}]}'
+    )
+    rules = load_rules(config)
+    assert rules[0] == ("Tickets", r"[A-Z]+-\d+", True)
+    assert "Broken" not in [name for name, _, _ in rules]
+    assert Classifier(rules).categorize("JIRA-42") == "Tickets"
+
+
+def test_missing_config_gives_the_builtin_rules(tmp_path):
+    assert [name for name, _, _ in load_rules(tmp_path / "missing.json")] == ["Numbers", "URLs", "Emails"]
@@ -0,0 +1,61 @@
+import pytest
+
+import compaction
+import sensitive
+from clipboard_daemon import ClipboardDaemon
+from clipboard_sources import FakeClipboardSource
+from history_store import HistoryStore, make_entry
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    # Writes stay queued until flushed, as while the writer is busy
+    store = HistoryStore(tmp_path / "history.db", flush_interval=60)
+    daemon = ClipboardDaemon(
+        tmp_path / "daemon.sock", store=store, source=FakeClipboardSource(""),
+        sensitive_settings=sensitive.load_settings(tmp_path / "sensitive.json"),
+        retention_settings=compaction.load_settings(tmp_path / "retention.json"),
+    )
+    yield daemon
+    store.close()
+
+
+def add(store, text, second):
+    store.add_entry(make_entry(text, "Text", f"2024-01-01 10:00:{second:02d}"), text)
+
+
+def texts(response):
+    assert response["ok"], response
+    return [entry["text"] for entry in response["entries"]]
+
+
+def test_search_and_first_page_include_clips_not_committed_yet(daemon):
+    add(daemon.store, "committed clip", 0)
+    daemon.store.flush()
+    add(daemon.store, "queued clip", 1)
+
+    assert texts(daemon.handle_request({"op": "search", "query": "clip"})) == ["queued clip", "committed clip"]
+    assert texts(daemon.handle_request({"op": "search", "query": "QUEUED", "prefix": True})) == ["queued clip"]
+    assert texts(daemon.handle_request({"op": "query"})) == ["queued clip", "committed clip"]
+    assert texts(daemon.handle_request({"op": "query", "category": "URLs"})) == []
+    assert len(daemon.store.queued_entries()) == 1  # Answered without waiting for the writer
+
+
+def test_first_page_ends_with_a_stored_entry(daemon):
+    add(daemon.store, "only clip", 0)
+
+    entries = daemon.handle_request({"op": "query"})["entries"]
+    assert [entry["text"] for entry in entries] == ["only clip"]
+    assert "id" in entries[-1]
+
+
+def test_category_pages_only_hold_that_category(daemon):
+    for i in range(5):
+        daemon.store.add_entry(make_entry(f"https://example.org/{i}", "URLs", "2024-01-01 10:00:00"),
+                               f"https://example.org/{i}")
+        add(daemon.store, f"note {i}", i)
+    daemon.store.flush()
+
+    first = daemon.handle_request({"op": "query", "category": "URLs", "limit": 3})["entries"]
+    rest = daemon.handle_request({"op": "query", "category": "URLs", "before_id": first[-1]["id"]})["entries"]
+    assert [entry["text"] for entry in first + rest] == [f"https://example.org/{i}" for i in reversed(range(5))]
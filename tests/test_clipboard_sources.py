@@ -0,0 +1,153 @@
+import time
+
+import pyperclip
+import pytest
+
+import clipboard_sources
+from clipboard_sources import (
+    MIN_CONTENT_POLL_INTERVAL,
+    MIN_POLL_INTERVAL,
+    SELF_WRITE_FORMAT,
+    FakeClipboardSource,
+    PollingClipboardSource,
+)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def system_clipboard(monkeypatch):
+    """Stands in for pyperclip; returns the list holding the clipboard text."""
+    clipboard = [""]
+    monkeypatch.setattr(pyperclip, "paste", lambda: clipboard[0])
+    monkeypatch.setattr(pyperclip, "copy", lambda text: clipboard.__setitem__(0, text))
+    return clipboard
+
+
+def test_fake_source_reports_the_current_clip_on_start():
+    source = FakeClipboardSource("initial")
+    changes = []
+    source.subscribe(lambda text, clip: changes.append(text))
+    source.start()
+    assert changes == ["initial"]
+
+
+def test_fake_source_skips_the_current_clip_if_asked():
+    source = FakeClipboardSource("initial")
+    changes = []
+    source.subscribe(lambda text, clip: changes.append(text))
+    source.start(skip_current=True)
+    source.set_text("next")
+    assert changes == ["next"]
+
+
+def test_repeated_and_empty_changes_are_reported_once():
+    source = FakeClipboardSource()
+    changes = []
+    source.subscribe(lambda text, clip: changes.append(text))
+    for text in ("a", "a", "", "b", "b", "a"):
+        source.set_text(text)
+    assert changes == ["a", "b", "a"]
+
+
+def test_own_writes_are_not_reported():
+    source = FakeClipboardSource()
+    changes = []
+    source.subscribe(lambda text, clip: changes.append(text))
+    source.write_text("written by us")
+    source.set_text("written by us")
+    source.set_text("copied elsewhere")
+    assert changes == ["copied elsewhere"]
+
+
+def test_polling_backs_off_while_idle_and_speeds_up_on_activity(system_clipboard):
+    source = PollingClipboardSource(min_interval=0.01, max_interval=0.08)
+    changes = []
+    source.subscribe(lambda text, clip: changes.append(text))
+    source.start(skip_current=True)
+    try:
+        assert wait_for(lambda: source.interval == source.max_interval)
+        system_clipboard[0] = "copied"
+        source.notify_activity()
+        assert source.interval == source.min_interval
+        assert wait_for(lambda: changes == ["copied"])
+    finally:
+        source.stop()
+
+
+def test_polling_is_slower_without_a_change_counter(monkeypatch):
+    monkeypatch.setattr(clipboard_sources, "_platform_change_counter", lambda: None)
+    assert PollingClipboardSource().min_interval == MIN_CONTENT_POLL_INTERVAL
+    assert PollingClipboardSource(change_counter=lambda: 0).min_interval == MIN_POLL_INTERVAL
+
+
+def test_polling_only_reads_when_the_change_counter_moves(system_clipboard, monkeypatch):
+    counter = [0]
+    reads = []
+    monkeypatch.setattr(pyperclip, "paste", lambda: reads.append(1) or system_clipboard[0])
+    source = PollingClipboardSource(change_counter=lambda: counter[0])
+    changes = []
+    source.subscribe(lambda text, clip: changes.append(text))
+
+    system_clipboard[0] = "first"
+    assert source._poll()
+    assert not source._poll()
+    assert len(reads) == 1
+
+    system_clipboard[0] = "second"
+    assert not source._poll()  # Counter did not move
+    counter[0] += 1
+    assert source._poll()
+    assert changes == ["first", "second"]
+
+
+def test_polling_does_not_report_its_own_writes(system_clipboard, monkeypatch):
+    counter = [0]
+
+    def copy(text):
+        system_clipboard[0] = text
+        counter[0] += 1
+
+    source = PollingClipboardSource(change_counter=lambda: counter[0])
+    monkeypatch.setattr(pyperclip, "copy", copy)
+    changes = []
+    source.subscribe(lambda text, clip: changes.append(text))
+
+    source.write_text("ours")
+    assert not source._poll()
+    copy("theirs")
+    assert source._poll()
+    assert changes == ["theirs"]
+
+
+def test_qt_source_skips_clips_tagged_as_its_own():
+    QtGui = pytest.importorskip("PyQt6.QtGui")
+    from PyQt6.QtCore import QMimeData
+
+    from clipboard_sources import QtClipboardSource
+
+    app = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+    clipboard = app.clipboard()
+    source = QtClipboardSource(clipboard)
+    changes = []
+    source.subscribe(lambda text, clip: changes.append(text))
+    source.start(skip_current=True)
+    try:
+        source.write_text("ours")
+        app.processEvents()
+        assert clipboard.mimeData().hasFormat(SELF_WRITE_FORMAT)
+
+        external = QMimeData()
+        external.setText("theirs")
+        clipboard.setMimeData(external)
+        app.processEvents()
+        assert changes == ["theirs"]
+    finally:
+        source.stop()
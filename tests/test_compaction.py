@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import compaction
+from compaction import CompactionJob, analytics
+from history_store import make_entry
+
+NOW = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def add(store, text, category, timestamp=NOW):
+    store.add_entry(make_entry(text, category, timestamp), text)
+
+
+def test_settings_ignore_invalid_values(tmp_path):
+    path = tmp_path / "retention.json"
+    path.write_text('{"interval": -1, "max_entries": null, "max_age_days": {"URLs": 30, "Text": "old"}}')
+    settings = compaction.load_settings(path)
+    assert settings["interval"] == compaction.DEFAULT_INTERVAL
+    assert settings["max_entries"] is None
+    assert settings["max_age_days"] == {"URLs": 30}
+
+
+def test_compaction_applies_retention_and_keeps_statistics(store, tmp_path):
+    add(store, "https://old.example.org", "URLs", "2020-01-01 10:00:00")
+    add(store, "old note", "Text", "2020-01-01 10:00:00")
+    for i in range(4):
+        add(store, f"note {i}", "Text")
+    store.flush()
+
+    removed = []
+    settings = compaction.load_settings(tmp_path / "retention.json")
+    settings.update(max_age_days={"URLs": 30}, max_entries=3)
+    job = CompactionJob(store, removed.extend, settings)
+    job.compact()
+
+    assert sorted(entry["text"] for entry in removed) == ["https://old.example.org", "note 0", "old note"]
+    assert [entry["text"] for entry in store.load_page()] == ["note 3", "note 2", "note 1"]
+    stats = analytics(store)
+    assert stats["copies"] == 6  # Removed entries still count
+    assert stats["entries"] == 3
+    assert stats["last_compaction"] is not None
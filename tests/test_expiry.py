@@ -0,0 +1,60 @@
+import threading
+import time
+
+from expiry import ExpiryScheduler, TimerWheel
+
+
+def test_timers_fire_once_their_deadline_passed():
+    wheel = TimerWheel(span=10, now=100)
+    wheel.schedule("a", 102.5)
+    wheel.schedule("b", 105)
+    assert len(wheel) == 2 and "a" in wheel
+    assert wheel.advance(102) == []
+    assert wheel.advance(103) == ["a"]
+    assert wheel.advance(104) == []
+    assert wheel.advance(105) == ["b"]
+    assert len(wheel) == 0
+
+
+def test_cancelled_and_rescheduled_timers():
+    wheel = TimerWheel(span=10, now=0)
+    wheel.schedule("a", 2)
+    wheel.schedule("b", 2)
+    wheel.cancel("a")
+    wheel.schedule("b", 6)  # Copied again, later deadline
+    assert wheel.advance(3) == []
+    assert wheel.advance(6) == ["b"]
+
+
+def test_deadlines_beyond_a_revolution_wait_for_their_turn():
+    wheel = TimerWheel(span=4, now=0)
+    wheel.schedule("far", 12)
+    for now in range(1, 12):
+        assert wheel.advance(now) == [], now
+    assert wheel.advance(12) == ["far"]
+
+
+def test_a_long_sleep_fires_everything_due():
+    wheel = TimerWheel(span=5, now=0)
+    wheel.schedule("a", 2)
+    wheel.schedule("b", 4)
+    wheel.schedule("c", 200)
+    assert sorted(wheel.advance(100)) == ["a", "b"]
+    assert "c" in wheel
+    assert wheel.advance(200) == ["c"]
+
+
+def test_scheduler_calls_back_from_its_thread():
+    expired = []
+    done = threading.Event()
+    scheduler = ExpiryScheduler(lambda keys: (expired.extend(keys), done.set()), span=1, tick=0.05)
+    scheduler.start()
+    try:
+        scheduler.schedule("secret", time.time() + 0.1)
+        scheduler.schedule("cancelled", time.time() + 0.1)
+        scheduler.cancel("cancelled")
+        assert done.wait(2)
+        assert expired == ["secret"]
+        assert len(scheduler) == 0
+    finally:
+        scheduler.stop()
@@ -0,0 +1,46 @@
+import math
+
+import pytest
+
+from frecency import HALF_LIFE, FrecencyIndex, visit_score
+
+
+def clip(digest, text, frecency):
+    return {"digest": digest, "text": text, "frecency": frecency, "timestamp": None}
+
+
+def test_visits_decay_by_half_life():
+    now = 100 * HALF_LIFE
+    assert visit_score(now, visit_score(now)) == visit_score(now) + 1  # Two visits count double
+    assert visit_score(now, visit_score(now - HALF_LIFE)) == pytest.approx(visit_score(now) + math.log2(1.5))
+
+
+def test_rank_prefers_frecent_clips_and_good_matches():
+    index = FrecencyIndex()
+    index.add_entries([clip("a", "git status", 10.0), clip("b", "grep -r todo", 12.0), clip("c", "notes", 11.0)])
+    assert index.rank("") == (["b", "c", "a"], True)
+    assert index.rank("gt") == (["b", "a"], True)  # Both match "g...t"; b is more frecent
+    assert index.rank("git s")[0] == ["a"]
+    assert index.rank("gi")[0] == ["a"]  # Narrowed from the matches of "g"
+
+    index.add(clip("a", "git status", 13.0))  # Pasted again
+    assert index.rank("")[0] == ["a", "b", "c"]
+    index.remove("b")
+    assert index.rank("gt")[0] == ["a"]
+    assert "b" not in index and len(index) == 2
+
+
+def test_exact_matches_outrank_more_frecent_scattered_ones():
+    index = FrecencyIndex()
+    index.add_entries([clip("typed", "deploy", 10.0), clip("scattered", "d e p l o y later", 14.0)])
+    assert index.rank("deploy")[0] == ["typed", "scattered"]
+
+
+def test_slow_scans_resume_where_they_stopped():
+    index = FrecencyIndex()
+    index.add_entries([clip(str(i), f"clip {i}", float(i % 7)) for i in range(5000)])
+    digests, complete = index.rank("clip 1", limit=5, budget=0)
+    assert not complete
+    while not complete:
+        digests, complete = index.rank("clip 1", limit=5)
+    assert len(digests) == 5 and all(index._clips[digest][1].startswith("clip 1") for digest in digests)
@@ -0,0 +1,72 @@
+from history_container import ClipboardHistory
+from history_store import BLOB_THRESHOLD, PREVIEW_LENGTH, make_entry
+
+
+def texts(history):
+    return [entry["text"] for entry in history]
+
+
+def test_entries_are_listed_newest_first():
+    history = ClipboardHistory()
+    for text in ("a", "b", "c"):
+        history.add(text)
+    assert texts(history) == ["c", "b", "a"]
+    assert len(history) == 3
+    assert "b" in history and "d" not in history
+
+
+def test_copying_again_moves_the_clip_to_the_front():
+    history = ClipboardHistory()
+    first, _, _ = history.add("a")
+    history.add("b")
+    entry, replaced, evicted = history.add("a")
+    assert texts(history) == ["a", "b"]
+    assert replaced is first
+    assert evicted == []
+    assert history.get(entry["digest"]) is entry
+
+
+def test_oldest_entries_are_evicted_beyond_max_entries():
+    history = ClipboardHistory(max_entries=2)
+    history.add("a")
+    history.add("b")
+    _, _, evicted = history.add("c")
+    assert texts(history) == ["c", "b"]
+    assert [entry["text"] for entry in evicted] == ["a"]
+
+
+def test_bytes_are_bounded_but_the_newest_entry_is_kept():
+    history = ClipboardHistory(max_bytes=10)
+    history.add("12345")
+    history.add("67890")
+    assert history.total_bytes == 10
+    _, _, evicted = history.add("x" * 20)
+    assert texts(history) == ["x" * 20]
+    assert len(evicted) == 2
+    assert history.total_bytes == 20
+
+
+def test_large_clips_only_count_their_preview():
+    history = ClipboardHistory()
+    text = "y" * (BLOB_THRESHOLD + 1)
+    history.add_entry(make_entry(text))
+    assert history.total_bytes == PREVIEW_LENGTH
+
+
+def test_remove_and_replace_keep_the_byte_count():
+    history = ClipboardHistory()
+    a, _, _ = history.add("aaa")
+    history.add("bb")
+    masked = make_entry("masked!")
+    assert history.replace(a["digest"], masked) is a
+    assert texts(history) == ["bb", "masked!"]
+    assert history.total_bytes == 9
+    assert history.remove(masked["digest"]) is masked
+    assert history.remove(masked["digest"]) is None
+    assert history.total_bytes == 2
+
+
+def test_load_takes_stored_entries_newest_first():
+    history = ClipboardHistory()
+    history.load([make_entry("new"), make_entry("old")])
+    assert texts(history) == ["new", "old"]
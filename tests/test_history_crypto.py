@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("cryptography")
+
+from history_crypto import UnlockError, unlock  # noqa: E402
+
+
+def test_key_needs_a_passphrase_and_unlocks_with_it(tmp_path):
+    key_path = tmp_path / "history.key"
+    with pytest.raises(UnlockError, match="CLIPBOARD_APP_PASSPHRASE"):
+        unlock(key_path, passphrase="", create=True)
+    assert not key_path.exists()
+
+    cipher = unlock(key_path, passphrase="correct horse", create=True)
+    record = cipher.seal(b"clip " * 40, b"row 1")
+    assert unlock(key_path, passphrase="correct horse").open(record, b"row 1") == b"clip " * 40
+    with pytest.raises(UnlockError, match="Wrong passphrase"):
+        unlock(key_path, passphrase="battery staple")
+    with pytest.raises(UnlockError, match="locked"):
+        unlock(key_path, passphrase="")
+    with pytest.raises(ValueError):
+        cipher.open(record, b"row 2")  # Records cannot move between rows
@@ -0,0 +1,104 @@
+import io
+
+import pytest
+
+from classifier import Classifier
+from history_io import (
+    export_history,
+    import_history,
+    import_records,
+    pack_record,
+    read_records,
+    unpack_record,
+    write_binary,
+    write_jsonl,
+)
+from history_store import BLOB_THRESHOLD, HistoryStore, make_entry
+from sensitive import SensitiveDetector
+
+RECORDS = [
+    {"text": "plain text", "timestamp": "2024-01-01 10:00:00", "category": "Text", "mime": None, "data": None},
+    {"text": "ünïcödé ✓", "timestamp": "2024-01-02 10:00:00", "category": None, "mime": None, "data": None},
+    {"text": "Image 1×1", "timestamp": "2024-01-03 10:00:00", "category": "Images", "mime": "image/png",
+     "data": b"\x89PNG\x00\xff"},
+]
+
+
+@pytest.mark.parametrize("writer", [write_jsonl, write_binary])
+def test_records_survive_both_formats(writer):
+    file = io.BytesIO()
+    assert writer(RECORDS, file) == len(RECORDS)
+    file.seek(0)
+    read = list(read_records(io.BufferedReader(file)))
+    assert [{name: record.get(name) for name in RECORDS[0]} for record in read] == RECORDS  # JSON lines omit nulls
+
+
+def test_packed_records_round_trip():
+    for record in RECORDS:
+        assert unpack_record(pack_record(record)) == record
+    with pytest.raises(ValueError):
+        unpack_record(pack_record(RECORDS[0])[:-1])
+
+
+def test_invalid_files_are_rejected():
+    with pytest.raises(ValueError, match="line 2"):
+        list(read_records(io.BufferedReader(io.BytesIO(b'{"text": "ok"}\n{"no": "text"}\n'))))
+    truncated = io.BytesIO()
+    write_binary(RECORDS, truncated)
+    with pytest.raises(ValueError, match="Truncated"):
+        list(read_records(io.BufferedReader(io.BytesIO(truncated.getvalue()[:-2]))))
+
+
+@pytest.mark.parametrize("line, reason", [
+    (b'{"text": "hello", "timestamp": 5}', "timestamp is not a string"),
+    (b'{"text": "hello", "timestamp": "yesterday"}', "YYYY-MM-DD"),
+    (b'{"text": "hello", "category": ["Text"]}', "category is not a string"),
+    (b'{"text": "hello", "mime": 1}', "mime is not a string"),
+    (b'{"text": "hello", "data": 7}', "data is not a base64 string"),
+    (b'{"text": "hello", "data": "not base64!"}', "line 1"),
+    (b'["hello"]', "not an object"),
+])
+def test_records_with_wrong_field_types_are_rejected(line, reason):
+    with pytest.raises(ValueError, match=reason):
+        list(read_records(io.BufferedReader(io.BytesIO(line + b"\n"))))
+
+
+def test_binary_records_with_malformed_timestamps_are_rejected():
+    with pytest.raises(ValueError, match="YYYY-MM-DD"):
+        unpack_record(pack_record({"text": "hello", "timestamp": "yesterday"}))
+
+
+@pytest.mark.parametrize("name", ["history.jsonl", "history.clips"])
+def test_export_and_import_round_trip(store, tmp_path, name):
+    big = "z" * (BLOB_THRESHOLD + 1)
+    for text, timestamp in (("first", "2024-01-01 10:00:00"), (big, "2024-01-02 10:00:00")):
+        store.add_entry(make_entry(text, "Text", timestamp), text)
+    image = make_entry("Image 1×1", "Images", "2024-01-03 10:00:00", "image/png", b"PNGDATA")
+    store.add_entry(image, image["text"], payload=b"PNGDATA")
+    store.flush()
+
+    path = tmp_path / name
+    assert export_history(store, path) == 3
+
+    other = HistoryStore(tmp_path / "other" / "history.db")
+    try:
+        counts = import_history(other, path, Classifier())
+        assert counts == {"imported": 3, "duplicates": 0, "skipped": 0}
+        entries = other.load_page()
+        assert [entry["timestamp"] for entry in entries] == [
+            "2024-01-03 10:00:00", "2024-01-02 10:00:00", "2024-01-01 10:00:00"
+        ]
+        assert other.full_text(entries[1]) == big
+        assert other.payload(entries[0]) == b"PNGDATA"
+        assert import_history(other, path, Classifier()) == {"imported": 0, "duplicates": 3, "skipped": 0}
+    finally:
+        other.close()
+
+
+def test_import_skips_secrets_and_reports_batches(store):
+    records = [{"text": f"clip {i}"} for i in range(5)] + [{"text": "clip 0"}, {"text": "password: hunter2hunter2"}]
+    batches = []
+    counts = import_records(store, records, Classifier(), SensitiveDetector(), on_batch=batches.append)
+    assert counts == {"imported": 5, "duplicates": 1, "skipped": 1}
+    assert [entry["text"] for batch in batches for entry in batch] == [f"clip {i}" for i in range(5)]
+    assert store.count() == 5
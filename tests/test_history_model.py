@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("PyQt6.QtCore")
+
+from history_model import ClipboardHistoryModel  # noqa: E402
+from history_store import make_entry  # noqa: E402
+
+
+def entry(text):
+    return make_entry(text, "Text", "2024-01-01 10:00:00")
+
+
+def texts(model):
+    return [model.entry_at(row)["text"] for row in range(model.rowCount())]
+
+
+def test_rows_follow_updates_newest_first():
+    model = ClipboardHistoryModel()
+    model.set_entries([entry("c"), entry("b"), entry("a")])
+    model.append_entries([entry("b"), entry("z"), entry("y")])  # "b" is listed already
+    assert texts(model) == ["c", "b", "a", "z", "y"]
+
+    model.add_to_top(entry("d"))
+    model.add_to_top(entry("a"))  # Copied again
+    assert texts(model) == ["a", "d", "c", "b", "z", "y"]
+
+    model.remove(entry("c")["digest"])
+    model.replace(entry("z")["digest"], entry("x"))
+    model.replace(entry("b")["digest"], entry("d"))  # Takes the place of a listed clip
+    model.remove("unknown")
+    assert texts(model) == ["a", "d", "x", "y"]
+
+    model.add_to_top(entry("y"))
+    model.remove(entry("a")["digest"])
+    assert texts(model) == ["y", "d", "x"]
+    assert [model._row(entry(text)["digest"]) for text in ("y", "d", "x", "a")] == [0, 1, 2, None]
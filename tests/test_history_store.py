@@ -0,0 +1,43 @@
+import pytest
+
+from history_store import BLOB_THRESHOLD, LABEL_LENGTH, make_entry, make_label
+
+
+def test_writer_survives_a_failing_write(store):
+    store.add_entry(make_entry("good one", "Text", "2024-01-01 10:00:00"), "good one")
+    store.add_entry(make_entry("bad", "Text", 5), "bad")  # Not a timestamp string
+    store.add_entry(make_entry("good two", "Text", "2024-01-01 10:00:02"), "good two")
+    store.flush()
+    assert [entry["text"] for entry in store.load_page()] == ["good two", "good one"]
+    assert store.failed_writes == 1
+
+    store.add_entry(make_entry("later", "Text", "2024-01-01 10:00:03"), "later")
+    store.flush()
+    assert store.load_page()[0]["text"] == "later"
+
+
+def test_search_finds_text_past_the_preview_of_large_clips(store):
+    big = "x" * (BLOB_THRESHOLD + 10) + " needle at the end"
+    store.add_entry(make_entry(big, "Text", "2024-01-01 10:00:00"), big)
+    store.add_entry(make_entry("small needle", "Text", "2024-01-01 10:00:01"), "small needle")
+    store.flush()
+    if not store.has_fts:
+        pytest.skip("SQLite without FTS5")
+
+    assert [entry["size"] for entry in store.search("needle")] == [12, len(big)]
+    assert store.search("NEEDLE AT THE")[0]["in_blob"]
+    assert store.search("needle", prefix=True) == []
+
+    # Removing the clip takes its full text out of the index too
+    store.remove_entry(store.search("needle at")[0])
+    store.flush()
+    assert store.search("needle at") == []
+    assert len(store.search("needle")) == 1
+
+
+def test_labels_are_the_first_non_blank_line():
+    assert make_label("\n  \n  first   line \nsecond") == "first line"
+    assert make_label(" \n\t") == ""
+    long_line = "word " * LABEL_LENGTH
+    assert make_label(long_line) == long_line[:LABEL_LENGTH].rstrip() + "..."
+    assert make_label("x" * (2 * LABEL_LENGTH) + "y") == "x" * LABEL_LENGTH + "..."
@@ -0,0 +1,138 @@
+import shutil
+import time
+
+import pytest
+
+from history_store import HistoryStore, make_entry
+from history_sync import HistorySync
+from sync_server import SyncServer
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    servers = []
+
+    def start(name="server.db"):
+        server = SyncServer(tmp_path / name, ("127.0.0.1", 0))
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def device(tmp_path):
+    """Return a function (name, server) -> (store, sync, applied records) with the sync running."""
+    stores, syncs = {}, []
+
+    def start(name, server):
+        if name not in stores:
+            stores[name] = HistoryStore(tmp_path / name / "history.db")
+        applied = []
+        sync = HistorySync(stores[name], server.address, applied.extend, debounce=0, max_delay=0,
+                           pull_interval=0.05)
+        sync.start()
+        syncs.append(sync)
+        return stores[name], sync, applied
+
+    yield start
+    for sync in syncs:
+        if sync._thread is not None:
+            sync.stop()
+    for store in stores.values():
+        store.close()
+
+
+def add(store, *texts):
+    entries = [make_entry(text, "Text", "2024-01-01 10:00:00") for text in texts]
+    for entry, text in zip(entries, texts):
+        store.add_entry(entry, text)
+    store.flush()
+    return [entry["digest"] for entry in entries]
+
+
+def texts(records):
+    return sorted(record["text"] for record in records)
+
+
+def test_push_pull_and_resume(start_server, device, tmp_path):
+    server = start_server()
+    store_a = HistoryStore(tmp_path / "a" / "history.db")
+    add(store_a, "one", "two")
+    store_a.close()
+
+    _, sync_a, _ = device("a", server)
+    wait_for(lambda: sync_a.pushed == 2 and sync_a.pending == 0)
+    _, sync_b, applied_b = device("b", server)
+    wait_for(lambda: len(applied_b) == 2)
+    assert texts(applied_b) == ["one", "two"]
+    sync_a.stop()
+    sync_b.stop()
+
+    # After a restart only what changed meanwhile is sent and received
+    store_a, sync_a, _ = device("a", server)
+    sync_a.record(add(store_a, "three"))
+    wait_for(lambda: sync_a.pushed == 1 and sync_a.pending == 0)
+    _, sync_b, applied_b = device("b", server)
+    wait_for(lambda: sync_b.pulled == 1)
+    assert texts(applied_b) == ["three"]
+
+
+def test_server_that_started_over_gets_everything_again(start_server, device):
+    server = start_server()
+    store_a, sync_a, _ = device("a", server)
+    sync_a.record(add(store_a, "one", "two"))
+    _, sync_b, applied_b = device("b", server)
+    wait_for(lambda: len(applied_b) == 2)
+    sync_a.stop()
+    sync_b.stop()
+
+    empty = start_server("empty.db")
+    store_a, sync_a, _ = device("a", empty)
+    sync_a.record(add(store_a, "three"))
+    _, sync_b, applied_b = device("b", empty)
+    wait_for(lambda: len(applied_b) == 3)
+    assert texts(applied_b) == ["one", "three", "two"]
+    assert sync_a.pending == 0
+
+
+def test_server_restored_from_a_backup_catches_up(start_server, device, tmp_path):
+    server = start_server()
+    store_a, sync_a, _ = device("a", server)
+    sync_a.record(add(store_a, "one"))
+    wait_for(lambda: sync_a.pushed == 1)
+    _, sync_b, applied_b = device("b", server)
+    wait_for(lambda: len(applied_b) == 1)
+    sync_b.stop()
+    sync_a.stop()
+    server.stop()
+    shutil.copy(tmp_path / "server.db", tmp_path / "backup.db")
+
+    server = start_server()
+    store_a, sync_a, _ = device("a", server)
+    sync_a.record(add(store_a, "two", "three"))
+    _, sync_b, applied_b = device("b", server)
+    wait_for(lambda: len(applied_b) == 2)
+    sync_b.stop()
+    sync_a.stop()
+    server.stop()
+
+    # The backup lacks "two" and "three", which b applied already; a sends
+    # its history again under a new id, which b pulls from the start
+    restored = start_server("backup.db")
+    store_a, sync_a, _ = device("a", restored)
+    sync_a.record(add(store_a, "four"))
+    wait_for(lambda: sync_a.pending == 0 and sync_a.pushed >= 4)
+    _, sync_b, applied_b = device("b", restored)
+    wait_for(lambda: "four" in texts(applied_b))
+    assert {"two", "three", "four"} <= set(texts(applied_b))
@@ -0,0 +1,97 @@
+import threading
+
+from classifier import Classifier
+from clipboard_sources import RichClip
+from history_container import ClipboardHistory
+from ingest import IngestPipeline
+
+
+class FailingVariants:
+    """Variant index whose first lookup fails."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def find(self, entry, signature=None):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("lookup failed")
+        return None
+
+    def add(self, entry, signature=None):
+        pass
+
+    def remove(self, digest):
+        pass
+
+
+def test_pipeline_keeps_going_after_a_failing_clip(store):
+    notified = threading.Event()
+    history = ClipboardHistory()
+    pipeline = IngestPipeline(store, history, Classifier([]), notified.set, variants=FailingVariants())
+    pipeline.start()
+    pipeline.submit("first clip")
+    pipeline.submit("second clip")
+    pipeline.stop()
+
+    assert [entry["text"] for entry in history] == ["second clip"]
+    store.flush()
+    assert [entry["text"] for entry in store.load_page()] == ["second clip"]
+
+
+class FailingDetector:
+    """Sensitive-content detector that fails on clips containing "boom"."""
+
+    def detect(self, text, clip=None):
+        if "boom" in text:
+            raise ValueError("detector failed")
+        return None
+
+
+class FailingStore:
+    """Store whose writes fail."""
+
+    def add_entry(self, *args, **kwargs):
+        raise RuntimeError("queue closed")
+
+
+def test_classify_stage_keeps_going_after_a_failing_clip(store):
+    history = ClipboardHistory()
+    pipeline = IngestPipeline(store, history, Classifier([]), lambda: None, detector=FailingDetector())
+    pipeline.start()
+    pipeline.submit("boom")
+    pipeline.submit("after the failure")
+    pipeline.stop()
+
+    assert [entry["text"] for entry in history] == ["after the failure"]
+
+
+def test_history_is_unchanged_when_the_store_rejects_a_clip():
+    history = ClipboardHistory()
+    pipeline = IngestPipeline(FailingStore(), history, Classifier([]), lambda: None)
+    pipeline.start()
+    pipeline.submit("never stored")
+    pipeline.stop()
+
+    assert len(history) == 0
+    assert pipeline.take_updates() == []
+
+
+def test_images_are_encoded_off_the_capturing_thread(store):
+    encoded_on = []
+
+    def encode():
+        encoded_on.append(threading.current_thread().name)
+        return b"PNGDATA"
+
+    history = ClipboardHistory()
+    pipeline = IngestPipeline(store, history, Classifier([]), lambda: None)
+    pipeline.start()
+    pipeline.submit("Image 1×1", RichClip("image", "image/png", "Image 1×1", "key", encode=encode))
+    pipeline.stop()
+
+    assert encoded_on == ["ingest-classify"]
+    store.flush()
+    entry = store.load_page()[0]
+    assert (entry["category"], entry["mime"]) == ("Images", "image/png")
+    assert store.payload(entry) == b"PNGDATA"
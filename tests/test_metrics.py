@@ -0,0 +1,23 @@
+from metrics import Histogram, Registry, format_snapshot
+
+
+def test_histogram_percentiles_use_bucket_bounds():
+    histogram = Histogram()
+    for milliseconds in [0.3] * 90 + [7] * 9 + [4000]:
+        histogram.record(milliseconds)
+    summary = histogram.summary()
+    assert (summary["count"], summary["p50"], summary["p95"], summary["max"]) == (100, 0.5, 10, 4000)
+    assert histogram.percentile(1.0) == 4000  # Past the last bucket
+    assert Histogram().summary()["p99"] == 0.0
+
+
+def test_snapshot_reads_gauges_and_skips_failing_ones():
+    registry = Registry()
+    registry.gauge("queue.size", lambda: 3)
+    registry.gauge("broken", lambda: 1 / 0)
+    registry.histogram("ipc.query").record(1.5)
+    snapshot = registry.snapshot()
+    assert snapshot["gauges"]["queue.size"] == 3
+    assert "broken" not in snapshot["gauges"]
+    assert snapshot["latency_ms"]["ipc.query"]["count"] == 1
+    assert "ipc.query" in format_snapshot("daemon", snapshot)
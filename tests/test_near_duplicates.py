@@ -0,0 +1,77 @@
+import threading
+
+from history_store import make_entry
+from near_duplicates import (
+    MIN_LENGTH,
+    MIN_SIMILARITY,
+    VariantIndex,
+    normalize,
+    set_variant_key,
+    signature,
+    similarity,
+)
+
+PARAGRAPH = (
+    "The quick brown fox jumps over the lazy dog while the cat watches "
+    "from the window sill in silence, waiting for the rain to stop."
+)
+
+
+def call_with_timeout(function, *args, timeout=5):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function(*args)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"{function.__name__} did not return"
+    return result[0]
+
+
+def test_normalize_unifies_whitespace_and_tracking_parameters():
+    assert normalize("line one  \r\nline two\t\n\n") == "line one\nline two"
+    assert normalize("https://Example.com:443/page?id=1&utm_source=x&fbclid=y") == "https://example.com/page?id=1"
+
+
+def test_short_texts_have_no_signature():
+    assert signature("x" * (MIN_LENGTH - 1)) is None
+
+
+def test_text_collapsing_below_a_shingle_has_no_signature():
+    text = "a" + " " * 80 + "b"
+    assert len(text) >= MIN_LENGTH
+    assert call_with_timeout(signature, normalize(text)) is None
+
+
+def test_mostly_whitespace_clip_gets_a_variant_key_only():
+    entry = make_entry("a" + " " * 80 + "b")
+    assert call_with_timeout(set_variant_key, entry, "a" + " " * 80 + "b") is None
+    assert entry["variant_key"] is not None
+
+
+def test_signatures_estimate_similarity():
+    edited = signature(PARAGRAPH.replace("lazy", "lasy"))
+    assert similarity(signature(PARAGRAPH), signature(PARAGRAPH)) == 1
+    assert similarity(signature(PARAGRAPH), edited) >= MIN_SIMILARITY
+    assert similarity(signature(PARAGRAPH), signature("Completely different words " * 5)) < MIN_SIMILARITY
+
+
+def test_variant_index_finds_recent_variants(store):
+    index = VariantIndex(store)
+    first = make_entry(PARAGRAPH)
+    index.add(first, set_variant_key(first, PARAGRAPH))
+
+    for variant in (PARAGRAPH + "  \n", PARAGRAPH.replace("lazy", "lasy")):
+        entry = make_entry(variant)
+        assert index.find(entry, set_variant_key(entry, variant))["digest"] == first["digest"]
+
+    other = "Nothing alike at all, just another sentence that is long enough to be shingled."
+    entry = make_entry(other)
+    assert index.find(entry, set_variant_key(entry, other)) is None
+
+
+def test_variant_index_forgets_removed_entries(store):
+    index = VariantIndex(store)
+    first = make_entry(PARAGRAPH)
+    index.add(first, set_variant_key(first, PARAGRAPH))
+    index.remove(first["digest"])
+    entry = make_entry(PARAGRAPH + " ")
+    assert index.find(entry, set_variant_key(entry, PARAGRAPH + " ")) is None
@@ -0,0 +1,20 @@
+from clipboard_sources import FakeClipboardSource
+from history_store import BLOB_THRESHOLD, make_entry
+from paste_back import PasteBack
+
+
+def test_only_the_newest_request_is_written(store):
+    big = "b" * (BLOB_THRESHOLD + 1)
+    entry = make_entry(big, "Text", "2024-01-01 10:00:00")
+    store.add_entry(entry, big)
+    store.flush()
+
+    source = FakeClipboardSource()
+    paste_back = PasteBack(source, store)
+    paste_back.copy_text("generated password", secret=True)
+    paste_back.paste(store.load_page()[0])  # Picked right after, replaces the password
+    paste_back.start()
+    paste_back.stop()
+
+    assert source.text == big  # The full text, not the stored preview
+    assert (paste_back.written, paste_back.coalesced) == (1, 1)
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+from snippets import SnippetLibrary, expand
+
+
+@pytest.fixture
+def library(store):
+    library = SnippetLibrary(store)
+    library.load()
+    return library
+
+
+def test_placeholders_are_filled_in():
+    now = datetime(2024, 3, 1, 9, 30)
+    body = "{date} {time} {date:%d.%m.} {clipboard} #{counter} {{literal}} {unknown}"
+    assert expand(body, "clip", 3, now) == "2024-03-01 09:30 01.03. clip #3 {literal} {unknown}"
+
+
+def test_lookup_ranks_keyword_then_name_then_text(library):
+    signature = library.save({"name": "Signature", "keyword": "sig", "body": "Regards,\nAda", "tags": "mail, work"})
+    library.save({"name": "Sign-off", "keyword": "sign", "body": "Cheers", "folder": "Mail"})
+    library.save({"name": "Design notes", "body": "See the signature block"})
+    library.pin("sigh")
+
+    assert [snippet["name"] for snippet in library.lookup("sig")] == ["Signature", "Sign-off", "sigh", "Design notes"]
+    assert [snippet["name"] for snippet in library.lookup("sig", folder="Mail")] == ["Sign-off"]
+    assert [snippet["name"] for snippet in library.lookup("", tag="work")] == ["Signature"]
+    with pytest.raises(ValueError, match="keyword"):
+        library.save({"keyword": "SIG", "body": "other"})
+
+    library.save({**signature, "keyword": "regards"})
+    assert [snippet["name"] for snippet in library.lookup("sig")] == ["Sign-off", "sigh", "Signature", "Design notes"]
+    assert library.delete(signature["key"]) and not library.delete(signature["key"])
+    assert library.expand(library.lookup("sign")[0]["key"]) == "Cheers"
+
+
+def test_snippets_are_stored(store):
+    library = SnippetLibrary(store)
+    library.load()
+    snippet = library.save({"name": "Counter", "keyword": "n", "body": "#{counter}"})
+    assert library.expand(snippet["key"]) == "#1"
+    store.flush()
+
+    reloaded = SnippetLibrary(store)
+    reloaded.load()
+    assert reloaded.expand(snippet["key"]) == "#2"
+    assert reloaded.lookup("n")[0]["name"] == "Counter"